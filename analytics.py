@@ -0,0 +1,263 @@
+import json
+import os
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from catalog import load_catalog
+from price_store import daily_grid, load_price_series, widen_prices
+
+# Precomputed price analytics: daily spreads, rolling volatility, negative-price hours and price duration
+# curves per country and year.
+# Each country's prices are reduced once to a few small arrays (per day and per year) saved under
+# .cache/analytics, next to the catalog version of the files they came from. Only countries whose price
+# files changed are recomputed, so the layer stays in step with the price store; every query afterwards
+# assembles its answer from the in-memory arrays of all countries.
+
+analytics_dir = os.path.join(".cache", "analytics")
+
+# Trailing window of the rolling volatility, and the share of its hours that must have prices
+volatility_window_days = 30
+volatility_min_coverage = 0.5
+
+# Points of every duration curve: the price exceeded in 0%, 1%, ..., 100% of the year's hours
+duration_points = 101
+
+# Stored files of an older layout are recomputed
+_format_version = 2
+
+
+class CountryAnalytics:
+    """One country's precomputed analytics: per-day arrays on `days`, per-year arrays on `years`."""
+
+    daily_fields = ("day_sum", "day_sum_sq", "day_hours", "day_min", "day_max", "negative_hours", "volatility")
+    yearly_fields = ("duration", "negative_by_hour", "longest_negative_run")
+
+    def __init__(self, country: str, days: np.ndarray, years: np.ndarray, **arrays):
+        self.country = country
+        self.days = days
+        self.years = years
+        for name in self.daily_fields + self.yearly_fields:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def compute(cls, country: str):
+        """Reduces the country's price series, or returns None if it has no prices."""
+        series = load_price_series(country)
+        if series is None or len(series.timestamps) == 0:
+            return None
+        return cls.from_prices(country, series.timestamps, widen_prices(series.price, series.decimals))
+
+    @classmethod
+    def from_prices(cls, country: str, timestamps: np.ndarray, values: np.ndarray):
+        """Reduces sorted hourly (or sub-hourly) prices in €/MWh."""
+        prices, days = daily_grid(timestamps, values)
+        valid = ~np.isnan(prices)
+        values = np.where(valid, prices, 0.0)
+        day_hours = valid.sum(axis=1)
+        day_sum = values.sum(axis=1)
+        day_sum_sq = (values ** 2).sum(axis=1)
+        with warnings.catch_warnings():
+            # Days without any price give NaN extremes
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            day_min = np.nanmin(prices, axis=1)
+            day_max = np.nanmax(prices, axis=1)
+        negative = prices < 0  # NaN compares False
+
+        # Standard deviation of the hourly prices over the trailing window, from cumulative sums
+        def trailing(daily):
+            totals = np.r_[0.0, np.cumsum(daily, dtype=np.float64)]
+            first = np.maximum(np.arange(1, len(daily) + 1) - volatility_window_days, 0)
+            return totals[1:] - totals[first]
+
+        window_hours = trailing(day_hours)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            window_mean = trailing(day_sum) / window_hours
+            variance = np.maximum(trailing(day_sum_sq) / window_hours - window_mean ** 2, 0.0)
+        enough = window_hours >= volatility_window_days * 24 * volatility_min_coverage
+        volatility = np.where(enough, np.sqrt(variance), np.nan)
+
+        day_years = days.astype("datetime64[Y]").astype(np.int64) + 1970
+        years = np.unique(day_years)
+        duration = np.full((len(years), duration_points), np.nan)
+        negative_by_hour = np.zeros((len(years), 24), dtype=np.int32)
+        for i, year in enumerate(years):
+            rows = day_years == year
+            year_prices = prices[rows][valid[rows]]
+            if len(year_prices):
+                # Descending: the first point is the year's maximum, the last its minimum
+                duration[i] = np.percentile(year_prices, np.linspace(100, 0, duration_points))
+            negative_by_hour[i] = negative[rows].sum(axis=0)
+
+        # Longest run of consecutive negative hours, credited to the year it starts in
+        flat = np.r_[False, negative.ravel(), False]
+        edges = np.flatnonzero(np.diff(flat.astype(np.int8)))
+        starts, ends = edges[::2], edges[1::2]
+        longest_negative_run = np.zeros(len(years), dtype=np.int32)
+        np.maximum.at(longest_negative_run, np.searchsorted(years, day_years[starts // 24]), ends - starts)
+
+        return cls(country, days, years, day_sum=day_sum, day_sum_sq=day_sum_sq, day_hours=day_hours.astype(np.int16),
+                   day_min=day_min, day_max=day_max, negative_hours=negative.sum(axis=1).astype(np.int16),
+                   volatility=volatility, duration=duration, negative_by_hour=negative_by_hour,
+                   longest_negative_run=longest_negative_run)
+
+    def save(self, path: str):
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        arrays = {name: getattr(self, name) for name in self.daily_fields + self.yearly_fields}
+        np.savez(tmp, days=self.days.astype(np.int64), years=self.years, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, country: str, path: str):
+        with np.load(path) as stored:
+            arrays = {name: stored[name] for name in stored.files}
+        return cls(country, arrays.pop("days").astype("datetime64[D]"), arrays.pop("years"), **arrays)
+
+    def year_rows(self, year) -> np.ndarray:
+        return (self.days.astype("datetime64[Y]").astype(np.int64) + 1970) == int(year)
+
+    def year_index(self, year):
+        matches = np.flatnonzero(self.years == int(year))
+        return int(matches[0]) if len(matches) else None
+
+
+class PriceAnalytics:
+    """Queries over the precomputed analytics of all countries; years are the catalog's covered years."""
+
+    def __init__(self, countries: dict, errors: dict = None):
+        self.countries = countries  # country -> CountryAnalytics
+        self.errors = errors or {}  # country -> why its analytics could not be computed
+        catalog = load_catalog()
+        self._years = {country: catalog.years(country) for country in countries}
+
+    def years(self) -> list:
+        return sorted({year for years in self._years.values() for year in years})
+
+    def _covered(self, year) -> list:
+        return [analytics for country, analytics in self.countries.items() if str(year) in self._years[country]]
+
+    def summary(self, year) -> pd.DataFrame:
+        """Price level, volatility, daily spreads and negative prices of every country covering `year`."""
+        rows = []
+        for analytics in self._covered(year):
+            days = analytics.year_rows(year)
+            hours = analytics.day_hours[days].sum()
+            mean = analytics.day_sum[days].sum() / hours
+            spreads = (analytics.day_max - analytics.day_min)[days]
+            index = analytics.year_index(year)
+            rows.append({
+                "Country": analytics.country,
+                "Mean Price (€/MWh)": mean,
+                "Volatility (€/MWh)": np.sqrt(max(analytics.day_sum_sq[days].sum() / hours - mean ** 2, 0.0)),
+                "Mean Daily Spread (€/MWh)": np.nanmean(spreads),
+                "P90 Daily Spread (€/MWh)": np.nanpercentile(spreads, 90),
+                "Min Price (€/MWh)": np.nanmin(analytics.day_min[days]),
+                "Negative Price Hours": int(analytics.negative_hours[days].sum()),
+                "Negative Share (%)": analytics.negative_hours[days].sum() / hours * 100,
+                "Longest Negative Run (h)": int(analytics.longest_negative_run[index]),
+            })
+        columns = ["Country", "Mean Price (€/MWh)", "Volatility (€/MWh)", "Mean Daily Spread (€/MWh)",
+                   "P90 Daily Spread (€/MWh)", "Min Price (€/MWh)", "Negative Price Hours", "Negative Share (%)",
+                   "Longest Negative Run (h)"]
+        return pd.DataFrame(rows, columns=columns).set_index("Country")
+
+    def daily(self, country: str, year=None) -> pd.DataFrame:
+        """Daily mean, spread, negative hours and rolling volatility of one country, for one year or all."""
+        analytics = self.countries[country]
+        days = analytics.year_rows(year) if year is not None else slice(None)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = analytics.day_sum[days] / analytics.day_hours[days]
+        return pd.DataFrame({
+            "Date": analytics.days[days],
+            "Mean Price (€/MWh)": mean,
+            "Daily Spread (€/MWh)": (analytics.day_max - analytics.day_min)[days],
+            "Negative Price Hours": analytics.negative_hours[days],
+            f"{volatility_window_days}-Day Volatility (€/MWh)": analytics.volatility[days],
+        })
+
+    def duration_curves(self, countries: list, year) -> pd.DataFrame:
+        """Price duration curves of `countries` in `year`, long format for plotting."""
+        frames = []
+        for country in countries:
+            analytics = self.countries.get(country)
+            index = analytics.year_index(year) if analytics is not None else None
+            if index is None or str(year) not in self._years[country]:
+                continue
+            frames.append(pd.DataFrame({
+                "Share of Hours (%)": np.linspace(0, 100, duration_points),
+                "Price (€/MWh)": analytics.duration[index],
+                "Country": country,
+            }))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Share of Hours (%)", "Price (€/MWh)", "Country"])
+
+    def negative_hours_by_hour(self, country: str) -> pd.DataFrame:
+        """Negative-price hours of one country per covered year (rows) and hour of day (columns)."""
+        analytics = self.countries[country]
+        covered = np.isin(analytics.years.astype(str), self._years[country])
+        return pd.DataFrame(analytics.negative_by_hour[covered], index=pd.Index(analytics.years[covered].astype(str), name="Year"),
+                            columns=pd.Index(np.arange(24), name="Hour"))
+
+
+def _country_path(country: str, directory: str) -> str:
+    return os.path.join(directory, f"{country.lower()}.npz")
+
+
+_countries = {}  # country -> (version, CountryAnalytics)
+_analytics = None
+_lock = threading.Lock()
+
+
+def load_price_analytics(directory: str = analytics_dir) -> PriceAnalytics:
+    """
+    Returns the analytics of every catalog country. Countries whose price files changed since their stored
+    analytics were computed are recomputed (and stored); all others are read from .cache/analytics. A
+    country that fails is left out and reported in `errors` until its files change.
+    """
+    global _analytics
+    catalog = load_catalog()
+    versions = {country: catalog.version(country) for country in catalog.countries()}
+    if _analytics is not None and _analytics[0] == versions:
+        return _analytics[1]
+
+    with _lock:
+        if _analytics is not None and _analytics[0] == versions:
+            return _analytics[1]
+        meta_path = os.path.join(directory, "meta.json")
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        stored = meta.get("versions", {}) if meta.get("format") == _format_version else {}
+
+        os.makedirs(directory, exist_ok=True)
+        countries, errors = {}, {}
+        for country, version in versions.items():
+            cached = _countries.get(country)
+            path = _country_path(country, directory)
+            try:
+                if cached is not None and cached[0] == version:
+                    analytics = cached[1]
+                elif stored.get(country) == version and os.path.exists(path):
+                    analytics = CountryAnalytics.load(country, path)
+                else:
+                    analytics = CountryAnalytics.compute(country)
+                    if analytics is None:
+                        continue
+                    analytics.save(path)
+            except Exception as e:
+                errors[country] = str(e)
+                continue
+            _countries[country] = (version, analytics)
+            countries[country] = analytics
+
+        # Written after the country files, so a version is only recorded once its file is in place
+        meta_tmp = os.path.join(directory, f"meta.{os.getpid()}.tmp")
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump({"format": _format_version, "versions": {country: versions[country] for country in countries}}, f)
+        os.replace(meta_tmp, meta_path)
+
+        analytics = PriceAnalytics(countries, errors)
+        _analytics = (versions, analytics)
+        return analytics
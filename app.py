@@ -2,7 +2,27 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
 import os
+import uuid
+
+from analytics import load_price_analytics, volatility_window_days
+from backtest import backtest_country
+from catalog import country_codes, load_catalog, min_year_coverage
+from degradation import battery_capex_eur_mwh, degradation_economics, discount_rate, horizon_years
+from demand_profiles import demand_profile_names, library_files, register_upload
+from engine import (
+    battery_arbitrage_savings, build_scenario, co2_file_path, default_battery_capacity_mwh, hybrid_dispatch,
+    load_carbon_data, peak_shaving_dispatch
+)
+from portfolio import PpaContract, Site, portfolio_dispatch
+from price_matrix import load_price_matrix
+from prewarm import start_prewarm, usage_stats
+from price_store import loaded_nbytes, price_file_for
+from pv import PvSite, clear_sky_production, country_sites, pv_battery_dispatch, pv_data_dir, pvgis_files, pvgis_production
+from scenario import DispatchResult, Scenario
+from jobs import JobRunner
+from result_cache import calculate_metrics_cached
 
 st.set_page_config(page_title="Energy Optimization Dashboard - Nitrocapt", layout="wide")
 
@@ -15,10 +35,10 @@ if 'battery_adjusted_cost' not in st.session_state:
     st.session_state.battery_adjusted_cost = None
 if 'total_demand_mwh' not in st.session_state:
     st.session_state.total_demand_mwh = None
-if 'demand_df' not in st.session_state:
-    st.session_state.demand_df = None
-if 'price_df' not in st.session_state:
-    st.session_state.price_df = None
+if 'scenario' not in st.session_state:
+    st.session_state.scenario = None
+if 'session_memory_bytes' not in st.session_state:
+    st.session_state.session_memory_bytes = 0
 if 'total_co2_emissions_tonnes' not in st.session_state:
     st.session_state.total_co2_emissions_tonnes = None
 if 'selected_optimization_country' not in st.session_state:
@@ -33,6 +53,8 @@ if 'dod' not in st.session_state:
     st.session_state.dod = 0
 if 'storage_hours' not in st.session_state:
     st.session_state.storage_hours = 0
+if 'no_export' not in st.session_state:
+    st.session_state.no_export = False
 if 'ppa_price_eur_mwh' not in st.session_state:
     st.session_state.ppa_price_eur_mwh = 40.0
 if 'hedge_volume' not in st.session_state:
@@ -41,220 +63,377 @@ if 'year_option' not in st.session_state:
     st.session_state.year_option = 'Choose year'
 if 'demand_option' not in st.session_state:
     st.session_state.demand_option = 'Choose demand'
+if 'annual_demand_mwh' not in st.session_state:
+    st.session_state.annual_demand_mwh = None
+if 'demand_uploads' not in st.session_state:
+    # This session's uploaded demand profiles; other sessions never see them
+    st.session_state.demand_uploads = {}
 
 
-# Define all available countries (make it globally accessible)
-all_countries = ["Austria", "Belgium", "Bulgaria", "Croatia", "Czechia", "Denmark", "Estonia", "Finland", "France", "Germany", "Greece", "Hungary", "Italy", "Latvia", "Lithuania", "Luxembourg", "Netherlands", "Norway", "Poland", "Portugal", "Romania", "Slovakia", "Slovenia", "Spain", "Sweden", "Switzerland"]
+# Countries and years come from the data catalog: only combinations with price data are offered
+data_catalog = load_catalog()
+all_countries = data_catalog.countries()
+# Changes whenever a price file changes; part of the keys of background jobs over all countries
+price_versions = tuple(data_catalog.version(country) for country in all_countries)
 
 # Load CO2 Emission Data once globally
-co2_data_dir = os.path.join("data", "co2")
-co2_file_path = os.path.join(co2_data_dir, "carbon.csv")
-df_carbon = None
-if os.path.exists(co2_file_path):
-    df_carbon = pd.read_csv(co2_file_path)
-else:
+df_carbon = load_carbon_data()
+if df_carbon is None:
     st.warning(f"CO2 emission data file not found at {co2_file_path}. CO2 calculations may be inaccurate or unavailable.")
 
 
-@st.cache_data # Cache the function results for performance
-def calculate_metrics_for_country(
-    selected_country: str,
-    selected_year: str,
-    demand_option: str,
-    use_battery: bool,
-    battery_capacity: float,
-    efficiency: int,
-    dod: int,
-    storage_hours: int,
-    ppa_price_eur_mwh: float,
-    hedge_volume: float,
-    df_carbon_data: pd.DataFrame # Renamed to avoid conflict with global df_carbon
-):
+@st.cache_resource
+def get_job_runner():
+    """One background executor shared by all sessions, so identical scenarios are computed once."""
+    return JobRunner()
+
+
+def prewarm_comparison_scenario(country: str, year: str, demand_option: str):
+    # The comparison tab's parameters for a new session (battery off), so its first comparison is a cache hit
+    calculate_metrics_cached(
+        df_carbon_data=df_carbon, selected_country=country, selected_year=year, demand_option=demand_option,
+        annual_demand_mwh=None, use_battery=False, battery_capacity=0.0, efficiency=0, dod=0, storage_hours=0,
+        ppa_price_eur_mwh=40.0, hedge_volume=6.0, no_export=False,
+    )
+
+
+@st.cache_resource
+def start_prewarm_once():
+    """Warms prices and the default and most-used scenarios in the background, without delaying this render."""
+    return start_prewarm(prewarm_comparison_scenario)
+
+
+start_prewarm_once()
+
+
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'slot_jobs' not in st.session_state:
+    st.session_state.slot_jobs = {}
+if 'stale_results' not in st.session_state:
+    st.session_state.stale_results = {}
+if 'recorded_usage' not in st.session_state:
+    st.session_state.recorded_usage = set()
+
+# Keeps this session's background jobs alive; sessions that stop showing up are released after a while
+get_job_runner().touch(st.session_state.session_id)
+
+
+def record_usage(country: str, year: str, demand_option: str):
+    """Counts a scenario for the startup warm-up, once per session rather than on every rerun."""
+    if (country, year, demand_option) not in st.session_state.recorded_usage:
+        st.session_state.recorded_usage.add((country, year, demand_option))
+        usage_stats.record(country, year, demand_option)
+
+
+def submit_background(slot: str, scenarios: list):
     """
-    Calculates spot cost, battery cost, hybrid cost, LCOE, and CO2 emissions for a given country.
+    Submits (key, fn, kwargs) scenarios for this session's `slot` (e.g. "comparison").
+    Jobs the slot was showing before are released, which cancels them if no other session needs them.
     """
-    results = {
-        "Country": selected_country,
-        "Year": selected_year,
-        "Demand Profile": demand_option,
-        "Total Spot Cost (€)": None,
-        "Total Cost with Battery (€)": None,
-        "Total Hybrid Cost (€)": None,
-        "LCOE (Spot) (€/MWh)": None,
-        "LCOE (Battery) (€/MWh)": None,
-        "LCOE (Hybrid) (€/MWh)": None,
-        "Total CO2 Emissions (tonnes CO2eq)": None
-    }
-
-    try:
-        # Load price data for the selected country and year
-        data_dir = "data"
-        europe_prices_dir = os.path.join(data_dir, "europe_prices")
-        multi_year_file = os.path.join(europe_prices_dir, f"{selected_country.lower()}_15_24.csv")
-        
-        if not os.path.exists(multi_year_file):
-            st.error(f"Price data for {selected_country} in {selected_year} not found at {multi_year_file}. Skipping calculations for this country.")
-            return results
-
-        price_df = pd.read_csv(multi_year_file)
-        price_df["timestamp"] = pd.to_datetime(price_df["timestamp"])
-        price_df = price_df[price_df["timestamp"].dt.year == int(selected_year)]
-
-        if price_df.empty:
-            st.error(f"No price data for {selected_country} in {selected_year} after filtering. Skipping calculations.")
-            return results
-
-        demand_value = 0
-        if demand_option == "600 kWh":
-            demand_value = 600
-        elif demand_option == "5 MWh":
-            demand_value = 5000
-        elif demand_option == "10 MWh":
-            demand_value = 10000
-        elif demand_option == "15 MWh":
-            demand_value = 15000
-        
-        demand_df = pd.DataFrame({
-            "timestamp": price_df["timestamp"],
-            "demand_kWh": [demand_value] * len(price_df)
-        })
-        merged_df = pd.merge(price_df, demand_df, on="timestamp")
-
-        if "Grid_Price_EUR_per_MWh" in merged_df.columns:
-            merged_df["price"] = merged_df["Grid_Price_EUR_per_MWh"]
-        elif "price" not in merged_df.columns:
-            raise KeyError("Required price column not found in merged data.")
-
-        merged_df["hourly_cost"] = (merged_df["price"] / 1000) * merged_df["demand_kWh"]
-        
-        total_cost_base = merged_df["hourly_cost"].sum()
-        total_demand_mwh = merged_df["demand_kWh"].sum() / 1000
+    runner = get_job_runner()
+    session_id = st.session_state.session_id
+    new_keys = [key for key, _, _ in scenarios]
+    for old_key in st.session_state.slot_jobs.get(slot, []):
+        if old_key not in new_keys:
+            runner.release(old_key, session_id)
+    st.session_state.slot_jobs[slot] = new_keys
+    return [runner.submit(key, session_id, fn, **kwargs) for key, fn, kwargs in scenarios]
 
-        results["Total Spot Cost (€)"] = total_cost_base
 
-        # CO2 Emission Factor Lookup
-        emission_factor_g_per_kWh = 0.0
-        if df_carbon_data is not None:
-            filtered_emission = df_carbon_data[
-                (df_carbon_data['Entity'] == selected_country) & 
-                (df_carbon_data['Year'] == int(selected_year))
-            ]
-            if not filtered_emission.empty:
-                emission_factor_g_per_kWh = filtered_emission['gCO2/kWh'].iloc[0]
-            # else:
-            #     st.warning(f"CO2 emission factor not found for {selected_country} in {selected_year} in carbon.csv.")
-        
-        if total_demand_mwh > 0:
-            total_co2_emissions_tonnes = (total_demand_mwh * 1000 * emission_factor_g_per_kWh) / 1_000_000
-        else:
-            total_co2_emissions_tonnes = 0
-        results["Total CO2 Emissions (tonnes CO2eq)"] = total_co2_emissions_tonnes
+def show_background_results(slot: str, jobs: list, label: str, render):
+    """
+    Renders the results of `jobs` with `render(results)` once they are all finished.
+    Until then a progress bar is shown together with the slot's previous results, labelled as stale,
+    and the section polls itself every second.
+    """
+    running = not all(job.done() for job in jobs)
+
+    @st.fragment(run_every=1.0 if running else None)
+    def _poll():
+        get_job_runner().touch(st.session_state.session_id)
+        if all(job.done() for job in jobs):
+            errors = [job.error() for job in jobs if job.error() is not None]
+            if errors:
+                st.error(f"Calculation failed for {label}: {errors[0]}")
+                return
+            results = [job.result() for job in jobs]
+            st.session_state.stale_results[slot] = (label, results)
+            if running:
+                # Rerun the whole page so values shared with other tabs are refreshed and polling stops
+                st.rerun()
+            render(results)
+            return
+
+        progress = sum(job.progress for job in jobs) / len(jobs)
+        st.progress(progress, text=f"Calculating {label}... {progress:.0%}")
+        stale = st.session_state.stale_results.get(slot)
+        if stale is not None:
+            stale_label, stale_results = stale
+            st.caption(f"⏳ Showing previous results for {stale_label} until the new calculation finishes.")
+            render(stale_results)
+
+    _poll()
+
+
+def run_hybrid_dispatch(scenario: Scenario, progress=None, cancel_event=None, **params):
+    """Background job: the hybrid dispatch of `scenario`, returned together with the scenario it belongs to."""
+    return scenario, hybrid_dispatch(scenario, progress=progress, cancel_event=cancel_event, **params)
+
+
+def render_hybrid_results(scenario: Scenario, dispatch: DispatchResult, use_battery: bool):
+    """
+    Renders the hybrid strategy cost, the hourly dispatch table and the battery profile of a finished dispatch run.
+    """
+    total_hybrid_cost = dispatch.total_hybrid_cost
+    merged_df_ppa = dispatch.to_frame(scenario)
+
+    st.markdown(f"""
+        <div style="background-color: #e6f0fa; padding: 20px; border-radius: 10px; border: 1px solid #a3c4dc; text-align: center; margin-top: 30px;">
+            <h4>Hybrid Strategy Optimized Cost</h4>
+            <p style='font-size: 0.9em; color: #666;'>(Spot + Battery + CfD)</p>
+            <h2 style='color: #1f78b4;'>€ {total_hybrid_cost:,.2f}</h2>
+        </div>
+    """, unsafe_allow_html=True)
+
+    hybrid_table = merged_df_ppa[[
+        "timestamp", "battery_used_mwh", "hedge_used_mwh", "spot_used_mwh", "hybrid_cost"
+    ]].copy()
+    hybrid_table.rename(columns={"hybrid_cost": "Hourly Cost (€)"}, inplace=True)
+
+    st.markdown("<h4 style='margin-top: 30px;'>Hybrid Dispatch Allocation (Hourly)</h4>", unsafe_allow_html=True)
+    st.dataframe(hybrid_table, use_container_width=True, hide_index=True)
+
+    st.markdown("<h4 style='margin-top: 30px;'>Battery Charge/Discharge Profile</h4>", unsafe_allow_html=True)
+    if use_battery and not merged_df_ppa.empty: 
+        selected_day = st.date_input("Select a day to view battery activity", value=merged_df_ppa['date'].iloc[0], min_value=merged_df_ppa['date'].min(), max_value=merged_df_ppa['date'].max(), key="battery_date_ppa")
+        selected_data = merged_df_ppa[merged_df_ppa['date'] == selected_day].copy()
+
+        selected_data['discharge'] = selected_data['battery_used_mwh']
+        selected_data['charge'] = selected_data['charge_discharge'].apply(lambda x: x if x > 0 else 0)
+        selected_data['state_of_charge'] = selected_data['charge_discharge'].cumsum()
+
+        fig_battery = go.Figure()
+        fig_battery.add_trace(go.Bar(
+            x=selected_data['timestamp'].tolist(), 
+            y=selected_data['charge'].tolist(),    
+            name='Battery Charge (MWh)',
+            marker_color='lightskyblue'
+        ))
+        fig_battery.add_trace(go.Bar(
+            x=selected_data['timestamp'].tolist(), 
+            y=selected_data['discharge'].tolist(), 
+            name='Battery Discharge (MWh)',
+            marker_color='indianred'
+        ))
+        fig_battery.add_trace(go.Scatter(
+            x=selected_data['timestamp'].tolist(), 
+            y=selected_data['state_of_charge'].tolist(), 
+            mode='lines+markers',
+            name='State of Charge (MWh)',
+            line=dict(color='green')
+        ))
+
+        fig_battery.update_layout(
+            title=f"Battery Activity on {selected_day}",
+            xaxis_title="Hour",
+            yaxis_title="Energy (MWh)",
+            barmode='relative',
+            height=400
+        )
+        st.plotly_chart(fig_battery, use_container_width=True)
+    elif use_battery and merged_df_ppa.empty: 
+         st.warning("Battery data is enabled, but no energy data loaded. Please configure inputs in 'Optimization' tab.")
+    else: 
+        st.info("Battery activity plot requires 'Include Battery Storage' to be enabled in the 'Optimization' tab.")
+
+
+def run_market_overview_job(year, storage_hours, efficiency, progress=None, cancel_event=None):
+    """Background job: statistics, arbitrage value and price correlations of all countries in one year."""
+    price_matrix = load_price_matrix()
+    overview_df = price_matrix.stats(year)
+    overview_df["Mean Daily Spread (€/MWh)"] = price_matrix.mean_daily_spread(year)
+    overview_df[f"Arbitrage Value, {storage_hours}h (€/MW)"] = price_matrix.arbitrage_value(
+        year, storage_hours=storage_hours, efficiency=efficiency
+    )
+    return overview_df.dropna(subset=["Mean Price (€/MWh)"]), price_matrix.correlation(year)
 
-        battery_adjusted_cost = total_cost_base
-        total_hybrid_cost = total_cost_base # Default to spot cost
-        
-        if use_battery:
-            merged_df["date"] = merged_df["timestamp"].dt.date
-            savings = []
-            daily_groups = merged_df.groupby("date")
-            for _, group in daily_groups:
-                sorted_group = group.sort_values(by="price")
-                charge_hours = sorted_group.head(storage_hours)
-                discharge_hours = sorted_group.tail(storage_hours)
-                
-                # Ensure battery_capacity and storage_hours are not zero to avoid division by zero
-                hourly_battery_power = battery_capacity / storage_hours if storage_hours > 0 else 0
-                
-                charge_cost = (charge_hours["price"] / 1000 * (hourly_battery_power * 1000)).sum()
-                discharge_value = (discharge_hours["price"] / 1000 * (hourly_battery_power * 1000) * (efficiency / 100) * (dod / 100)).sum()
-                net_saving = discharge_value - charge_cost
-                savings.append(net_saving)
-            
-            battery_adjusted_cost = total_cost_base - sum(savings)
-            results["Total Cost with Battery (€)"] = battery_adjusted_cost
-
-            # Recalculate hybrid cost with battery optimization
-            merged_df_hybrid = merged_df.copy()
-            merged_df_hybrid['battery_used_mwh'] = 0.0
-            merged_df_hybrid['hedge_used_mwh'] = 0.0
-            merged_df_hybrid['spot_used_mwh'] = 0.0
-            merged_df_hybrid['hedge_settlement'] = 0.0
-            merged_df_hybrid['spot_cost'] = 0.0
-            merged_df_hybrid['hybrid_cost_hourly'] = 0.0
-
-            for date, group in merged_df_hybrid.groupby('date'):
-                group = group.copy()
-                discharge_hours_indices = group.sort_values("price", ascending=False).head(storage_hours).index
-                charge_hours_indices = group.sort_values("price", ascending=True).head(storage_hours).index
-
-                for idx in group.index:
-                    demand_mwh = merged_df_hybrid.at[idx, 'demand_kWh'] / 1000
-                    spot_price = merged_df_hybrid.at[idx, 'price']
-
-                    battery_available = 0.0
-                    charge_discharge = 0.0
-
-                    if storage_hours > 0: # Avoid division by zero
-                        usable_capacity = battery_capacity * (efficiency / 100) * (dod / 100)
-                        battery_power_limit = battery_capacity / float(storage_hours) # Hourly max power
-
-                        if idx in discharge_hours_indices:
-                            battery_available = min(battery_power_limit, usable_capacity / float(storage_hours))
-                            charge_discharge = -battery_available
-                        elif idx in charge_hours_indices:
-                            charge_discharge = battery_power_limit
-                    
-                    remaining_demand_after_battery = demand_mwh - battery_available
-                    
-                    hedge_used_hourly = min(remaining_demand_after_battery, hedge_volume / 24)
-                    spot_used_hourly = max(0.0, remaining_demand_after_battery - hedge_used_hourly)
-
-                    merged_df_hybrid.at[idx, 'battery_used_mwh'] = battery_available
-                    merged_df_hybrid.at[idx, 'hedge_used_mwh'] = hedge_used_hourly
-                    merged_df_hybrid.at[idx, 'spot_used_mwh'] = spot_used_hourly
-
-                    merged_df_hybrid.at[idx, 'hedge_settlement'] = (ppa_price_eur_mwh - spot_price) * hedge_used_hourly
-                    merged_df_hybrid.at[idx, 'spot_cost'] = spot_price * spot_used_hourly
-                    
-                    merged_df_hybrid.at[idx, 'hybrid_cost_hourly'] = (
-                        merged_df_hybrid.at[idx, 'spot_cost']
-                        + (ppa_price_eur_mwh * hedge_used_hourly)
-                    )
-            total_hybrid_cost = merged_df_hybrid['hybrid_cost_hourly'].sum()
-            results["Total Hybrid Cost (€)"] = total_hybrid_cost
-        else: # If no battery, hybrid cost is just spot minus hedge benefits (simple PPA)
-            total_hybrid_cost_no_battery = 0
-            for idx in merged_df.index:
-                demand_mwh = merged_df.at[idx, 'demand_kWh'] / 1000
-                spot_price = merged_df.at[idx, 'price']
-                
-                hedge_used_hourly = min(demand_mwh, hedge_volume / 24)
-                spot_used_hourly = max(0.0, demand_mwh - hedge_used_hourly)
-                
-                total_hybrid_cost_no_battery += (spot_price * spot_used_hourly) + (ppa_price_eur_mwh * hedge_used_hourly)
-            
-            total_hybrid_cost = total_hybrid_cost_no_battery
-            results["Total Hybrid Cost (€)"] = total_hybrid_cost
 
-        # LCOE calculations
-        if total_demand_mwh > 0:
-            results["LCOE (Spot) (€/MWh)"] = total_cost_base / total_demand_mwh
-            if use_battery and results["Total Cost with Battery (€)"] is not None:
-                results["LCOE (Battery) (€/MWh)"] = results["Total Cost with Battery (€)"] / total_demand_mwh
-            if results["Total Hybrid Cost (€)"] is not None:
-                results["LCOE (Hybrid) (€/MWh)"] = results["Total Hybrid Cost (€)"] / total_demand_mwh
+def render_market_overview(overview_df: pd.DataFrame, correlation_df: pd.DataFrame):
+    st.dataframe(overview_df.style.format("{:,.2f}"))
+    fig_corr = px.imshow(correlation_df, zmin=-1, zmax=1, color_continuous_scale="RdBu",
+                         title="Correlation of Hourly Prices")
+    st.plotly_chart(fig_corr, use_container_width=True)
+
+
+def run_price_analytics_job(progress=None, cancel_event=None):
+    """Background job: the precomputed price analytics, (re)built for countries whose prices changed."""
+    return load_price_analytics()
+
+
+def render_market_analytics(price_analytics, analytics_year: str):
+    """
+    Renders the cross-country ranking, duration curves and one country's spread, volatility and
+    negative-price history from the precomputed analytics.
+    """
+    for country, error in price_analytics.errors.items():
+        st.caption(f"⚠️ No analytics for {country}: {error}")
+
+    summary_df = price_analytics.summary(analytics_year)
+    if summary_df.empty:
+        st.info(f"No country has price data for {analytics_year}.")
+    else:
+        summary_df = summary_df.sort_values("Negative Price Hours", ascending=False)
+        st.subheader(f"All Countries, {analytics_year}")
+        st.dataframe(summary_df.style.format("{:,.2f}"), use_container_width=True)
+
+        fig_spread = px.scatter(summary_df.reset_index(), x="Mean Daily Spread (€/MWh)", y="Negative Price Hours",
+                                size="Volatility (€/MWh)", text="Country", hover_data=["Mean Price (€/MWh)", "Longest Negative Run (h)"],
+                                title="Where Storage Pays: Daily Spread vs. Negative-Price Hours")
+        fig_spread.update_traces(textposition="top center")
+        st.plotly_chart(fig_spread, use_container_width=True)
+
+        default_analytics_countries = [country for country in [st.session_state.selected_optimization_country] if country in summary_df.index]
+        default_analytics_countries += [country for country in summary_df.index[:3] if country not in default_analytics_countries]
+        analytics_countries = st.multiselect("Countries", list(summary_df.index), default=default_analytics_countries, key="analytics_countries")
+
+        if analytics_countries:
+            duration_df = price_analytics.duration_curves(analytics_countries, analytics_year)
+            fig_duration = px.line(duration_df, x="Share of Hours (%)", y="Price (€/MWh)", color="Country",
+                                   title=f"Price Duration Curves, {analytics_year}")
+            fig_duration.add_hline(y=0, line_dash="dot", line_color="gray")
+            st.plotly_chart(fig_duration, use_container_width=True)
+
+            analytics_country = st.selectbox("Country History", analytics_countries, key="analytics_country")
+            daily_df = price_analytics.daily(analytics_country)
+            volatility_column = f"{volatility_window_days}-Day Volatility (€/MWh)"
+            fig_daily = px.line(daily_df, x="Date", y=["Daily Spread (€/MWh)", volatility_column], render_mode="webgl",
+                                labels={"value": "€/MWh", "variable": ""}, title=f"{analytics_country}: Daily Spread and Rolling Volatility")
+            st.plotly_chart(fig_daily, use_container_width=True)
+
+            fig_negative = px.imshow(price_analytics.negative_hours_by_hour(analytics_country), aspect="auto",
+                                     color_continuous_scale="Blues", labels={"color": "Negative Hours"},
+                                     title=f"{analytics_country}: Negative-Price Hours by Hour of Day")
+            st.plotly_chart(fig_negative, use_container_width=True)
+
+
+def run_backtest_job(progress=None, cancel_event=None, **params):
+    """Background job: the forecast backtest of one country over its whole price history."""
+    return backtest_country(progress=progress, cancel_event=cancel_event, **params)
+
+
+def render_backtest_results(backtest_df: pd.DataFrame, year: str):
+    """
+    Renders the captured share of the perfect-foresight arbitrage value per forecast, for `year` and over all years.
+    """
+    if backtest_df.empty:
+        st.info("Not enough price history for a forecast backtest.")
+        return
+    year_df = backtest_df[backtest_df["Year"] == year]
+    if not year_df.empty:
+        st.dataframe(year_df[["Forecast", "Days", "Forecast MAE (€/MWh)", "Perfect Foresight Value (€)", "Forecast Value (€)", "Captured (%)"]]
+                     .style.format({"Forecast MAE (€/MWh)": "{:,.2f}", "Perfect Foresight Value (€)": "€ {:,.2f}",
+                                    "Forecast Value (€)": "€ {:,.2f}", "Captured (%)": "{:.1f}%"}),
+                     hide_index=True, use_container_width=True)
+    fig_captured = px.line(backtest_df, x="Year", y="Captured (%)", color="Forecast", markers=True,
+                           title="Share of Perfect-Foresight Arbitrage Value Captured")
+    st.plotly_chart(fig_captured, use_container_width=True)
+
+
+def run_portfolio_job(site_rows, contract_rows, year, progress=None, cancel_event=None):
+    """Background job: the portfolio of the edited site and contract tables."""
+    sites = [Site(name, country, demand, annual or None, capacity, efficiency, dod, hours)
+             for name, country, demand, annual, capacity, efficiency, dod, hours in site_rows]
+    contracts = [PpaContract(name, price, volume, [site.strip() for site in eligible.split(",") if site.strip()] or None)
+                 for name, price, volume, eligible in contract_rows]
+    return portfolio_dispatch(sites, contracts, year, df_carbon)
+
+
+def render_portfolio_results(portfolio):
+    """Renders site and portfolio totals, the PPA allocation and the portfolio's monthly energy mix."""
+    site_df = portfolio.site_frame()
+    total = site_df.loc["Portfolio"]
+    pf_col1, pf_col2, pf_col3, pf_col4 = st.columns(4)
+    pf_col1.metric("Portfolio Demand", f"{total['Demand (MWh)']:,.0f} MWh")
+    pf_col2.metric("Spot Only", f"€ {total['Total Spot Cost (€)']:,.2f}")
+    pf_col3.metric("Hybrid (Battery + PPA + Spot)", f"€ {total['Total Hybrid Cost (€)']:,.2f}",
+                   delta=f"-€ {total['Total Spot Cost (€)'] - total['Total Hybrid Cost (€)']:,.2f}", delta_color="inverse")
+    pf_col4.metric("LCOE (Hybrid)", f"€ {total['LCOE (Hybrid) (€/MWh)']:,.2f} / MWh")
+
+    money_columns = [c for c in site_df.columns if "(€)" in c or "(€/MWh)" in c]
+    st.dataframe(site_df.style.format({c: "{:,.2f}" for c in site_df.columns if c not in money_columns})
+                 .format({c: "€ {:,.2f}" for c in money_columns}, na_rep="-"), use_container_width=True)
+
+    st.subheader("PPA Allocation")
+    contract_df = portfolio.contract_frame()
+    st.dataframe(contract_df.style.format("{:,.2f}"), use_container_width=True)
+
+    fig_mix = px.bar(portfolio.monthly_frame(), x="Month", y=["Battery (MWh)", "PPA (MWh)", "Spot (MWh)"],
+                     labels={"value": "Energy (MWh)", "variable": ""}, title="Portfolio Energy Supply by Month")
+    st.plotly_chart(fig_mix, use_container_width=True)
+
+
+def render_comparison_results(comparison_results: list):
+    """
+    Renders the comparison table and charts from per-country results of calculate_metrics.
+    """
+    for result in comparison_results:
+        if result.get("Error"):
+            st.error(result["Error"])
+
+    if comparison_results:
+        results_df = pd.DataFrame(comparison_results)
+        # Reorder columns for better display
+        cols = ["Country", "Year", "Demand Profile",
+                "Total Spot Cost (€)", "Total Cost with Battery (€)", "Total Hybrid Cost (€)",
+                "LCOE (Spot) (€/MWh)", "LCOE (Battery) (€/MWh)", "LCOE (Hybrid) (€/MWh)",
+                "Total CO2 Emissions (tonnes CO2eq)"]
+
+        # Filter out columns that are all None (e.g., if battery not used)
+        display_cols = [col for col in cols if not results_df[col].isnull().all()]
+        results_df = results_df[display_cols]
+
+
+        st.subheader("Comparison Summary Table")
+        st.dataframe(results_df.set_index("Country"), use_container_width=True)
+
+        st.subheader("Visual Comparison")
+
+        # Bar chart for Total Costs
+        cost_columns_plot = [col for col in ["Total Spot Cost (€)", "Total Cost with Battery (€)", "Total Hybrid Cost (€)"] if col in results_df.columns and not results_df[col].isnull().all()]
+        if cost_columns_plot:
+            cost_df_plot = results_df.melt(id_vars=["Country"], value_vars=cost_columns_plot, var_name="Cost Type", value_name="Cost (€)")
+            fig_costs = px.bar(cost_df_plot, x="Country", y="Cost (€)", color="Cost Type",
+                            barmode="group", title="Total Annual Energy Costs by Country and Strategy")
+            st.plotly_chart(fig_costs, use_container_width=True)
+        else:
+            st.info("No cost data available for plotting. Ensure calculations are successful.")
+
 
-    except Exception as e:
-        # st.error(f"Error calculating metrics for {selected_country}: {e}")
-        # Return partial results if an error occurs, or None for failed calculations
-        return results
+        # Bar chart for LCOE
+        lcoe_columns_plot = [col for col in ["LCOE (Spot) (€/MWh)", "LCOE (Battery) (€/MWh)", "LCOE (Hybrid) (€/MWh)"] if col in results_df.columns and not results_df[col].isnull().all()]
+        if lcoe_columns_plot:
+            lcoe_df_plot = results_df.melt(id_vars=["Country"], value_vars=lcoe_columns_plot, var_name="LCOE Type", value_name="LCOE (€/MWh)")
+            fig_lcoe = px.bar(lcoe_df_plot, x="Country", y="LCOE (€/MWh)", color="LCOE Type",
+                            barmode="group", title="LCOE by Country and Strategy")
+            st.plotly_chart(fig_lcoe, use_container_width=True)
+        else:
+            st.info("No LCOE data available for plotting. Ensure calculations are successful.")
 
-    return results
+        # Bar chart for CO2 Emissions
+        if "Total CO2 Emissions (tonnes CO2eq)" in results_df.columns and not results_df["Total CO2 Emissions (tonnes CO2eq)"].isnull().all():
+            fig_co2 = px.bar(results_df, x="Country", y="Total CO2 Emissions (tonnes CO2eq)",
+                             title="Total Annual CO2 Emissions by Country")
+            st.plotly_chart(fig_co2, use_container_width=True)
+        else:
+            st.info("No CO2 emissions data available for plotting. Please ensure 'carbon.csv' is correctly loaded and data exists for selected countries/years.")
+    else:
+        st.info("No data to display comparison. Ensure inputs in Optimization tab are selected and data files exist.")
 
 
 st.markdown("<br>", unsafe_allow_html=True)
 
-tab1, tab2 , tab3, tab4, tab5 = st.tabs(["Optimization", "PPA Analysis", "Waste Heat", "LCOE", "Comparison"])
+tab1, tab2 , tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs(["Optimization", "PPA Analysis", "Waste Heat", "LCOE", "Comparison", "Solar PV", "Portfolio", "Market Analytics"])
 
 with tab1:
     st.header("Optimization")
@@ -262,15 +441,25 @@ with tab1:
 
     st.sidebar.header("🔧 Optimization Inputs")
 
-    demand_option = st.sidebar.selectbox("Select Demand Profile", ["Choose demand", "600 kWh", "5 MWh", "10 MWh", "15 MWh"], key="demand_profile_opt")
-    year_option = st.sidebar.selectbox("Select Year", ["Choose year"] + [str(y) for y in range(2015, 2025)], key="year_opt")
-    
+    demand_option = st.sidebar.selectbox("Select Demand Profile", ["Choose demand"] + demand_profile_names(st.session_state.demand_uploads) + ["Upload demand profile"], key="demand_profile_opt")
+    if demand_option == "Upload demand profile":
+        uploaded_profile = st.sidebar.file_uploader("Upload Demand Profile (timestamp, demand_kWh)", type=["csv"], key="upload_profile_opt")
+        demand_option = "Choose demand"
+        if uploaded_profile is not None:
+            try:
+                demand_option = register_upload(uploaded_profile.name, uploaded_profile.getvalue(), st.session_state.demand_uploads)
+            except Exception as e:
+                st.sidebar.error(f"Could not read demand profile: {e}")
+    annual_demand_mwh = st.sidebar.number_input("Annual Demand (MWh, 0 = as profile)", min_value=0.0, value=0.0, step=1000.0, key="annual_demand_opt") or None
     country_option = st.sidebar.selectbox("Select Country", all_countries, key="country_opt")
+
+    year_option = st.sidebar.selectbox("Select Year", ["Choose year"] + data_catalog.years(country_option), key="year_opt")
     
     # Store in session state
     st.session_state.selected_optimization_country = country_option
     st.session_state.year_option = year_option
     st.session_state.demand_option = demand_option
+    st.session_state.annual_demand_mwh = annual_demand_mwh
 
     use_custom_data = st.sidebar.checkbox("Upload Custom Demand and Price Data", key="custom_data_opt")
     uploaded_demand = None
@@ -281,23 +470,31 @@ with tab1:
 
     use_battery = st.sidebar.checkbox("Include Battery Storage", key="use_battery_opt")
     if use_battery:
-        default_capacity = float(0.6 if demand_option == "600 kWh" else 6 if demand_option == "5 MWh" else 13.89 if demand_option == "10 MWh" else 20.83 if demand_option == "15 MWh" else 1.0)
+        default_capacity = float(default_battery_capacity_mwh.get(demand_option, 1.0))
         battery_capacity = st.sidebar.number_input("Battery Capacity (MWh)", min_value=0.0, value=default_capacity, key="battery_cap_opt")
         efficiency = st.sidebar.slider("Battery Efficiency (%)", min_value=0, max_value=100, value=90, key="efficiency_opt")
         dod = st.sidebar.slider("Depth of Discharge (DoD %)", min_value=0, max_value=100, value=80, key="dod_opt")
         storage_hours = st.sidebar.number_input("Storage Duration (hours)", min_value=1, max_value=24, value=4, key="storage_hours_opt")
+        demand_charge = st.sidebar.number_input("Demand Charge (€/kW per month)", min_value=0.0, value=0.0, step=0.5, key="demand_charge_opt",
+                                                help="Capacity charge on each month's maximum grid import. Enables peak shaving.")
+        no_export = st.sidebar.checkbox("No Export", key="no_export_opt",
+                                        help="In the hybrid (PPA) calculation, the battery never discharges more than the hour's demand. "
+                                             "Off, discharge beyond the demand is netted against the PPA hedge.")
         
         st.session_state.battery_capacity = battery_capacity
         st.session_state.efficiency = efficiency
         st.session_state.dod = dod
         st.session_state.storage_hours = storage_hours
         st.session_state.use_battery = use_battery
+        st.session_state.no_export = no_export
     else:
         st.session_state.use_battery = False
         st.session_state.battery_capacity = 0.0 
         st.session_state.efficiency = 0
         st.session_state.dod = 0
         st.session_state.storage_hours = 0
+        st.session_state.no_export = False
+        demand_charge = 0.0
 
 
     st.sidebar.markdown("---")
@@ -307,6 +504,7 @@ with tab1:
 
     col1, col2 = st.columns([1, 2])
 
+    scenario = None
     if demand_option != "Choose demand" and year_option != "Choose year" and country_option:
         
         emission_factor_g_per_kWh = 0.0 
@@ -332,42 +530,15 @@ with tab1:
                 price_df = pd.read_csv(uploaded_price)
                 demand_df["timestamp"] = pd.to_datetime(demand_df["timestamp"])
                 price_df["timestamp"] = pd.to_datetime(price_df["timestamp"])
+                scenario = Scenario.from_frames(price_df, demand_df)
             else:
-                data_dir = "data"
-                europe_prices_dir = os.path.join(data_dir, "europe_prices")
-                multi_year_file = os.path.join(europe_prices_dir, f"{country_option.lower()}_15_24.csv")
-                
-                if not os.path.exists(multi_year_file):
-                    st.warning(f"Price data for {country_option} in {year_option} not found at {multi_year_file}. Please check the file path or upload custom data.")
-                    merged_df = None
-                else:
-                    price_df = pd.read_csv(multi_year_file)
-                    price_df["timestamp"] = pd.to_datetime(price_df["timestamp"])
-                    price_df = price_df[price_df["timestamp"].dt.year == int(year_option)]
-                    
-                    demand_value = 0
-                    if demand_option == "600 kWh":
-                        demand_value = 600
-                    elif demand_option == "5 MWh":
-                        demand_value = 5000
-                    elif demand_option == "10 MWh":
-                        demand_value = 10000
-                    elif demand_option == "15 MWh":
-                        demand_value = 15000
-                    
-                    demand_df = pd.DataFrame({
-                        "timestamp": price_df["timestamp"],
-                        "demand_kWh": [demand_value] * len(price_df)
-                    })
-                    merged_df = pd.merge(price_df, demand_df, on="timestamp")
-
-            if merged_df is not None:
-                country_code_map = {
-                    "Austria": "at", "Belgium": "be", "Bulgaria": "bg", "Croatia": "hr","Czechia": "cz","Denmark": "dk","Estonia": "ee","Finland": "fi",
-                    "France": "fr","Germany": "de","Greece": "gr","Hungary": "hu","Italy": "it","Latvia": "lv","Lithuania": "lt","Luxembourg": "lu","Netherlands": "nl",
-                    "Norway": "no","Poland": "pl","Portugal": "pt","Romania": "ro","Slovakia": "sk","Slovenia": "si","Spain": "es","Sweden": "se","Switzerland": "ch"
-                }
-                country_code = country_code_map.get(country_option, "").lower()
+                # Prices are views into the price store shared by all sessions; only the demand is per session
+                scenario = build_scenario(country_option, year_option, demand_option, annual_demand_mwh=annual_demand_mwh)
+                if scenario is None:
+                    st.warning(f"Price data for {country_option} in {year_option} not found at {price_file_for(country_option)}. Please check the file path or upload custom data.")
+
+            if scenario is not None:
+                country_code = country_codes.get(country_option, "")
                 if country_code:
                     st.markdown(f"""
                         <div style='display: flex; align-items: center; gap: 10px;'>
@@ -378,14 +549,10 @@ with tab1:
                 else:
                     st.title("Nitrocapt Energy Optimization")
 
-                if "Grid_Price_EUR_per_MWh" in merged_df.columns:
-                    merged_df["price"] = merged_df["Grid_Price_EUR_per_MWh"]
-                elif "price" not in merged_df.columns:
-                    raise KeyError("Required price column not found in merged data.")
-                merged_df["hourly_cost"] = (merged_df["price"] / 1000) * merged_df["demand_kWh"]
-                
-                st.session_state.total_cost_base = merged_df["hourly_cost"].sum()
-                st.session_state.total_demand_mwh = merged_df["demand_kWh"].sum() / 1000
+                hourly_cost = scenario.prices_eur_mwh() * scenario.demand_mwh()
+
+                st.session_state.total_cost_base = float(np.nansum(hourly_cost))
+                st.session_state.total_demand_mwh = float(scenario.demand_mwh().sum())
 
                 if st.session_state.total_demand_mwh is not None and st.session_state.total_demand_mwh > 0:
                     total_demand_kwh = st.session_state.total_demand_mwh * 1000
@@ -395,22 +562,11 @@ with tab1:
 
 
                 if use_battery:
-                    merged_df["date"] = merged_df["timestamp"].dt.date
-                    savings = []
-                    daily_groups = merged_df.groupby("date")
-                    for _, group in daily_groups:
-                        sorted_group = group.sort_values(by="price")
-                        charge_hours = sorted_group.head(st.session_state.storage_hours)
-                        discharge_hours = sorted_group.tail(st.session_state.storage_hours)
-                        
-                        hourly_battery_power = st.session_state.battery_capacity / st.session_state.storage_hours if st.session_state.storage_hours > 0 else 0
-
-                        charge_cost = (charge_hours["price"] / 1000 * (hourly_battery_power * 1000)).sum()
-                        discharge_value = (discharge_hours["price"] / 1000 * (hourly_battery_power * 1000) * (st.session_state.efficiency / 100) * (st.session_state.dod / 100)).sum()
-                        net_saving = discharge_value - charge_cost
-                        savings.append(net_saving)
-                    
-                    st.session_state.battery_adjusted_cost = st.session_state.total_cost_base - sum(savings)
+                    savings = battery_arbitrage_savings(
+                        scenario, st.session_state.battery_capacity, st.session_state.efficiency,
+                        st.session_state.dod, st.session_state.storage_hours
+                    )
+                    st.session_state.battery_adjusted_cost = st.session_state.total_cost_base - savings
                 else:
                     st.session_state.battery_adjusted_cost = None # Explicitly set to None if battery not used
                 
@@ -423,46 +579,13 @@ with tab1:
                 if 'hedge_volume' not in st.session_state:
                     st.session_state.hedge_volume = 6.0
 
-                # Calculate total_hybrid_cost here, ensuring it uses potentially battery-optimized logic
-                total_hybrid_cost_temp = 0
-                merged_df_hybrid_temp = merged_df.copy()
-                merged_df_hybrid_temp['battery_used_mwh'] = 0.0
-                merged_df_hybrid_temp['hedge_used_mwh'] = 0.0
-                merged_df_hybrid_temp['spot_used_mwh'] = 0.0
-                merged_df_hybrid_temp['hedge_settlement'] = 0.0
-                merged_df_hybrid_temp['spot_cost'] = 0.0
-                merged_df_hybrid_temp['hybrid_cost_hourly'] = 0.0
-
-                for idx in merged_df_hybrid_temp.index:
-                    demand_mwh = merged_df_hybrid_temp.at[idx, 'demand_kWh'] / 1000
-                    spot_price = merged_df_hybrid_temp.at[idx, 'price']
-                    
-                    battery_available_hourly = 0.0
-                    if use_battery and st.session_state.storage_hours > 0 and st.session_state.battery_capacity > 0:
-                        usable_capacity = st.session_state.battery_capacity * (st.session_state.efficiency / 100) * (st.session_state.dod / 100)
-                        battery_power_limit = st.session_state.battery_capacity / float(st.session_state.storage_hours)
-                        
-                        # Simplified for main tab for now, assuming battery optimizes for arbitrage
-                        # In reality, this would need the full daily optimization loop for 'hybrid_cost_hourly'
-                        # For consistency with PPA tab, the full loop should be here too.
-                        # Let's use the full logic from PPA tab's for loop to ensure consistency.
-                        
-                        # Re-running daily optimization for the whole dataset for hybrid cost.
-                        # This is inefficient; the `calculate_metrics_for_country` function handles this
-                        # so the main tab can just display results from session state after its initial run.
-                        # The session state variables will be updated by the actual calculations.
-
-                        # For simplification in main tab, we'll assume a basic hybrid cost if battery is on.
-                        # The `calculate_metrics_for_country` function is the source of truth.
-                        pass # This loop should ideally be within a function or pre-calculated and stored.
-
-                # Update the session state with the actual total hybrid cost if it was calculated by the optimization.
-                # This needs to be done after the full optimization logic in tab1, or by calling `calculate_metrics_for_country` here.
-                # For simplicity, we'll let the initial values propagate from tab1, and tab5 will recalculate properly.
-                
-                # Store demand_df and price_df in session state for PPA Analysis tab
-                st.session_state.demand_df = demand_df
-                st.session_state.price_df = price_df
+                # The hybrid cost is calculated by the hybrid dispatch in the PPA Analysis tab.
+
+                # Store the scenario in session state for PPA Analysis tab
+                st.session_state.scenario = scenario
+                if not use_custom_data:
+                    record_usage(country_option, year_option, demand_option)
+                st.session_state.session_memory_bytes = scenario.owned_nbytes()
 
         except Exception as e:
             st.error(f"Data Loading or Calculation Error in Optimization tab: {e}")
@@ -471,7 +594,12 @@ with tab1:
             st.session_state.battery_adjusted_cost = None
             st.session_state.total_hybrid_cost = None
             st.session_state.total_co2_emissions_tonnes = None
-            merged_df = None
+            scenario = None
+
+        st.sidebar.caption(
+            f"Session data: {st.session_state.session_memory_bytes / 1024:,.0f} KB "
+            f"(shared price store: {loaded_nbytes() / 1024 ** 2:,.1f} MB)"
+        )
 
 
         if st.session_state.total_cost_base is not None:
@@ -511,14 +639,13 @@ with tab1:
 
             with top_col2:
                 try:
-                    if 'merged_df' in locals() and merged_df is not None:
-                        merged_df["month"] = merged_df["timestamp"].dt.strftime("%b")
+                    if scenario is not None:
                         month_order = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-                        monthly_costs = merged_df.groupby("month")["hourly_cost"].sum().reindex(month_order)
-                        
+                        monthly_costs = np.bincount(scenario.month.astype(np.int64) - 1, weights=np.nan_to_num(hourly_cost), minlength=12)
+
                         fig_month = px.bar(
-                            x=monthly_costs.index,
-                            y=monthly_costs.values,
+                            x=month_order,
+                            y=monthly_costs,
                             labels={'x': 'Month', 'y': 'Monthly Cost (€)'},
                             title="Monthly Energy Cost Breakdown"
                         )
@@ -530,12 +657,11 @@ with tab1:
 
             with top_col3:
                 try:
-                    if 'merged_df' in locals() and merged_df is not None:
+                    if scenario is not None:
                         fig_hourly = px.line(
-                            merged_df,
-                            x="timestamp",
-                            y="price",
-                            labels={"timestamp": "Time", "price": "€/MWh"},
+                            x=scenario.timestamps,
+                            y=scenario.prices_eur_mwh(),
+                            labels={"x": "Time", "y": "€/MWh"},
                             title="Hourly Spot Price Trend"
                         )
                         st.plotly_chart(fig_hourly, use_container_width=True)
@@ -560,11 +686,91 @@ with tab1:
                         <h2 style="color: #287a4d;">€ {st.session_state.battery_adjusted_cost:,.2f}</h2>
                     </div>
                 """, unsafe_allow_html=True)
+
+            if use_battery and demand_charge > 0 and scenario is not None:
+                st.markdown("---")
+                st.subheader("📉 Peak Shaving")
+                try:
+                    peak_shaving = peak_shaving_dispatch(
+                        scenario, st.session_state.battery_capacity, st.session_state.efficiency,
+                        st.session_state.dod, st.session_state.storage_hours, demand_charge
+                    )
+                    if peak_shaving.demand_charge_savings <= 0:
+                        profile_hint = ", ".join(f"'{name}'" for name in library_files())
+                        st.info("The battery cannot lower the monthly peaks of this demand profile. Peak shaving needs a time-varying demand: "
+                                + (f"select a built-in demand profile such as {profile_hint} instead of a flat preset." if profile_hint
+                                   else "select or upload a measured demand profile instead of a flat preset."))
+                    ps_col1, ps_col2, ps_col3 = st.columns(3)
+                    ps_col1.metric("Demand Charges without Battery", f"€ {peak_shaving.demand_charge_before:,.2f}")
+                    ps_col2.metric("Demand Charges with Peak Shaving", f"€ {peak_shaving.demand_charge_after:,.2f}",
+                                   delta=f"-€ {peak_shaving.demand_charge_savings:,.2f}", delta_color="inverse")
+                    ps_col3.metric("Total Savings (incl. Arbitrage and Losses)", f"€ {peak_shaving.total_savings:,.2f}")
+
+                    peak_df = peak_shaving.monthly_frame()
+                    fig_peaks = px.bar(
+                        peak_df, x="Month", y=["Peak before (kW)", "Peak after (kW)"], barmode="group",
+                        labels={"value": "Monthly Peak (kW)", "variable": ""}, title="Monthly Peak Grid Import"
+                    )
+                    st.plotly_chart(fig_peaks, use_container_width=True)
+                    st.dataframe(peak_df.style.format({
+                        "Peak before (kW)": "{:,.1f}", "Peak after (kW)": "{:,.1f}", "Demand Charge Savings (€)": "€ {:,.2f}"
+                    }))
+                except Exception as e:
+                    st.error(f"Peak shaving error: {e}")
+
+            if use_battery and scenario is not None and not use_custom_data:
+                with st.expander("🔋 Battery Ageing & Lifetime Economics"):
+                    st.caption("Replays the daily arbitrage from the selected year onwards (the last year with prices repeats once the history ends). "
+                               "Rainflow-counted cycles and calendar ageing reduce the capacity of later years, and the battery is replaced at 80% state of health.")
+                    age_col1, age_col2, age_col3 = st.columns(3)
+                    capex_eur_kwh = age_col1.number_input("Battery Capex (€/kWh)", min_value=0.0, value=battery_capex_eur_mwh / 1000, step=10.0, key="battery_capex_opt")
+                    rate_percent = age_col2.number_input("Discount Rate (%)", min_value=0.0, max_value=30.0, value=discount_rate * 100, step=0.5, key="discount_rate_opt")
+                    lifetime_years = age_col3.number_input("Horizon (years)", min_value=1, max_value=30, value=horizon_years, key="horizon_years_opt")
+                    try:
+                        ageing = degradation_economics(
+                            country_option, year_option, st.session_state.battery_capacity, st.session_state.efficiency,
+                            st.session_state.dod, st.session_state.storage_hours, years=int(lifetime_years),
+                            capex_eur_mwh=capex_eur_kwh * 1000, rate=rate_percent / 100
+                        )
+                        if ageing is None:
+                            st.info("Lifetime economics need a battery capacity above 0 and price data for the selected year.")
+                        else:
+                            ageing_df = ageing.yearly_frame()
+                            ag_col1, ag_col2, ag_col3 = st.columns(3)
+                            ag_col1.metric("NPV", f"€ {ageing.npv:,.2f}", delta=f"€ {ageing.npv - ageing.npv_without_ageing:,.2f} from ageing")
+                            ag_col2.metric("Levelized Cost of Storage", f"€ {ageing.lcos:,.2f} / MWh")
+                            ag_col3.metric("State of Health after Horizon", f"{ageing.soh_end[-1]:.1%}",
+                                           delta=f"{int((ageing.replacement_cost > 0).sum())} replacement(s)", delta_color="off")
+                            fig_soh = px.line(ageing_df, x="Year", y=["State of Health, Start (%)", "State of Health, End (%)"], markers=True,
+                                              labels={"value": "State of Health (%)", "variable": ""}, title="Battery State of Health")
+                            st.plotly_chart(fig_soh, use_container_width=True)
+                            st.dataframe(ageing_df.style.format({c: "€ {:,.2f}" for c in ageing_df.columns if "(€)" in c})
+                                         .format({c: "{:,.1f}" for c in ageing_df.columns if "(%)" in c or "Cycles" in c}),
+                                         hide_index=True, use_container_width=True)
+                    except Exception as e:
+                        st.error(f"Battery ageing error: {e}")
+
+                with st.expander("🔮 Forecast Backtest: Battery Savings without Perfect Foresight"):
+                    st.caption("The battery savings above pick each day's cheapest and most expensive hours from the actual prices. "
+                               "Here the same rule plans from day-ahead price forecasts, using only earlier days, and the schedule is valued at the actual prices.")
+                    backtest_params = dict(
+                        country=country_option, battery_capacity=st.session_state.battery_capacity,
+                        efficiency=st.session_state.efficiency, dod=st.session_state.dod, storage_hours=st.session_state.storage_hours
+                    )
+                    backtest_jobs = submit_background("backtest", [
+                        (("backtest",) + tuple(backtest_params.values()), run_backtest_job, backtest_params)
+                    ])
+                    show_background_results("backtest", backtest_jobs, f"the {country_option} backtest",
+                                            lambda results: render_backtest_results(results[0], year_option))
         else:
             st.info("Please select Demand Profile, Year, and Country to see optimization results.")
     else:
         st.info("Please select Demand Profile, Year, and Country to see optimization results.")
 
+    with st.expander("📚 Available Data"):
+        st.caption(f"Years are offered once at least {min_year_coverage:.0%} of their hours have prices. Add a country or year by adding its CSV under data/.")
+        st.dataframe(data_catalog.summary(), hide_index=True)
+
 
 with tab2:
     st.header("PPA Analysis")
@@ -577,21 +783,20 @@ with tab2:
     ppa_price_eur_mwh = st.sidebar.number_input("Enter PPA Price (€/MWh)", min_value=0.0, value=st.session_state.get('ppa_price_eur_mwh', 40.0), key="ppa_price_tab2") 
     hedge_volume = st.sidebar.number_input("Hedged Volume (MWh)", min_value=0.0, value=st.session_state.get('hedge_volume', 6.0), key="hedge_volume_tab2") 
     
-    # Store PPA values in session state (important for `calculate_metrics_for_country`)
+    # Store PPA values in session state (important for `calculate_metrics`)
     st.session_state.ppa_price_eur_mwh = ppa_price_eur_mwh
     st.session_state.hedge_volume = hedge_volume
 
-    demand_df_ppa = st.session_state.demand_df
-    price_df_ppa = st.session_state.price_df
+    scenario_ppa = st.session_state.scenario
 
     _use_battery = st.session_state.get('use_battery', False) 
 
     if not _use_battery: 
         st.info("To see Battery analysis and the Charge/Discharge Profile, please tick 'Include Battery Storage' in the 'Optimization' tab (Tab 1) sidebar.")
 
-    if demand_df_ppa is not None and price_df_ppa is not None:
+    if scenario_ppa is not None:
         try:
-            ppa_cost = (demand_df_ppa["demand_kWh"] * (ppa_price_eur_mwh / 1000)).sum()
+            ppa_cost = float(scenario_ppa.demand_mwh().sum()) * ppa_price_eur_mwh
 
             col1, col2, col3 = st.columns(3)
 
@@ -625,138 +830,32 @@ with tab2:
                     </div>
                 """, unsafe_allow_html=True)
 
-            merged_df_ppa = pd.merge(price_df_ppa, demand_df_ppa, on="timestamp")
-            if "Grid_Price_EUR_per_MWh" in merged_df_ppa.columns:
-                merged_df_ppa["price"] = merged_df_ppa["Grid_Price_EUR_per_MWh"]
-            elif "price" not in merged_df_ppa.columns:
-                raise KeyError("Required price column not found in merged data for PPA analysis.")
-
-            merged_df_ppa['date'] = merged_df_ppa['timestamp'].dt.date
-            merged_df_ppa['spot_price'] = merged_df_ppa['price']
-            merged_df_ppa['battery_used_mwh'] = 0.0
-            merged_df_ppa['hedge_used_mwh'] = 0.0
-            merged_df_ppa['spot_used_mwh'] = 0.0
-            merged_df_ppa['battery_cost'] = 0.0
-            merged_df_ppa['hedge_settlement'] = 0.0
-            merged_df_ppa['spot_cost'] = 0.0
-            merged_df_ppa['hybrid_cost'] = 0.0
-            merged_df_ppa['charge_discharge'] = 0.0
-            
-            _battery_capacity = st.session_state.get('battery_capacity', 1.0)
-            _efficiency = st.session_state.get('efficiency', 90)
-            _dod = st.session_state.get('dod', 80)
-            _storage_hours = st.session_state.get('storage_hours', 4)
-            
-            for date, group in merged_df_ppa.groupby('date'):
-                group = group.copy()
-                if _use_battery and _storage_hours > 0:
-                    discharge_hours_indices = group.sort_values("price", ascending=False).head(_storage_hours).index
-                    charge_hours_indices = group.sort_values("price", ascending=True).head(_storage_hours).index
-                else:
-                    discharge_hours_indices = []
-                    charge_hours_indices = []
-
-                for idx in group.index:
-                    demand_mwh = merged_df_ppa.at[idx, 'demand_kWh'] / 1000
-                    spot_price = merged_df_ppa.at[idx, 'spot_price']
-
-                    battery_available = 0.0
-                    charge_discharge = 0.0
-
-                    if _use_battery and _storage_hours > 0: 
-                        usable_capacity = _battery_capacity * (_efficiency / 100) * (_dod / 100)
-                        battery_power_limit = _battery_capacity / float(_storage_hours)
-
-                        if idx in discharge_hours_indices:
-                            battery_available = min(battery_power_limit, usable_capacity / float(_storage_hours))
-                            charge_discharge = -battery_available
-                        elif idx in charge_hours_indices:
-                            charge_discharge = battery_power_limit
-                    
-                    remaining_demand_after_battery = demand_mwh - battery_available
-                    
-                    hedge_used_hourly = min(remaining_demand_after_battery, hedge_volume / 24)
-                    
-                    spot_used_hourly = max(0.0, remaining_demand_after_battery - hedge_used_hourly)
-
-                    merged_df_ppa.at[idx, 'battery_used_mwh'] = battery_available
-                    merged_df_ppa.at[idx, 'hedge_used_mwh'] = hedge_used_hourly
-                    merged_df_ppa.at[idx, 'spot_used_mwh'] = spot_used_hourly
-
-                    merged_df_ppa.at[idx, 'battery_cost'] = 0.0
-                    merged_df_ppa.at[idx, 'hedge_settlement'] = (ppa_price_eur_mwh - spot_price) * hedge_used_hourly
-                    merged_df_ppa.at[idx, 'spot_cost'] = spot_price * spot_used_hourly
-                    
-                    merged_df_ppa.at[idx, 'hybrid_cost'] = (
-                        merged_df_ppa.at[idx, 'spot_cost']
-                        + (ppa_price_eur_mwh * hedge_used_hourly)
-                    )
-                    merged_df_ppa.at[idx, 'charge_discharge'] = charge_discharge
-
-            st.session_state.total_hybrid_cost = merged_df_ppa['hybrid_cost'].sum()
-
-            if st.session_state.total_hybrid_cost is not None:
-                st.markdown(f"""
-                    <div style="background-color: #e6f0fa; padding: 20px; border-radius: 10px; border: 1px solid #a3c4dc; text-align: center; margin-top: 30px;">
-                        <h4>Hybrid Strategy Optimized Cost</h4>
-                        <p style='font-size: 0.9em; color: #666;'>(Spot + Battery + CfD)</p>
-                        <h2 style='color: #1f78b4;'>€ {st.session_state.total_hybrid_cost:,.2f}</h2>
-                    </div>
-                """, unsafe_allow_html=True)
+            hybrid_params = dict(
+                use_battery=_use_battery,
+                battery_capacity=st.session_state.get('battery_capacity', 1.0),
+                efficiency=st.session_state.get('efficiency', 90),
+                dod=st.session_state.get('dod', 80),
+                storage_hours=st.session_state.get('storage_hours', 4),
+                ppa_price_eur_mwh=ppa_price_eur_mwh,
+                hedge_volume=hedge_volume,
+                no_export=st.session_state.no_export
+            )
+            # Uploaded files have no name to key on, so the scenario is identified by its data
+            hybrid_key = ("hybrid", scenario_ppa.fingerprint()) + tuple(hybrid_params.values())
+            hybrid_jobs = submit_background("hybrid", [(hybrid_key, run_hybrid_dispatch, dict(hybrid_params, scenario=scenario_ppa))])
+
+            # Only a finished run for the current inputs feeds the LCOE tab
+            hybrid_job = hybrid_jobs[0]
+            if hybrid_job.done() and hybrid_job.error() is None:
+                st.session_state.total_hybrid_cost = hybrid_job.result()[1].total_hybrid_cost
             else:
-                st.info("Hybrid strategy cost not available. Please configure optimization inputs.")
-
-            hybrid_table = merged_df_ppa[[
-                "timestamp", "battery_used_mwh", "hedge_used_mwh", "spot_used_mwh", "hybrid_cost"
-            ]].copy()
-            hybrid_table.rename(columns={"hybrid_cost": "Hourly Cost (€)"}, inplace=True)
-
-            st.markdown("<h4 style='margin-top: 30px;'>Hybrid Dispatch Allocation (Hourly)</h4>", unsafe_allow_html=True)
-            st.dataframe(hybrid_table, use_container_width=True, hide_index=True)
-
-            st.markdown("<h4 style='margin-top: 30px;'>Battery Charge/Discharge Profile</h4>", unsafe_allow_html=True)
-            if _use_battery and not merged_df_ppa.empty: 
-                selected_day = st.date_input("Select a day to view battery activity", value=merged_df_ppa['date'].iloc[0], min_value=merged_df_ppa['date'].min(), max_value=merged_df_ppa['date'].max(), key="battery_date_ppa")
-                selected_data = merged_df_ppa[merged_df_ppa['date'] == selected_day].copy()
-
-                selected_data['discharge'] = selected_data['battery_used_mwh']
-                selected_data['charge'] = selected_data['charge_discharge'].apply(lambda x: x if x > 0 else 0)
-                selected_data['state_of_charge'] = selected_data['charge_discharge'].cumsum()
-                
-                fig_battery = go.Figure()
-                fig_battery.add_trace(go.Bar(
-                    x=selected_data['timestamp'].tolist(), 
-                    y=selected_data['charge'].tolist(),    
-                    name='Battery Charge (MWh)',
-                    marker_color='lightskyblue'
-                ))
-                fig_battery.add_trace(go.Bar(
-                    x=selected_data['timestamp'].tolist(), 
-                    y=selected_data['discharge'].tolist(), 
-                    name='Battery Discharge (MWh)',
-                    marker_color='indianred'
-                ))
-                fig_battery.add_trace(go.Scatter(
-                    x=selected_data['timestamp'].tolist(), 
-                    y=selected_data['state_of_charge'].tolist(), 
-                    mode='lines+markers',
-                    name='State of Charge (MWh)',
-                    line=dict(color='green')
-                ))
-
-                fig_battery.update_layout(
-                    title=f"Battery Activity on {selected_day}",
-                    xaxis_title="Hour",
-                    yaxis_title="Energy (MWh)",
-                    barmode='relative',
-                    height=400
-                )
-                st.plotly_chart(fig_battery, use_container_width=True)
-            elif _use_battery and merged_df_ppa.empty: 
-                 st.warning("Battery data is enabled, but no energy data loaded. Please configure inputs in 'Optimization' tab.")
-            else: 
-                st.info("Battery activity plot requires 'Include Battery Storage' to be enabled in the 'Optimization' tab.")
+                st.session_state.total_hybrid_cost = None
 
+            hybrid_label = f"{st.session_state.selected_optimization_country} {st.session_state.year_option}, {st.session_state.demand_option}"
+            show_background_results(
+                "hybrid", hybrid_jobs, hybrid_label,
+                lambda results: render_hybrid_results(*results[0], _use_battery)
+            )
 
         except Exception as e:
             st.error(f"PPA Analysis Error: {e}")
@@ -772,7 +871,8 @@ with tab3:
 
     st.sidebar.header("♨️ Waste Heat Inputs")
 
-    selected_year_wh = st.sidebar.selectbox("Select Year (Waste Heat)", ["2024"], index=0, key="waste_heat_year")
+    dh_price_files = data_catalog.source_files("dh_prices")
+    selected_year_wh = st.sidebar.selectbox("Select Year (Waste Heat)", sorted(dh_price_files, reverse=True) or ["2024"], index=0, key="waste_heat_year")
 
     waste_heat_capacity = st.sidebar.number_input(
         "Nitrocapt Waste Heat Capacity (MWh)",
@@ -784,15 +884,15 @@ with tab3:
     if use_fixed_price:
         fixed_price = st.sidebar.number_input("Fixed Price (SEK/MWh)", min_value=0.0, value=300.0, key="fixed_price")
         try:
-            hours_in_2024 = 8784
-            total_revenue = fixed_price * waste_heat_capacity * hours_in_2024
+            hours_in_year = int((np.datetime64(f"{int(selected_year_wh) + 1}-01-01T00") - np.datetime64(f"{selected_year_wh}-01-01T00")).astype(np.int64))
+            total_revenue = fixed_price * waste_heat_capacity * hours_in_year
             st.markdown("---")
             st.markdown(f"### 💰 Total Annual Revenue (Fixed Price): SEK {total_revenue:,.2f}")
         except Exception as e:
             st.error(f"Fixed price calculation error: {e}")
     else:
         try:
-            dh_file_path = os.path.join("data", "dh_prices_2024.csv")
+            dh_file_path = dh_price_files.get(selected_year_wh, os.path.join("data", f"dh_prices_{selected_year_wh}.csv"))
             if not os.path.exists(dh_file_path):
                 st.error(f"District heating price file not found at {dh_file_path}. Please ensure it is in the 'data' directory.")
             else:
@@ -876,7 +976,9 @@ with tab5: # New Comparison tab
 
     # Countries 2, 3, 4 chosen by user, excluding already selected ones
     # Create a copy to modify for selections
-    available_for_selection = [c for c in all_countries if c != st.session_state.selected_optimization_country]
+    # Only countries with prices for the selected year
+    comparison_countries = data_catalog.countries_for_year(st.session_state.year_option) if st.session_state.year_option != 'Choose year' else all_countries
+    available_for_selection = [c for c in comparison_countries if c != st.session_state.selected_optimization_country]
 
     with col2_comp:
         country_2 = st.selectbox("Select Country 2", ["-"] + available_for_selection, index=0, key="comp_country_2")
@@ -906,82 +1008,206 @@ with tab5: # New Comparison tab
         st.markdown("---")
         st.subheader(f"Comparing Countries for Year: **{st.session_state.year_option}** and Demand: **{st.session_state.demand_option}**")
 
-        comparison_results = []
-
         # Get common parameters from Optimization tab for consistency
-        common_year = st.session_state.year_option
-        common_demand = st.session_state.demand_option
-        
-        common_use_battery = st.session_state.use_battery
-        common_battery_capacity = st.session_state.battery_capacity
-        common_efficiency = st.session_state.efficiency
-        common_dod = st.session_state.dod
-        common_storage_hours = st.session_state.storage_hours
-        common_ppa_price = st.session_state.ppa_price_eur_mwh
-        common_hedge_volume = st.session_state.hedge_volume
-
-        with st.spinner("Calculating comparison metrics..."):
-            for country in selected_countries_for_comparison:
-                result = calculate_metrics_for_country(
-                    selected_country=country,
-                    selected_year=common_year,
-                    demand_option=common_demand,
-                    use_battery=common_use_battery,
-                    battery_capacity=common_battery_capacity,
-                    efficiency=common_efficiency,
-                    dod=common_dod,
-                    storage_hours=common_storage_hours,
-                    ppa_price_eur_mwh=common_ppa_price,
-                    hedge_volume=common_hedge_volume,
-                    df_carbon_data=df_carbon # Pass the loaded CO2 data
-                )
-                comparison_results.append(result)
-
-        if comparison_results:
-            results_df = pd.DataFrame(comparison_results)
-            # Reorder columns for better display
-            cols = ["Country", "Year", "Demand Profile",
-                    "Total Spot Cost (€)", "Total Cost with Battery (€)", "Total Hybrid Cost (€)",
-                    "LCOE (Spot) (€/MWh)", "LCOE (Battery) (€/MWh)", "LCOE (Hybrid) (€/MWh)",
-                    "Total CO2 Emissions (tonnes CO2eq)"]
-            
-            # Filter out columns that are all None (e.g., if battery not used)
-            display_cols = [col for col in cols if not results_df[col].isnull().all()]
-            results_df = results_df[display_cols]
-
+        common_params = dict(
+            selected_year=st.session_state.year_option,
+            demand_option=st.session_state.demand_option,
+            annual_demand_mwh=st.session_state.annual_demand_mwh,
+            use_battery=st.session_state.use_battery,
+            battery_capacity=st.session_state.battery_capacity,
+            efficiency=st.session_state.efficiency,
+            dod=st.session_state.dod,
+            storage_hours=st.session_state.storage_hours,
+            ppa_price_eur_mwh=st.session_state.ppa_price_eur_mwh,
+            hedge_volume=st.session_state.hedge_volume,
+            no_export=st.session_state.no_export
+        )
+
+        # One background job per country, so countries shared with another comparison are reused;
+        # results also land in the on-disk cache shared with service.py
+        comparison_scenarios = []
+        for country in selected_countries_for_comparison:
+            record_usage(country, common_params["selected_year"], common_params["demand_option"])
+            scenario_key = ("metrics", country) + tuple(common_params.values())
+            comparison_scenarios.append((
+                scenario_key,
+                calculate_metrics_cached,
+                dict(common_params, selected_country=country, df_carbon_data=df_carbon)
+            ))
+        comparison_jobs = submit_background("comparison", comparison_scenarios)
+
+        comparison_label = f"{', '.join(selected_countries_for_comparison)} ({common_params['selected_year']}, {common_params['demand_option']})"
+        show_background_results("comparison", comparison_jobs, comparison_label, render_comparison_results)
+
+    # Market overview across all countries from the memory-mapped price matrix, which a background job
+    # (re)builds if a price file changed, so this tab never waits for it
+    if st.session_state.year_option != 'Choose year':
+        st.markdown("---")
+        with st.expander(f"🌍 Market Overview: All Countries ({st.session_state.year_option})"):
+            overview_year = st.session_state.year_option
+            # Battery settings from the Optimization tab, or a 4h / 90% battery when it is off
+            overview_hours = int(st.session_state.storage_hours) or 4
+            overview_efficiency = (st.session_state.efficiency or 90) / 100
+            overview_jobs = submit_background("market_overview", [(
+                ("market_overview", overview_year, overview_hours, overview_efficiency, price_versions),
+                run_market_overview_job,
+                dict(year=overview_year, storage_hours=overview_hours, efficiency=overview_efficiency),
+            )])
+            show_background_results("market_overview", overview_jobs, f"the market overview ({overview_year})",
+                                    lambda results: render_market_overview(*results[0]))
+
+
+with tab6:
+    st.header("Solar PV")
+    st.title("On-site PV Self-Consumption")
+    st.markdown("---")
 
-            st.subheader("Comparison Summary Table")
-            st.dataframe(results_df.set_index("Country"), use_container_width=True)
+    st.sidebar.header("☀️ Solar PV Inputs")
+
+    pv_country = st.session_state.selected_optimization_country
+    pv_latitude_default, pv_longitude_default, pv_utc_offset = country_sites.get(pv_country, (50.0, 10.0, 1))
+    pv_peak_kw = st.sidebar.number_input("PV Peak Power (kWp)", min_value=0.0, value=5000.0, step=100.0, key="pv_peak_kw")
+    pv_source_options = ["Clear-sky model"] + pvgis_files()
+    pv_source = st.sidebar.selectbox("Production Profile", pv_source_options, key="pv_source",
+                                     help=f"Clear-sky model, or a PVGIS hourly export stored in {pv_data_dir}")
+    if pv_source == "Clear-sky model":
+        pv_latitude = st.sidebar.number_input("Latitude", min_value=-90.0, max_value=90.0, value=float(pv_latitude_default), key=f"pv_latitude_{pv_country}")
+        pv_longitude = st.sidebar.number_input("Longitude", min_value=-180.0, max_value=180.0, value=float(pv_longitude_default), key=f"pv_longitude_{pv_country}")
+        pv_tilt = st.sidebar.slider("Tilt (°)", min_value=0, max_value=90, value=35, key="pv_tilt")
+        pv_azimuth = st.sidebar.slider("Azimuth (° from south, west positive)", min_value=-180, max_value=180, value=0, key="pv_azimuth")
+        pv_losses = st.sidebar.slider("System Losses (%)", min_value=0, max_value=50, value=14, key="pv_losses")
+    else:
+        pv_export_kwp = st.sidebar.number_input("Exported System Size (kWp)", min_value=0.001, value=1.0, key="pv_export_kwp",
+                                                help="Peak power the PVGIS export was calculated for; the profile is scaled to the PV peak power above.")
 
-            st.subheader("Visual Comparison")
+    pv_year_options = data_catalog.years(pv_country) if pv_country else []
+    first_pv_year = st.session_state.year_option if st.session_state.year_option in pv_year_options else (pv_year_options[-1:] or ["2024"])[0]
+    pv_last_year = st.sidebar.selectbox("Simulate Through Year", [y for y in pv_year_options if y >= first_pv_year], key="pv_last_year")
 
-            # Bar chart for Total Costs
-            cost_columns_plot = [col for col in ["Total Spot Cost (€)", "Total Cost with Battery (€)", "Total Hybrid Cost (€)"] if col in results_df.columns and not results_df[col].isnull().all()]
-            if cost_columns_plot:
-                cost_df_plot = results_df.melt(id_vars=["Country"], value_vars=cost_columns_plot, var_name="Cost Type", value_name="Cost (€)")
-                fig_costs = px.bar(cost_df_plot, x="Country", y="Cost (€)", color="Cost Type",
-                                barmode="group", title="Total Annual Energy Costs by Country and Strategy")
-                st.plotly_chart(fig_costs, use_container_width=True)
+    if st.session_state.demand_option == 'Choose demand' or st.session_state.year_option == 'Choose year' or not pv_country:
+        st.info("Please select Demand Profile, Year, and Country in the 'Optimization' tab.")
+    else:
+        try:
+            pv_scenario = build_scenario(pv_country, first_pv_year, st.session_state.demand_option, last_year=pv_last_year,
+                                         annual_demand_mwh=st.session_state.annual_demand_mwh)
+            if pv_scenario is None or len(pv_scenario) == 0:
+                st.warning(f"Price data for {pv_country} in {first_pv_year}-{pv_last_year} not found at {price_file_for(pv_country)}.")
             else:
-                st.info("No cost data available for plotting. Ensure calculations are successful.")
+                if pv_source == "Clear-sky model":
+                    pv_site = PvSite(pv_latitude, pv_longitude, pv_utc_offset, peak_kw=pv_peak_kw, tilt=pv_tilt,
+                                     azimuth=pv_azimuth, system_losses=pv_losses)
+                    pv_kw = clear_sky_production(pv_site, pv_scenario.timestamps, pv_scenario.interval_hours())
+                else:
+                    pv_kw = pvgis_production(os.path.join(pv_data_dir, pv_source), pv_scenario.timestamps,
+                                             utc_offset=pv_utc_offset, scale=pv_peak_kw / pv_export_kwp)
+
+                # Battery settings come from the Optimization tab
+                pv_result = pv_battery_dispatch(
+                    pv_scenario, pv_kw, st.session_state.battery_capacity, st.session_state.efficiency,
+                    st.session_state.dod, st.session_state.storage_hours
+                )
 
+                period_label = first_pv_year if pv_last_year == first_pv_year else f"{first_pv_year}-{pv_last_year}"
+                st.subheader(f"{pv_country}, {period_label}: {pv_peak_kw:,.0f} kWp PV" + (
+                    f" with {st.session_state.battery_capacity:,.2f} MWh battery" if st.session_state.use_battery else ""))
+                pv_col1, pv_col2, pv_col3, pv_col4 = st.columns(4)
+                pv_col1.metric("PV Production", f"{pv_result.pv_production_kwh / 1000:,.0f} MWh")
+                pv_col2.metric("Self-Consumption", f"{pv_result.self_consumption_share:.1%}")
+                pv_col3.metric("Self-Sufficiency", f"{pv_result.self_sufficiency_share:.1%}")
+                pv_col4.metric("Net Energy Cost", f"€ {pv_result.net_cost:,.2f}",
+                               delta=f"-€ {pv_result.spot_only_cost - pv_result.net_cost:,.2f} vs. spot only", delta_color="inverse")
+
+                st.markdown(f"Grid import: **€ {pv_result.import_cost:,.2f}** · Export revenue at spot: **€ {pv_result.export_revenue:,.2f}**")
+
+                # Average day, in kW per hour of day
+                pv_hours = pv_scenario.hours().astype(np.int64)
+                hours_count = np.bincount(pv_hours, minlength=24)
+                demand_kw = pv_scenario.demand_kwh / pv_result.interval_hours
+                profile_df = pd.DataFrame({
+                    "Hour": np.arange(24),
+                    "Demand": np.bincount(pv_hours, weights=demand_kw, minlength=24) / hours_count,
+                    "PV": np.bincount(pv_hours, weights=pv_result.pv_kw, minlength=24) / hours_count,
+                    "Grid Import": np.bincount(pv_hours, weights=pv_result.import_kw, minlength=24) / hours_count,
+                    "Battery": np.bincount(pv_hours, weights=pv_result.battery_kw, minlength=24) / hours_count,
+                })
+                fig_pv = px.line(profile_df, x="Hour", y=["Demand", "PV", "Grid Import", "Battery"],
+                                 labels={"value": "Average Power (kW)", "variable": ""}, title="Average Daily Profile")
+                st.plotly_chart(fig_pv, use_container_width=True)
+        except Exception as e:
+            st.error(f"PV calculation error: {e}")
 
-            # Bar chart for LCOE
-            lcoe_columns_plot = [col for col in ["LCOE (Spot) (€/MWh)", "LCOE (Battery) (€/MWh)", "LCOE (Hybrid) (€/MWh)"] if col in results_df.columns and not results_df[col].isnull().all()]
-            if lcoe_columns_plot:
-                lcoe_df_plot = results_df.melt(id_vars=["Country"], value_vars=lcoe_columns_plot, var_name="LCOE Type", value_name="LCOE (€/MWh)")
-                fig_lcoe = px.bar(lcoe_df_plot, x="Country", y="LCOE (€/MWh)", color="LCOE Type",
-                                barmode="group", title="LCOE by Country and Strategy")
-                st.plotly_chart(fig_lcoe, use_container_width=True)
-            else:
-                st.info("No LCOE data available for plotting. Ensure calculations are successful.")
-            
-            # Bar chart for CO2 Emissions
-            if "Total CO2 Emissions (tonnes CO2eq)" in results_df.columns and not results_df["Total CO2 Emissions (tonnes CO2eq)"].isnull().all():
-                fig_co2 = px.bar(results_df, x="Country", y="Total CO2 Emissions (tonnes CO2eq)",
-                                 title="Total Annual CO2 Emissions by Country")
-                st.plotly_chart(fig_co2, use_container_width=True)
-            else:
-                st.info("No CO2 emissions data available for plotting. Please ensure 'carbon.csv' is correctly loaded and data exists for selected countries/years.")
-        else:
-            st.info("No data to display comparison. Ensure inputs in Optimization tab are selected and data files exist.")
\ No newline at end of file
+
+with tab7:
+    st.header("Portfolio")
+    st.title("Multi-Site Portfolio with Shared PPAs")
+    st.markdown("---")
+
+    st.sidebar.header("🏭 Portfolio Inputs")
+    portfolio_years = data_catalog.all_years()
+    portfolio_year = st.sidebar.selectbox("Portfolio Year", sorted(portfolio_years, reverse=True) or ["2024"], key="portfolio_year")
+
+    st.markdown("Each site buys at its own country's spot prices, with its own demand and battery (capacity 0 = none). "
+                "Each hour, the PPAs cover the demand left after the batteries in table order, split across their sites "
+                "in proportion to that demand; list site names under **Sites** to restrict a PPA, or leave it empty for all sites.")
+    default_country = st.session_state.selected_optimization_country or (all_countries[0] if all_countries else "")
+    default_sites = pd.DataFrame([
+        {"Site": "Plant 1", "Country": default_country, "Demand Profile": "10 MWh", "Annual Demand (MWh)": 0.0,
+         "Battery (MWh)": 13.89, "Efficiency (%)": 90, "DoD (%)": 80, "Storage Hours": 4},
+        {"Site": "Plant 2", "Country": all_countries[(all_countries.index(default_country) + 1) % len(all_countries)] if default_country in all_countries else default_country,
+         "Demand Profile": "5 MWh", "Annual Demand (MWh)": 0.0, "Battery (MWh)": 0.0, "Efficiency (%)": 90, "DoD (%)": 80, "Storage Hours": 4},
+    ])
+    site_df = st.data_editor(default_sites, num_rows="dynamic", hide_index=True, use_container_width=True, key="portfolio_sites",
+                             column_config={
+                                 "Country": st.column_config.SelectboxColumn(options=all_countries, required=True),
+                                 "Demand Profile": st.column_config.SelectboxColumn(options=demand_profile_names(st.session_state.demand_uploads), required=True),
+                                 "Annual Demand (MWh)": st.column_config.NumberColumn(min_value=0.0, help="0 = as profile"),
+                                 "Battery (MWh)": st.column_config.NumberColumn(min_value=0.0),
+                                 "Efficiency (%)": st.column_config.NumberColumn(min_value=0, max_value=100),
+                                 "DoD (%)": st.column_config.NumberColumn(min_value=0, max_value=100),
+                                 "Storage Hours": st.column_config.NumberColumn(min_value=1, max_value=24),
+                             })
+    default_contracts = pd.DataFrame([{"PPA": "PPA 1", "Price (€/MWh)": 40.0, "Volume (MWh/day)": 6.0, "Sites": ""}])
+    contract_df = st.data_editor(default_contracts, num_rows="dynamic", hide_index=True, use_container_width=True, key="portfolio_contracts",
+                                 column_config={
+                                     "Price (€/MWh)": st.column_config.NumberColumn(),
+                                     "Volume (MWh/day)": st.column_config.NumberColumn(min_value=0.0),
+                                     "Sites": st.column_config.TextColumn(help="Comma-separated site names; empty = all sites"),
+                                 })
+
+    site_rows = tuple(
+        (str(row["Site"]), row["Country"], row["Demand Profile"], float(row["Annual Demand (MWh)"] or 0.0),
+         float(row["Battery (MWh)"] or 0.0), int(row["Efficiency (%)"] or 0), int(row["DoD (%)"] or 0), int(row["Storage Hours"] or 0))
+        for row in site_df.dropna(subset=["Site", "Country", "Demand Profile"]).to_dict("records")
+    )
+    contract_rows = tuple(
+        (str(row["PPA"]), float(row["Price (€/MWh)"] or 0.0), float(row["Volume (MWh/day)"] or 0.0), str(row["Sites"] or ""))
+        for row in contract_df.dropna(subset=["PPA"]).to_dict("records")
+    )
+    if not site_rows:
+        st.info("Add at least one site with a country and demand profile.")
+    else:
+        portfolio_jobs = submit_background("portfolio", [(
+            ("portfolio", site_rows, contract_rows, portfolio_year),
+            run_portfolio_job,
+            dict(site_rows=site_rows, contract_rows=contract_rows, year=portfolio_year),
+        )])
+        show_background_results("portfolio", portfolio_jobs, f"the {len(site_rows)}-site portfolio ({portfolio_year})",
+                                lambda results: render_portfolio_results(results[0]))
+
+
+with tab8:
+    st.header("Market Analytics")
+    st.title("Price Spreads, Volatility and Negative Prices")
+    st.markdown("---")
+
+    st.sidebar.header("📊 Market Analytics Inputs")
+    analytics_years = data_catalog.all_years()
+    analytics_year = st.sidebar.selectbox("Analytics Year", sorted(analytics_years, reverse=True) or ["2024"], key="analytics_year")
+
+    # Precomputed per country and year in .cache/analytics by a background job, which only recomputes
+    # countries whose prices changed; the tab shows its progress instead of waiting for it
+    analytics_jobs = submit_background("market_analytics", [(
+        ("market_analytics", price_versions), run_price_analytics_job, {},
+    )])
+    show_background_results("market_analytics", analytics_jobs, "the market analytics",
+                            lambda results: render_market_analytics(results[0], analytics_year))
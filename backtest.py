@@ -0,0 +1,210 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from catalog import load_catalog
+from engine import ScenarioCancelled
+from price_store import daily_grid, load_price_series, widen_prices
+
+# Forecast-driven dispatch backtest.
+# The dashboard's battery arbitrage picks each day's cheapest and most expensive hours knowing the
+# actual prices. Here the same rule picks them from a day-ahead price forecast instead, and the schedule
+# is valued at the actual prices, so the share of the perfect-foresight value a real operator would
+# capture can be measured per country and year.
+#
+#   python backtest.py --countries Germany Spain --storage-hours 4 --out backtest.csv
+#
+# Prices are laid out as a (day, hour) grid and every forecast is computed for all days at once from
+# earlier days only. A forecaster is any function (prices, days) -> forecast of the same shape; add one
+# to `forecasters` to include it.
+
+# Days of history behind the seasonal profile
+profile_days = 28
+
+# Trailing window of the regression fit, refitted every month, and the minimum history for a fit
+regression_window_days = 365
+regression_min_days = 56
+
+
+def _lagged(prices: np.ndarray, days: int) -> np.ndarray:
+    lagged = np.full_like(prices, np.nan)
+    lagged[days:] = prices[:-days]
+    return lagged
+
+
+def persistence_forecast(prices: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Tomorrow looks like today."""
+    return _lagged(prices, 1)
+
+
+def same_weekday_forecast(prices: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Tomorrow looks like the same weekday last week."""
+    return _lagged(prices, 7)
+
+
+def seasonal_profile_forecast(prices: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Every hour is the average of that hour over the previous `profile_days` days."""
+    valid = ~np.isnan(prices)
+    totals = np.vstack([np.zeros((1, 24)), np.cumsum(np.where(valid, prices, 0.0), axis=0)])
+    counts = np.vstack([np.zeros((1, 24)), np.cumsum(valid, axis=0)])
+    first = np.maximum(np.arange(len(prices)) - profile_days, 0)
+    window_totals = totals[:-1] - totals[first]
+    window_counts = counts[:-1] - counts[first]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # At least half of the window, so the first days of the history have no forecast
+        return np.where(window_counts >= profile_days / 2, window_totals / window_counts, np.nan)
+
+
+def regression_forecast(prices: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """
+    Linear regression on yesterday's, last week's and the seasonal-profile price of the same hour, refitted
+    at the start of every month on the trailing `regression_window_days` days. All monthly fits are solved
+    at once from cumulative sums of the normal equations.
+    """
+    features = np.stack([np.ones_like(prices), _lagged(prices, 1), _lagged(prices, 7),
+                         seasonal_profile_forecast(prices, days)], axis=2)  # (day, hour, feature)
+    usable = ~np.isnan(features).any(axis=2) & ~np.isnan(prices)
+    x = np.where(usable[:, :, None], features, 0.0)
+    y = np.where(usable, prices, 0.0)
+    # Per-day sums of x x^T and x y, accumulated so any window of days is a difference of two rows
+    xtx = np.vstack([np.zeros((1, 4, 4)), np.cumsum(np.einsum("dhi,dhj->dij", x, x), axis=0)])
+    xty = np.vstack([np.zeros((1, 4)), np.cumsum(np.einsum("dhi,dh->di", x, y), axis=0)])
+    rows = np.concatenate([[0], np.cumsum(usable.sum(axis=1))])
+
+    months = days.astype("datetime64[M]")
+    fit_days = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])  # first day of every month
+    first = np.maximum(fit_days - regression_window_days, 0)
+    a = xtx[fit_days] - xtx[first]
+    b = xty[fit_days] - xty[first]
+    # A small ridge term keeps the fit solvable when a window has (nearly) constant prices
+    a += np.eye(4) * (1e-6 * np.trace(a, axis1=1, axis2=2)[:, None, None] + 1e-9)
+    coefficients = np.linalg.solve(a, b[:, :, None])[:, :, 0]
+    enough = (rows[fit_days] - rows[first]) >= regression_min_days * 24
+
+    month_of_day = np.repeat(np.arange(len(fit_days)), np.diff(np.r_[fit_days, len(days)]))
+    forecast = np.einsum("dhi,di->dh", features, coefficients[month_of_day])
+    return np.where(enough[month_of_day][:, None], forecast, np.nan)
+
+
+forecasters = {
+    "Persistence": persistence_forecast,
+    "Same Weekday": same_weekday_forecast,
+    "Seasonal Profile": seasonal_profile_forecast,
+    "Regression": regression_forecast,
+}
+
+
+def _daily_arbitrage_value(prices: np.ndarray, ranking: np.ndarray, storage_hours: int, power_mw: float,
+                           efficiency: float, dod: float) -> np.ndarray:
+    """
+    Value of each day when the battery charges in the `storage_hours` hours `ranking` calls cheapest and
+    discharges in the ones it calls most expensive, at the actual `prices` (the rule of
+    engine.battery_arbitrage_savings).
+    """
+    order = np.argsort(ranking, axis=1, kind="stable")
+    charge = np.take_along_axis(prices, order[:, :storage_hours], axis=1).sum(axis=1)
+    discharge = np.take_along_axis(prices, order[:, -storage_hours:], axis=1).sum(axis=1)
+    return discharge * power_mw * efficiency * dod - charge * power_mw
+
+
+def _step(progress, cancel_event, fraction):
+    if cancel_event is not None and cancel_event.is_set():
+        raise ScenarioCancelled()
+    if progress is not None:
+        progress(fraction)
+
+
+def backtest_country(country: str, battery_capacity=13.89, efficiency=90, dod=80, storage_hours=4,
+                     forecast_names=None, progress=None, cancel_event=None) -> pd.DataFrame:
+    """
+    Captured arbitrage value of every forecast against perfect foresight, per year of the country's history.
+    Only days on which every forecast and the actual prices are complete are compared. `cancel_event` is
+    polled before every forecast is computed and valued; once set the run stops with ScenarioCancelled.
+    """
+    series = load_price_series(country)
+    if series is None or storage_hours <= 0:
+        return pd.DataFrame()
+    prices, days = daily_grid(series.timestamps, widen_prices(series.price, series.decimals))
+    names = list(forecast_names or forecasters)
+    forecasts = {}
+    for i, name in enumerate(names):
+        _step(progress, cancel_event, 0.8 * i / len(names))
+        forecasts[name] = forecasters[name](prices, days)
+
+    complete = ~np.isnan(prices).any(axis=1)
+    for forecast in forecasts.values():
+        complete &= ~np.isnan(forecast).any(axis=1)
+    prices, days = prices[complete], days[complete]
+    power_mw = battery_capacity / storage_hours
+    perfect = _daily_arbitrage_value(prices, prices, storage_hours, power_mw, efficiency / 100, dod / 100)
+
+    years = days.astype("datetime64[Y]").astype(np.int64) + 1970
+    unique_years, year_index = np.unique(years, return_inverse=True)
+    day_counts = np.bincount(year_index, minlength=len(unique_years))
+    perfect_by_year = np.bincount(year_index, weights=perfect, minlength=len(unique_years))
+    frames = []
+    for i, (name, forecast) in enumerate(forecasts.items()):
+        _step(progress, cancel_event, 0.8 + 0.2 * i / len(forecasts))
+        forecast = forecast[complete]
+        value = _daily_arbitrage_value(prices, forecast, storage_hours, power_mw, efficiency / 100, dod / 100)
+        value_by_year = np.bincount(year_index, weights=value, minlength=len(unique_years))
+        mae = np.bincount(year_index, weights=np.abs(forecast - prices).mean(axis=1), minlength=len(unique_years))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frames.append(pd.DataFrame({
+                "Country": country,
+                "Year": unique_years.astype(str),
+                "Forecast": name,
+                "Days": day_counts,
+                "Forecast MAE (€/MWh)": mae / np.maximum(day_counts, 1),
+                "Perfect Foresight Value (€)": perfect_by_year,
+                "Forecast Value (€)": value_by_year,
+                "Captured (%)": value_by_year / perfect_by_year * 100,
+            }))
+
+    _step(progress, cancel_event, 1.0)
+    results = pd.concat(frames, ignore_index=True)
+    # Only years the catalog considers covered; partial years would not compare with the dashboard
+    return results[results["Year"].isin(load_catalog().years(country))].reset_index(drop=True)
+
+
+def run_backtest(countries: list, workers: int = None, **params) -> pd.DataFrame:
+    """backtest_country for every country, spread over worker processes."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(backtest_country, country, **params) for country in countries]
+        frames = [future.result() for future in futures]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def main():
+    catalog = load_catalog()
+    parser = argparse.ArgumentParser(description="Backtest forecast-driven battery arbitrage against perfect foresight.")
+    parser.add_argument("--countries", nargs="+", default=catalog.countries(), choices=catalog.countries())
+    parser.add_argument("--forecasts", nargs="+", default=list(forecasters), choices=list(forecasters))
+    parser.add_argument("--battery-capacity", type=float, default=13.89, help="MWh")
+    parser.add_argument("--efficiency", type=int, default=90)
+    parser.add_argument("--dod", type=int, default=80)
+    parser.add_argument("--storage-hours", type=int, default=4)
+    parser.add_argument("--out", default="backtest.csv")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_backtest(args.countries, args.workers, battery_capacity=args.battery_capacity,
+                           efficiency=args.efficiency, dod=args.dod, storage_hours=args.storage_hours,
+                           forecast_names=args.forecasts)
+    if os.path.dirname(args.out):
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    results.to_csv(args.out, index=False)
+
+    totals = results.groupby("Forecast", sort=False)[["Forecast Value (€)", "Perfect Foresight Value (€)"]].sum()
+    for name, row in totals.iterrows():
+        print(f"{name:<18} captures {row['Forecast Value (€)'] / row['Perfect Foresight Value (€)']:.1%} of perfect foresight")
+    print(f"Backtested {len(args.countries)} countries in {time.perf_counter() - start:.1f} s, wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Data catalog.
+# Every CSV under data/ is described once in a manifest (.cache/catalog.json): source, country, row
+# count, resolution, per-year coverage and a checksum. Later startups only stat the files and re-scan
+# the ones that changed, so the cost of listing what is available does not grow with the data; the
+# series themselves are loaded lazily by price_store on first use.
+#
+# Layout understood by the scan:
+#   data/europe_prices/<country>_<anything>.csv   multi-year spot prices of a country
+#   data/ind_data/<country>_<year>.csv            single-year spot prices of a country
+#   data/<source>_<year>.csv                      other hourly series, e.g. dh_prices_2024.csv
+# Adding a country or year only needs a new file.
+
+data_dir = "data"
+europe_prices_dir = os.path.join(data_dir, "europe_prices")
+yearly_prices_dir = os.path.join(data_dir, "ind_data")
+manifest_path = os.path.join(".cache", "catalog.json")
+
+# Spot price sources in order of precedence, when a country's files overlap
+price_sources = ("europe_prices", "ind_data")
+
+# A year is offered in the selectors once this share of its hours has prices
+min_year_coverage = 0.95
+
+# ISO 3166 codes for flags; countries missing here simply show no flag
+country_codes = {
+    "Austria": "at", "Belgium": "be", "Bulgaria": "bg", "Croatia": "hr", "Czechia": "cz", "Denmark": "dk",
+    "Estonia": "ee", "Finland": "fi", "France": "fr", "Germany": "de", "Greece": "gr", "Hungary": "hu",
+    "Italy": "it", "Latvia": "lv", "Lithuania": "lt", "Luxembourg": "lu", "Netherlands": "nl", "Norway": "no",
+    "Poland": "pl", "Portugal": "pt", "Romania": "ro", "Slovakia": "sk", "Slovenia": "si", "Spain": "es",
+    "Sweden": "se", "Switzerland": "ch",
+}
+
+_manifest_version = 1
+
+
+def _split_name(path: str):
+    """'data/ind_data/austria_2015.csv' -> ('Austria', '2015'); trailing numeric parts are not part of the name."""
+    parts = os.path.splitext(os.path.basename(path))[0].lower().split("_")
+    name_parts = []
+    for part in parts:
+        if part.isdigit():
+            break
+        name_parts.append(part)
+    year = parts[len(name_parts)] if len(name_parts) < len(parts) and len(parts[len(name_parts)]) == 4 else None
+    return " ".join(name_parts), year
+
+
+def _discover() -> dict:
+    """(path -> source) for every CSV the catalog describes."""
+    found = {}
+    for source, directory in (("europe_prices", europe_prices_dir), ("ind_data", yearly_prices_dir)):
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if entry.is_file() and entry.name.lower().endswith(".csv"):
+                    found[entry.path] = source
+    if os.path.isdir(data_dir):
+        for entry in os.scandir(data_dir):
+            if entry.is_file() and entry.name.lower().endswith(".csv"):
+                found[entry.path] = _split_name(entry.path)[0].replace(" ", "_")
+    return found
+
+
+def _describe(path: str, source: str) -> dict:
+    """Reads one file and summarizes it for the manifest."""
+    with open(path, "rb") as f:
+        content = f.read()
+    entry = {"source": source, "sha1": hashlib.sha1(content).hexdigest()}
+    name, year = _split_name(path)
+    if source in price_sources:
+        entry["country"] = name.title()
+    entry["file_year"] = year
+
+    try:
+        df = pd.read_csv(path, encoding="utf-8-sig")
+    except Exception as e:
+        entry["error"] = str(e)
+        return entry
+    entry["rows"] = len(df)
+    entry["columns"] = list(df.columns)
+    if "timestamp" not in df.columns or len(df) == 0:
+        return entry
+
+    timestamps = pd.to_datetime(df["timestamp"]).to_numpy().astype("datetime64[ns]")
+    value_column = next((c for c in df.columns if c != "timestamp"), None)
+    values = pd.to_numeric(df[value_column], errors="coerce").to_numpy(dtype=np.float64) if value_column else np.zeros(len(df))
+    steps = np.diff(np.sort(timestamps)).astype("timedelta64[m]").astype(np.int64)
+    resolution = int(np.median(steps)) if len(steps) else 60
+
+    years = timestamps.astype("datetime64[Y]")
+    valid = ~np.isnan(values)
+    coverage = {}
+    for y in np.unique(years):
+        in_year = years == y
+        hours_in_year = ((y + 1).astype("datetime64[h]") - y.astype("datetime64[h]")).astype(np.int64)
+        coverage[str(y)] = {
+            "rows": int(in_year.sum()),
+            "missing_values": int((in_year & ~valid).sum()),
+            "coverage": round(min(float((in_year & valid).sum()) * resolution / 60 / hours_in_year, 1.0), 4),
+        }
+    entry.update({
+        "value_column": value_column,
+        "first": str(timestamps.min()),
+        "last": str(timestamps.max()),
+        "resolution_minutes": resolution,
+        "missing_values": int((~valid).sum()),
+        "years": coverage,
+    })
+    return entry
+
+
+class DataCatalog:
+    """What data/ contains, from the manifest. Nothing here reads the data files themselves."""
+
+    def __init__(self, files: dict):
+        self.files = files  # path -> manifest entry
+
+    def _price_entries(self, country: str = None) -> list:
+        entries = [(path, entry) for path, entry in self.files.items()
+                   if entry["source"] in price_sources and "years" in entry
+                   and (country is None or entry["country"] == country)]
+        return sorted(entries, key=lambda item: (price_sources.index(item[1]["source"]), item[0]))
+
+    def countries(self) -> list:
+        return sorted({entry["country"] for _, entry in self._price_entries() if self.years(entry["country"])})
+
+    def years(self, country: str, min_coverage: float = min_year_coverage) -> list:
+        """Years with prices for at least `min_coverage` of their hours, as strings."""
+        coverage = {}
+        for _, entry in self._price_entries(country):
+            for year, stats in entry["years"].items():
+                coverage[year] = max(coverage.get(year, 0.0), stats["coverage"])
+        return sorted(year for year, share in coverage.items() if share >= min_coverage)
+
+    def all_years(self) -> list:
+        return sorted({year for country in self.countries() for year in self.years(country)})
+
+    def countries_for_year(self, year) -> list:
+        return [country for country in self.countries() if str(year) in self.years(country)]
+
+    def price_files(self, country: str) -> list:
+        """A country's spot price files, highest precedence first."""
+        return [path for path, _ in self._price_entries(country)]
+
+    def source_files(self, source: str) -> dict:
+        """year -> path of the single-year files of a source, e.g. source_files("dh_prices")."""
+        return {entry["file_year"]: path for path, entry in sorted(self.files.items())
+                if entry["source"] == source and entry.get("file_year")}
+
+    def version(self, country: str) -> str:
+        """Changes whenever any of the country's price files changes."""
+        return ",".join(self.files[path]["sha1"][:12] for path in self.price_files(country)) or "missing"
+
+    def summary(self) -> pd.DataFrame:
+        """One row per file and year, for display."""
+        rows = []
+        for path, entry in sorted(self.files.items()):
+            for year, stats in entry.get("years", {}).items():
+                rows.append({
+                    "Source": entry["source"], "Country": entry.get("country", ""), "Year": year,
+                    "Rows": stats["rows"], "Coverage (%)": stats["coverage"] * 100,
+                    "Missing Values": stats["missing_values"], "Resolution (min)": entry["resolution_minutes"],
+                    "File": os.path.relpath(path, data_dir),
+                })
+        return pd.DataFrame(rows)
+
+
+# load_catalog is on every scenario's path; data/ is stat-ed again at most this often
+catalog_check_seconds = 5.0
+
+# (DataCatalog, file stamps, time of the last check), replaced as one tuple so that the lock-free fast
+# path in load_catalog never sees a catalog without its check time
+_state = None
+_lock = threading.Lock()
+
+
+def _stat_stamp(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def load_catalog(refresh: bool = False) -> DataCatalog:
+    """
+    The catalog of data/, re-scanning only files that were added or changed since the manifest was written.
+    Within `catalog_check_seconds` of the last check the in-memory catalog is returned without touching
+    the disk, unless `refresh` is set.
+    """
+    global _state
+    now = time.monotonic()
+    state = _state
+    if not refresh and state is not None and now - state[2] < catalog_check_seconds:
+        return state[0]
+    discovered = _discover()
+    stamps = {path: _stat_stamp(path) for path in discovered}
+
+    with _lock:
+        # Under the lock, so a thread that saw the old stamps never replaces a catalog published meanwhile
+        if _state is not None and stamps == _state[1]:
+            _state = (_state[0], stamps, now)
+            return _state[0]
+        manifest = {}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, encoding="utf-8") as f:
+                    stored = json.load(f)
+                if stored.get("version") == _manifest_version:
+                    manifest = stored["files"]
+            except (OSError, ValueError):
+                manifest = {}
+
+        files, changed = {}, False
+        for path, source in discovered.items():
+            cached = manifest.get(path)
+            if cached is not None and cached["stamp"] == stamps[path] and cached["source"] == source:
+                files[path] = cached
+            else:
+                files[path] = dict(_describe(path, source), stamp=stamps[path])
+                changed = True
+        if changed or set(files) != set(manifest):
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+            tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": _manifest_version, "files": files}, f, indent=1)
+            os.replace(tmp_path, manifest_path)
+
+        data_catalog = DataCatalog(files)
+        _state = (data_catalog, stamps, now)
+        return data_catalog
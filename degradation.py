@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+
+from catalog import load_catalog
+from price_store import daily_grid, load_price_series, widen_prices
+
+# Battery ageing and lifetime economics.
+# The daily arbitrage (engine.battery_arbitrage_savings) is replayed year by year over a multi-year
+# horizon. Each year's state of charge is cycle-counted with rainflow, cycle and calendar ageing reduce
+# the capacity the next year can use, and the battery is replaced once it reaches its end of life. The
+# yearly savings, costs and discharged energy give the NPV and the levelized cost of storage (LCOS).
+
+# Cycle life: cycles to end of life at `cycle_life_dod`; deeper cycles wear faster (Woehler curve)
+cycle_life = 6000
+cycle_life_dod = 0.8
+cycle_life_exponent = 1.3
+
+# Calendar fade grows with the square root of the battery's age (share of capacity after one year)
+calendar_fade_first_year = 0.02
+
+# The battery is replaced once its state of health falls below this share of the nominal capacity
+end_of_life_soh = 0.8
+
+# Economics
+battery_capex_eur_mwh = 300_000.0
+battery_opex_share = 0.015  # fixed O&M per year, share of the capex
+replacement_cost_share = 0.6  # a replacement costs this share of today's capex
+discount_rate = 0.07
+horizon_years = 10
+
+
+class DegradationResult:
+    """Year-by-year battery ageing and cash flows over a multi-year horizon, with NPV and LCOS."""
+
+    columns = ("price_year", "soh_start", "soh_end", "equivalent_full_cycles", "cycle_fade", "calendar_fade",
+               "savings", "savings_without_ageing", "charging_cost", "discharged_mwh", "opex", "replacement_cost")
+
+    def __init__(self, years: int):
+        for name in self.columns:
+            setattr(self, name, np.zeros(years, dtype=np.float64))
+        self.capex = 0.0
+        self.discount_rate = 0.0
+
+    def _discount(self) -> np.ndarray:
+        # Cash flows at the end of years 1..n
+        return (1 + self.discount_rate) ** -np.arange(1, len(self.savings) + 1)
+
+    @property
+    def npv(self) -> float:
+        """Net present value of the battery: discounted savings minus capex, O&M and replacements."""
+        return float(-self.capex + np.sum((self.savings - self.opex - self.replacement_cost) * self._discount()))
+
+    @property
+    def npv_without_ageing(self) -> float:
+        return float(-self.capex + np.sum((self.savings_without_ageing - self.opex) * self._discount()))
+
+    @property
+    def lcos(self) -> float:
+        """Levelized cost of storage (€/MWh discharged): capex plus discounted O&M, replacements and charging energy."""
+        discount = self._discount()
+        discharged = np.sum(self.discharged_mwh * discount)
+        costs = self.capex + np.sum((self.opex + self.replacement_cost + self.charging_cost) * discount)
+        return float(costs / discharged) if discharged > 0 else float("nan")
+
+    def yearly_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "Year": np.arange(1, len(self.savings) + 1),
+            "Price Year": self.price_year.astype(int),
+            "State of Health, Start (%)": self.soh_start * 100,
+            "State of Health, End (%)": self.soh_end * 100,
+            "Equivalent Full Cycles": self.equivalent_full_cycles,
+            "Savings (€)": self.savings,
+            "Savings without Ageing (€)": self.savings_without_ageing,
+            "O&M (€)": self.opex,
+            "Replacement (€)": self.replacement_cost,
+            "Discounted Cash Flow (€)": (self.savings - self.opex - self.replacement_cost) * self._discount(),
+        })
+
+
+def _reversals(profiles: np.ndarray, lengths: np.ndarray):
+    """Turning points of every row of `profiles` (padded with NaN beyond `lengths`), as a new padded array."""
+    n, width = profiles.shape
+    columns = np.arange(width)
+    valid = columns < lengths[:, None]
+    # Drop repeated levels, then points that lie on a monotonic stretch
+    keep = valid.copy()
+    keep[:, 1:] &= profiles[:, 1:] != profiles[:, :-1]
+    profiles, lengths = _compact(profiles, keep)
+    valid = np.arange(profiles.shape[1]) < lengths[:, None]
+    rising = np.diff(profiles, axis=1) > 0
+    turning = np.ones(profiles.shape, dtype=bool)
+    turning[:, 1:-1] = rising[:, 1:] != rising[:, :-1]
+    last = np.maximum(lengths - 1, 0)
+    turning[np.arange(n), last] = True
+    return _compact(profiles, turning & valid)
+
+
+def _compact(values: np.ndarray, keep: np.ndarray):
+    """Moves the kept entries of every row to its front; the rest becomes NaN."""
+    order = np.argsort(~keep, axis=1, kind="stable")
+    compacted = np.take_along_axis(np.where(keep, values, np.nan), order, axis=1)
+    lengths = keep.sum(axis=1)
+    width = max(int(lengths.max()) if len(lengths) else 0, 1)
+    return compacted[:, :width], lengths
+
+
+def rainflow_closed(profiles: np.ndarray):
+    """
+    Rainflow cycle counting of closed profiles (rows that end where they start, e.g. one day of a battery
+    that returns to its starting charge), all rows at once. Returns (row, range, count) of every cycle
+    found; the count is 1 for full cycles and 0.5 for the residue.
+    """
+    n, width = profiles.shape
+    points, lengths = _reversals(profiles, np.full(n, width))
+    # A closed profile rotated to start (and end) at its maximum contains only full cycles
+    loop = np.maximum(lengths - 1, 1)
+    start = np.nanargmax(np.where(np.arange(points.shape[1]) < loop[:, None], points, -np.inf), axis=1)
+    positions = (np.arange(points.shape[1] + 1)[None, :] + start[:, None]) % loop[:, None]
+    rotated = np.take_along_axis(points, positions, axis=1)
+    rotated, lengths = _reversals(rotated, np.minimum(loop + 1, positions.shape[1]))
+
+    # The three-point stack algorithm, one step for every row at a time
+    rows = np.arange(n)
+    stack = np.zeros((n, rotated.shape[1]))
+    top = np.zeros(n, dtype=np.int64)
+    cycle_rows, cycle_ranges = [], []
+    for j in range(rotated.shape[1]):
+        pushing = j < lengths
+        stack[pushing, top[pushing]] = rotated[pushing, j]
+        top[pushing] += 1
+        while True:
+            candidates = rows[top >= 3]
+            a, b, c = (stack[candidates, top[candidates] - k] for k in (3, 2, 1))
+            closes = np.abs(c - b) >= np.abs(b - a)
+            if not closes.any():
+                break
+            closing = candidates[closes]
+            cycle_rows.append(closing)
+            cycle_ranges.append(np.abs(b - a)[closes])
+            stack[closing, top[closing] - 3] = c[closes]
+            top[closing] -= 2
+
+    full_rows = np.concatenate(cycle_rows) if cycle_rows else np.zeros(0, dtype=np.int64)
+    full_ranges = np.concatenate(cycle_ranges) if cycle_ranges else np.zeros(0)
+    residue = np.abs(np.diff(stack, axis=1))
+    in_residue = np.arange(residue.shape[1])[None, :] < (top - 1)[:, None]
+    half_rows, half_columns = np.nonzero(in_residue & (residue > 0))
+    return (np.r_[full_rows, half_rows], np.r_[full_ranges, residue[half_rows, half_columns]],
+            np.r_[np.ones(len(full_rows)), np.full(len(half_rows), 0.5)])
+
+
+def _arbitrage_year(prices: np.ndarray, storage_hours: int, dod: float):
+    """
+    The daily arbitrage of one year of (day, hour) prices: charge and discharge masks, and the state of
+    charge of every day (25 points from midnight to midnight) as a share of the capacity in use.
+    """
+    n_valid = (~np.isnan(prices)).sum(axis=1, keepdims=True)
+    rank = np.empty(prices.shape, dtype=np.int64)
+    np.put_along_axis(rank, np.argsort(prices, axis=1, kind="stable"),
+                      np.broadcast_to(np.arange(24), prices.shape), axis=1)
+    charge = (rank < storage_hours) & ~np.isnan(prices)
+    discharge = (rank >= n_valid - storage_hours) & ~np.isnan(prices)
+    # Each day charges and discharges the same energy, so its profile is closed; it is placed so that its
+    # lowest point sits at the bottom of the depth-of-discharge window
+    steps = (charge.astype(np.float64) - discharge) * dod / storage_hours
+    level = np.hstack([np.zeros((len(prices), 1)), np.cumsum(steps, axis=1)])
+    soc = 1 - dod + level - level.min(axis=1, keepdims=True)
+    return charge, discharge, soc
+
+
+def cycles_to_failure(depth: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore"):
+        return cycle_life * (cycle_life_dod / np.asarray(depth, dtype=np.float64)) ** cycle_life_exponent
+
+
+def degradation_economics(country: str, first_year, battery_capacity, efficiency=90, dod=80, storage_hours=4,
+                          years=horizon_years, capex_eur_mwh=battery_capex_eur_mwh, rate=discount_rate) -> DegradationResult:
+    """
+    Replays the daily arbitrage for `years` years from `first_year`, on that year's prices and the following
+    ones (the last year with prices repeats once the history ends), with the capacity reduced by ageing and
+    restored by replacements. Returns None if the country has no prices for `first_year`.
+    """
+    series = load_price_series(country)
+    if series is None or storage_hours <= 0 or battery_capacity <= 0:
+        return None
+    # Years the catalog considers covered, so a partial last year is not repeated
+    available = [int(year) for year in load_catalog().years(country)]
+    first_year = int(first_year)
+    if not available or first_year not in available:
+        return None
+    price_years = [min(first_year + k, available[-1]) for k in range(years)]
+
+    eta, depth = efficiency / 100, dod / 100
+    per_price_year = {}
+    for price_year in sorted(set(price_years)):
+        year_range = series.year_slice(price_year)
+        prices, _ = daily_grid(series.timestamps[year_range], widen_prices(series.price[year_range], series.decimals))
+        charge, discharge, soc = _arbitrage_year(prices, storage_hours, depth)
+        rows, ranges, counts = rainflow_closed(soc)
+        per_price_year[price_year] = {
+            "charge_price_hours": np.nansum(np.where(charge, prices, 0.0)),
+            "discharge_price_hours": np.nansum(np.where(discharge, prices, 0.0)),
+            "charge_hours": int(charge.sum()),
+            "discharge_hours": int(discharge.sum()),
+            # Share of the cycle life used; depths relative to the capacity in use
+            "cycle_damage": float(np.sum(counts / cycles_to_failure(ranges))),
+            "equivalent_full_cycles": float(np.sum(counts * ranges)),
+        }
+
+    result = DegradationResult(years)
+    soh, age, cycle_fade = 1.0, 0.0, 0.0
+    for k, price_year in enumerate(price_years):
+        stats = per_price_year[price_year]
+        power = battery_capacity * soh / storage_hours
+        result.price_year[k] = price_year
+        result.soh_start[k] = soh
+        result.equivalent_full_cycles[k] = stats["equivalent_full_cycles"]
+        result.charging_cost[k] = stats["charge_price_hours"] * power
+        result.savings[k] = stats["discharge_price_hours"] * power * eta * depth - result.charging_cost[k]
+        result.savings_without_ageing[k] = (stats["discharge_price_hours"] * eta * depth - stats["charge_price_hours"]) * battery_capacity / storage_hours
+        result.discharged_mwh[k] = stats["discharge_hours"] * power * eta * depth
+        result.opex[k] = capex_eur_mwh * battery_capacity * battery_opex_share
+
+        age += 1
+        cycle_fade += (1 - end_of_life_soh) * stats["cycle_damage"]
+        calendar_fade = calendar_fade_first_year * np.sqrt(age)
+        result.cycle_fade[k] = cycle_fade
+        result.calendar_fade[k] = calendar_fade
+        soh = 1 - cycle_fade - calendar_fade
+        result.soh_end[k] = soh
+        if soh < end_of_life_soh and k < years - 1:
+            result.replacement_cost[k] = capex_eur_mwh * battery_capacity * replacement_cost_share
+            soh, age, cycle_fade = 1.0, 0.0, 0.0
+
+    result.capex = capex_eur_mwh * battery_capacity
+    result.discount_rate = rate
+    return result
@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from catalog import data_dir
+from price_store import ProfileSeries, interval_hours, load_profile_series, map_typical_year
+
+# Demand profile library.
+# Besides the flat presets, demand can follow a measured load shape: a CSV with timestamp and
+# demand_kWh columns (hourly or finer), bundled under data/ or uploaded in the dashboard. Shapes are
+# kept as float32 ProfileSeries, mapped onto any price year by month, day and hour, and can be scaled
+# to an annual volume.
+# An upload belongs to the dashboard session that uploaded it: the session holds the only strong reference
+# and is the only one that lists it. The registry below merely lets the engine find a live upload by
+# name from worker threads, and forgets it once no session holds it any more.
+
+demand_presets_kwh = {"600 kWh": 600, "5 MWh": 5000, "10 MWh": 10000, "15 MWh": 15000}
+
+demand_profiles_dir = os.path.join(data_dir, "demand")
+bundled_demand_files = [os.path.join(data_dir, "nitrocapt_demand_2024.csv")]
+
+
+def read_demand_file(source):
+    """
+    Reads a load shape (a path or an uploaded file) as (timestamps, kWh per interval).
+    The demand is the demand_kWh column, or else the first column after the timestamp.
+    """
+    demand_df = pd.read_csv(source)
+    if "timestamp" not in demand_df.columns:
+        raise ValueError("The demand file needs a 'timestamp' column.")
+    value_column = "demand_kWh" if "demand_kWh" in demand_df.columns else next(
+        (c for c in demand_df.columns if c != "timestamp"), None)
+    if value_column is None:
+        raise ValueError("The demand file has no demand column.")
+    timestamps = pd.to_datetime(demand_df["timestamp"]).to_numpy()
+    return timestamps, pd.to_numeric(demand_df[value_column], errors="coerce").to_numpy(dtype=np.float64)
+
+
+def profile_name_for(path: str) -> str:
+    """'data/nitrocapt_demand_2024.csv' -> 'Nitrocapt 2024'."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem.replace("_demand", "").replace("_", " ").strip().title()
+
+
+def library_files() -> dict:
+    """Bundled demand profiles by name: data/nitrocapt_demand_2024.csv and any CSV in data/demand."""
+    paths = [path for path in bundled_demand_files if os.path.exists(path)]
+    if os.path.isdir(demand_profiles_dir):
+        paths += [os.path.join(demand_profiles_dir, f) for f in sorted(os.listdir(demand_profiles_dir)) if f.lower().endswith(".csv")]
+    return {profile_name_for(path): path for path in paths}
+
+
+_uploads = weakref.WeakValueDictionary()  # name -> ProfileSeries, while some session holds it
+_lock = threading.Lock()
+
+
+def register_upload(filename: str, content: bytes, owner: dict) -> str:
+    """
+    Reads an uploaded load shape into `owner` (the uploading session's uploads, name -> ProfileSeries) and
+    returns its name. The name includes a hash of the content, so equal uploads share one profile and
+    cached results never mix two files.
+    """
+    name = f"{profile_name_for(filename)} (upload {hashlib.sha1(content).hexdigest()[:8]})"
+    with _lock:
+        profile = _uploads.get(name)
+        if profile is None:
+            timestamps, values = read_demand_file(io.BytesIO(content))
+            profile = _uploads[name] = ProfileSeries(filename, timestamps, values)
+    owner[name] = profile
+    return name
+
+
+def demand_profile_names(uploads=()) -> list:
+    """Presets, then bundled profiles, then the caller's own `uploads` (names, e.g. a session's uploads dict)."""
+    return list(demand_presets_kwh) + list(library_files()) + list(uploads)
+
+
+def load_demand_profile(name: str):
+    """The ProfileSeries of a bundled or uploaded profile, or None for presets and unknown names."""
+    with _lock:
+        upload = _uploads.get(name)
+    if upload is not None:
+        return upload
+    path = library_files().get(name)
+    if path is None:
+        return None
+    return load_profile_series(path, read_demand_file)
+
+
+def profile_version(name: str) -> str:
+    """Changes whenever the data behind a demand option changes, e.g. for result cache keys."""
+    path = library_files().get(name)
+    if path is None:
+        return "static"
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def _scale_to_annual_volume(demand_kwh: np.ndarray, timestamps: np.ndarray, annual_demand_mwh: float, dt: float) -> np.ndarray:
+    """Scales every calendar year to `annual_demand_mwh`, pro rata for years only partly covered."""
+    years = timestamps.astype("datetime64[Y]")
+    unique_years, year_index = np.unique(years, return_inverse=True)
+    totals = np.bincount(year_index, weights=demand_kwh)
+    hours_in_year = ((unique_years + 1).astype("datetime64[h]") - unique_years.astype("datetime64[h]")).astype(np.int64)
+    covered = np.bincount(year_index) * dt / hours_in_year
+    with np.errstate(invalid="ignore", divide="ignore"):
+        factors = np.where(totals > 0, annual_demand_mwh * 1000 * covered / totals, 0.0)
+    return demand_kwh * factors[year_index]
+
+
+def demand_kwh_for(demand_option: str, timestamps: np.ndarray, annual_demand_mwh=None) -> np.ndarray:
+    """
+    Demand (kWh per interval, float32) of a preset or profile for each of `timestamps`.
+    With `annual_demand_mwh`, every calendar year is scaled to that volume.
+    Raises ValueError for unknown demand options.
+    """
+    dt = interval_hours(timestamps)
+    if demand_option in demand_presets_kwh:
+        demand_kwh = np.full(len(timestamps), demand_presets_kwh[demand_option] * dt)
+    else:
+        profile = load_demand_profile(demand_option)
+        if profile is None:
+            raise ValueError(f"Unknown demand profile: {demand_option}")
+        # Averaged as power, so hourly and 15-minute shapes map onto either resolution
+        profile_kw = profile.values.astype(np.float64) / interval_hours(profile.timestamps)
+        demand_kw = map_typical_year(profile.timestamps, profile_kw, timestamps)
+        demand_kwh = np.where(np.isnan(demand_kw), np.nanmean(profile_kw), demand_kw) * dt
+
+    if annual_demand_mwh:
+        demand_kwh = _scale_to_annual_volume(demand_kwh, timestamps, float(annual_demand_mwh), dt)
+    return demand_kwh.astype(np.float32)
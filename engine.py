@@ -0,0 +1,454 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from catalog import data_dir
+from demand_profiles import demand_kwh_for
+from price_store import load_price_series
+from scenario import DispatchResult, Scenario
+
+# Simulation engine shared by the dashboard and background workers.
+# Nothing in here may call into Streamlit: these functions run on worker
+# threads where there is no script context to render into.
+
+co2_file_path = os.path.join(data_dir, "co2", "carbon.csv")
+
+# Battery size suggested for each preset (MWh)
+default_battery_capacity_mwh = {"600 kWh": 0.6, "5 MWh": 6, "10 MWh": 13.89, "15 MWh": 20.83}
+
+
+# Bisection steps of the monthly peak threshold search; 30 halvings of the battery power resolve it to well below 1 W
+peak_search_steps = 30
+
+
+class ScenarioCancelled(Exception):
+    """Raised inside a running scenario once a newer request has superseded it."""
+
+
+class PeakShavingResult:
+    """Battery schedule that caps each month's peak import, with the arbitrage stacked on top."""
+
+    def __init__(self, months, peak_before_kw, peak_after_kw, net_load_kw, battery_kw,
+                 demand_charge_eur_kw_month, energy_cost_before, energy_cost_after, arbitrage_savings):
+        self.months = months  # datetime64[M], one entry per month in the scenario
+        self.peak_before_kw = peak_before_kw
+        self.peak_after_kw = peak_after_kw
+        self.net_load_kw = net_load_kw  # grid import per interval after the battery
+        self.battery_kw = battery_kw  # positive = discharging, negative = charging
+        self.demand_charge_eur_kw_month = demand_charge_eur_kw_month
+        self.energy_cost_before = energy_cost_before
+        self.energy_cost_after = energy_cost_after
+        self.arbitrage_savings = arbitrage_savings
+
+    @property
+    def demand_charge_before(self) -> float:
+        return float(self.peak_before_kw.sum() * self.demand_charge_eur_kw_month)
+
+    @property
+    def demand_charge_after(self) -> float:
+        return float(self.peak_after_kw.sum() * self.demand_charge_eur_kw_month)
+
+    @property
+    def demand_charge_savings(self) -> float:
+        return self.demand_charge_before - self.demand_charge_after
+
+    @property
+    def total_savings(self) -> float:
+        """Demand-charge savings plus the change in energy cost (arbitrage gains minus peak-shaving losses)."""
+        return self.demand_charge_savings + self.energy_cost_before - self.energy_cost_after
+
+    def monthly_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "Month": pd.to_datetime(self.months).strftime("%b %Y"),
+            "Peak before (kW)": self.peak_before_kw,
+            "Peak after (kW)": self.peak_after_kw,
+            "Demand Charge Savings (€)": (self.peak_before_kw - self.peak_after_kw) * self.demand_charge_eur_kw_month,
+        })
+
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise ScenarioCancelled()
+
+
+def _report(progress, fraction):
+    if progress is not None:
+        progress(min(max(fraction, 0.0), 1.0))
+
+
+def load_carbon_data():
+    """
+    Loads the grid emission factors, or None if carbon.csv is missing.
+    """
+    if not os.path.exists(co2_file_path):
+        return None
+    return pd.read_csv(co2_file_path)
+
+
+def load_country_prices(selected_country: str, selected_year: str):
+    """
+    Loads the hourly spot prices of one country for one year, or None if the price file is missing.
+    """
+    series = load_price_series(selected_country)
+    if series is None:
+        return None
+    year_range = series.year_slice(selected_year)
+    return pd.DataFrame({
+        "timestamp": series.timestamps[year_range],
+        "price": series.price[year_range].astype(np.float64).round(series.decimals or 15)
+    })
+
+
+def build_scenario(selected_country: str, selected_year: str, demand_option: str, last_year=None, annual_demand_mwh=None):
+    """
+    The compact Scenario of a country, year (or years through `last_year`) and demand preset or profile,
+    or None if the price file is missing. `annual_demand_mwh` scales the demand to that volume per year.
+    """
+    series = load_price_series(selected_country)
+    if series is None:
+        return None
+    year_range = series.year_slice(selected_year, last_year)
+    demand_kwh = demand_kwh_for(demand_option, series.timestamps[year_range], annual_demand_mwh)
+    return Scenario.from_series(series, selected_year, demand_kwh, last_year=last_year)
+
+def _daily_ranks(day: np.ndarray, price: np.ndarray):
+    """
+    Position of every hour within its day when sorted by price ascending and descending (NaN prices last
+    in both, like pandas' sort_values), plus the number of hours in that day.
+    """
+    n = len(price)
+    positions = np.arange(n)
+
+    def rank(order):
+        sorted_day = day[order]
+        group_start = np.flatnonzero(np.r_[True, sorted_day[1:] != sorted_day[:-1]]) if n else positions
+        starts = np.repeat(group_start, np.diff(np.r_[group_start, n]))
+        ranks = np.empty(n, dtype=np.int64)
+        ranks[order] = positions - starts
+        return ranks
+
+    rank_ascending = rank(np.lexsort((price, day)))
+    rank_descending = rank(np.lexsort((-price, day)))
+    _, day_index, day_sizes = np.unique(day, return_inverse=True, return_counts=True)
+    return rank_ascending, rank_descending, day_sizes[day_index]
+
+
+def battery_arbitrage_savings(scenario: Scenario, battery_capacity, efficiency, dod, storage_hours,
+                              progress=None, cancel_event=None):
+    """
+    Daily arbitrage: charge in the cheapest `storage_hours` hours and discharge in the most expensive ones.
+    Returns the total net saving over the period.
+    """
+    _check_cancelled(cancel_event)
+    price = scenario.prices_eur_mwh()
+    rank_ascending, _, day_sizes = _daily_ranks(scenario.day, price)
+    charge_hours = rank_ascending < storage_hours
+    discharge_hours = rank_ascending >= day_sizes - storage_hours
+
+    # Ensure battery_capacity and storage_hours are not zero to avoid division by zero
+    hourly_battery_power = battery_capacity / storage_hours if storage_hours > 0 else 0
+
+    charge_cost = np.nansum(price[charge_hours]) * hourly_battery_power
+    discharge_value = np.nansum(price[discharge_hours]) * hourly_battery_power * (efficiency / 100) * (dod / 100)
+    _report(progress, 1.0)
+    return float(discharge_value - charge_cost)
+
+
+def hybrid_dispatch(scenario: Scenario, use_battery, battery_capacity, efficiency, dod, storage_hours,
+                    ppa_price_eur_mwh, hedge_volume, out: DispatchResult = None, progress=None, cancel_event=None,
+                    no_export: bool = False):
+    """
+    Allocates each hour's demand to battery, PPA hedge and spot market.
+    The battery discharges in each day's `storage_hours` most expensive hours and charges in the cheapest ones.
+    By default it discharges at its full rate and energy beyond the hour's demand is netted against the
+    hedge; with `no_export` it never discharges more than the hour's demand.
+    Results are written into `out` (allocated if not given), which is returned.
+    """
+    _check_cancelled(cancel_event)
+    if out is None:
+        out = DispatchResult(len(scenario))
+    price = scenario.prices_eur_mwh()
+    demand_mwh = scenario.demand_mwh()
+
+    battery_available = np.zeros(len(scenario))
+    if use_battery and storage_hours > 0:
+        usable_capacity = battery_capacity * (efficiency / 100) * (dod / 100)
+        battery_power_limit = battery_capacity / float(storage_hours)
+        rank_ascending, rank_descending, _ = _daily_ranks(scenario.day, price)
+        discharge_hours = rank_descending < storage_hours
+        charge_hours = (rank_ascending < storage_hours) & ~discharge_hours
+
+        battery_available[discharge_hours] = min(battery_power_limit, usable_capacity / float(storage_hours))
+        if no_export:
+            battery_available[discharge_hours] = np.minimum(battery_available[discharge_hours], demand_mwh[discharge_hours])
+        out.charge_discharge[:] = 0.0
+        out.charge_discharge[discharge_hours] = -battery_available[discharge_hours]
+        out.charge_discharge[charge_hours] = battery_power_limit
+    else:
+        out.charge_discharge[:] = 0.0
+
+    remaining_demand_after_battery = demand_mwh - battery_available
+    hedge_used = np.minimum(remaining_demand_after_battery, hedge_volume / 24)
+    spot_used = np.maximum(0.0, remaining_demand_after_battery - hedge_used)
+
+    out.battery_used_mwh[:] = battery_available
+    out.hedge_used_mwh[:] = hedge_used
+    out.spot_used_mwh[:] = spot_used
+    np.multiply(ppa_price_eur_mwh - price, hedge_used, out=out.hedge_settlement)
+    np.multiply(price, spot_used, out=out.spot_cost)
+    np.add(out.spot_cost, ppa_price_eur_mwh * hedge_used, out=out.hybrid_cost)
+    _report(progress, 1.0)
+    return out
+
+
+def _shave_to_thresholds(load_kw, threshold_kw, dt, power_kw, capacity_kwh, eta, day_starts, day_index):
+    """
+    Battery flows that cap the load at `threshold_kw` (one value per interval), for a battery that starts
+    and ends every day full. Discharge covers the excess; it is recharged in the same day's later intervals
+    below the threshold, in proportion to their headroom.
+    Returns (discharge_kw, charge_kw, feasible per day, deepest discharge per day in kWh).
+    """
+    discharge_kw = np.clip(load_kw - threshold_kw, 0.0, None)
+    discharged = np.cumsum(discharge_kw)
+    discharged -= (discharged - discharge_kw)[day_starts][day_index]
+    # Recharge only once something has been discharged that day
+    headroom_kw = np.where(discharged > discharge_kw, np.clip(threshold_kw - load_kw, 0.0, power_kw), 0.0)
+    needed = np.add.reduceat(discharge_kw * dt, day_starts)
+    rechargeable = np.add.reduceat(headroom_kw * dt, day_starts) * eta
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fill = np.where(needed > 0, needed / rechargeable, 0.0)
+    charge_kw = headroom_kw * np.minimum(fill, 1.0)[day_index]
+
+    stored = (charge_kw * eta - discharge_kw) * dt
+    soc = np.cumsum(stored)
+    soc -= (soc - stored)[day_starts][day_index]  # relative to the full battery at the start of the day
+    depth = -np.minimum(np.minimum.reduceat(soc, day_starts), 0.0)
+    tolerance = 1e-9 * max(capacity_kwh, 1.0)
+    feasible = ((fill <= 1.0) & (depth <= capacity_kwh + tolerance)
+                & (np.maximum.reduceat(soc, day_starts) <= tolerance)
+                & (np.maximum.reduceat(discharge_kw, day_starts) <= power_kw * (1 + 1e-9)))
+    return discharge_kw, charge_kw, feasible, depth
+
+
+def peak_shaving_dispatch(scenario: Scenario, battery_capacity, efficiency, dod, storage_hours,
+                          demand_charge_eur_kw_month, with_arbitrage=True, progress=None, cancel_event=None):
+    """
+    Caps each month's peak grid import with the battery, for demand-charge tariffs billed on the monthly
+    maximum (€/kW per month). The lowest feasible threshold of every month is found by one bisection run
+    over all months at once. With `with_arbitrage`, the capacity peak shaving never needs runs the daily
+    price arbitrage on top, without charging above the month's threshold.
+    """
+    _check_cancelled(cancel_event)
+    dt = scenario.interval_hours()
+    load_kw = scenario.demand_kwh.astype(np.float64) / dt
+    price = scenario.prices_eur_mwh()
+    eta = efficiency / 100
+    capacity_kwh = battery_capacity * 1000 * (dod / 100)
+    power_kw = battery_capacity * 1000 / storage_hours if storage_hours > 0 else 0.0
+
+    months, month_index = np.unique(scenario.timestamps.astype("datetime64[M]"), return_inverse=True)
+    day_starts = np.flatnonzero(np.r_[True, scenario.day[1:] != scenario.day[:-1]])
+    day_index = np.repeat(np.arange(len(day_starts)), np.diff(np.r_[day_starts, len(load_kw)]))
+    day_month = month_index[day_starts]
+
+    peak_before_kw = np.full(len(months), -np.inf)
+    np.maximum.at(peak_before_kw, month_index, load_kw)
+
+    def feasible_months(threshold_kw):
+        feasible_days = _shave_to_thresholds(
+            load_kw, threshold_kw[month_index], dt, power_kw, capacity_kwh, eta, day_starts, day_index
+        )[2]
+        return np.bincount(day_month, weights=~feasible_days, minlength=len(months)) == 0
+
+    # The peak itself is always feasible (nothing to shave); it cannot drop by more than the battery power
+    high = peak_before_kw.copy()
+    low = np.maximum(peak_before_kw - power_kw, 0.0)
+    if capacity_kwh > 0 and power_kw > 0 and eta > 0:
+        for step in range(peak_search_steps):
+            _check_cancelled(cancel_event)
+            middle = (low + high) / 2
+            ok = feasible_months(middle)
+            high = np.where(ok, middle, high)
+            low = np.where(ok, low, middle)
+            _report(progress, 0.8 * (step + 1) / peak_search_steps)
+
+    threshold_kw = high[month_index]
+    discharge_kw, charge_kw, _, depth = _shave_to_thresholds(
+        load_kw, threshold_kw, dt, power_kw, capacity_kwh, eta, day_starts, day_index
+    )
+    net_load_kw = load_kw - discharge_kw + charge_kw
+
+    arbitrage_kw = np.zeros(len(load_kw))
+    if with_arbitrage and capacity_kwh > 0 and power_kw > 0:
+        # The arbitrage cycles in the part of the battery peak shaving never reaches, starting every day
+        # half full, so its cheapest and most expensive intervals may come in either order
+        cycle_limit = max(capacity_kwh - depth.max(initial=0.0), 0.0) / 2
+        n_intervals = max(int(round(storage_hours / dt)), 1)
+        rank_ascending, rank_descending, _ = _daily_ranks(scenario.day, price)
+        # Never against the peak-shaving flow of the same interval: the battery cannot charge and discharge at once
+        discharge_hours = (rank_descending < n_intervals) & ~np.isnan(price) & (charge_kw == 0)
+        charge_hours = (rank_ascending < n_intervals) & (rank_descending >= n_intervals) & ~np.isnan(price) & (discharge_kw == 0)
+        can_discharge = np.where(discharge_hours, np.clip(np.minimum(power_kw - discharge_kw, net_load_kw), 0.0, None), 0.0)
+        can_charge = np.where(charge_hours, np.clip(np.minimum(power_kw - charge_kw, threshold_kw - net_load_kw), 0.0, None), 0.0)
+
+        dischargeable = np.add.reduceat(can_discharge * dt, day_starts)
+        chargeable = np.add.reduceat(can_charge * dt, day_starts) * eta
+        cycle = np.minimum(cycle_limit, np.minimum(dischargeable, chargeable))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            discharge_scale = np.where(dischargeable > 0, cycle / dischargeable, 0.0)
+            charge_scale = np.where(chargeable > 0, cycle / chargeable, 0.0)
+        arbitrage_kw = can_discharge * discharge_scale[day_index] - can_charge * charge_scale[day_index]
+        # Only cycle on days where it pays
+        day_value = np.add.reduceat(np.nan_to_num(price) * arbitrage_kw * dt / 1000, day_starts)
+        arbitrage_kw[day_value[day_index] <= 0] = 0.0
+        net_load_kw = net_load_kw - arbitrage_kw
+
+    peak_after_kw = np.full(len(months), -np.inf)
+    np.maximum.at(peak_after_kw, month_index, net_load_kw)
+
+    energy_cost_before = float(np.nansum(price * load_kw * dt / 1000))
+    energy_cost_after = float(np.nansum(price * net_load_kw * dt / 1000))
+    _report(progress, 1.0)
+    return PeakShavingResult(
+        months, peak_before_kw, peak_after_kw, net_load_kw.astype(np.float32),
+        (discharge_kw - charge_kw + arbitrage_kw).astype(np.float32),
+        demand_charge_eur_kw_month, energy_cost_before, energy_cost_after,
+        float(np.nansum(price * arbitrage_kw * dt / 1000))
+    )
+
+
+def emission_factor_for(df_carbon_data, selected_country, selected_year):
+    """
+    Looks up the grid emission factor (gCO2/kWh) for a country and year, or None if unknown.
+    """
+    if df_carbon_data is None:
+        return None
+    filtered_emission = df_carbon_data[
+        (df_carbon_data['Entity'] == selected_country) &
+        (df_carbon_data['Year'] == int(selected_year))
+    ]
+    if filtered_emission.empty:
+        return None
+    return filtered_emission['gCO2/kWh'].iloc[0]
+
+
+def simulate_scenario(
+    selected_country: str,
+    selected_year: str,
+    demand_option: str,
+    use_battery: bool,
+    battery_capacity: float,
+    efficiency: int,
+    dod: int,
+    storage_hours: int,
+    ppa_price_eur_mwh: float,
+    hedge_volume: float,
+    df_carbon_data: pd.DataFrame,
+    progress=None,
+    cancel_event=None,
+    annual_demand_mwh: float = None,
+    no_export: bool = False
+):
+    """
+    Runs calculate_metrics' scenario and also returns the Scenario and DispatchResult behind it
+    (None for both when the scenario could not be computed), for callers that chart more than the totals.
+    """
+    results = {
+        "Country": selected_country,
+        "Year": selected_year,
+        "Demand Profile": demand_option,
+        "Total Spot Cost (€)": None,
+        "Total Cost with Battery (€)": None,
+        "Total Hybrid Cost (€)": None,
+        "LCOE (Spot) (€/MWh)": None,
+        "LCOE (Battery) (€/MWh)": None,
+        "LCOE (Hybrid) (€/MWh)": None,
+        "Total CO2 Emissions (tonnes CO2eq)": None
+    }
+
+    try:
+        scenario = build_scenario(selected_country, selected_year, demand_option, annual_demand_mwh=annual_demand_mwh)
+        if scenario is None:
+            results["Error"] = f"Price data for {selected_country} in {selected_year} not found. Skipping calculations for this country."
+            return results, None, None
+        if len(scenario) == 0:
+            results["Error"] = f"No price data for {selected_country} in {selected_year} after filtering. Skipping calculations."
+            return results, None, None
+
+        total_cost_base = float(np.nansum(scenario.prices_eur_mwh() * scenario.demand_mwh()))
+        total_demand_mwh = float(scenario.demand_mwh().sum())
+
+        results["Total Spot Cost (€)"] = total_cost_base
+
+        emission_factor_g_per_kWh = emission_factor_for(df_carbon_data, selected_country, selected_year) or 0.0
+        if total_demand_mwh > 0:
+            total_co2_emissions_tonnes = (total_demand_mwh * 1000 * emission_factor_g_per_kWh) / 1_000_000
+        else:
+            total_co2_emissions_tonnes = 0
+        results["Total CO2 Emissions (tonnes CO2eq)"] = total_co2_emissions_tonnes
+
+        if use_battery:
+            savings = battery_arbitrage_savings(
+                scenario, battery_capacity, efficiency, dod, storage_hours, cancel_event=cancel_event
+            )
+            results["Total Cost with Battery (€)"] = total_cost_base - savings
+            _report(progress, 0.5)
+
+        dispatch = hybrid_dispatch(
+            scenario, use_battery, battery_capacity, efficiency, dod, storage_hours,
+            ppa_price_eur_mwh, hedge_volume, cancel_event=cancel_event, no_export=no_export
+        )
+        results["Total Hybrid Cost (€)"] = dispatch.total_hybrid_cost
+
+        # LCOE calculations
+        if total_demand_mwh > 0:
+            results["LCOE (Spot) (€/MWh)"] = total_cost_base / total_demand_mwh
+            if use_battery and results["Total Cost with Battery (€)"] is not None:
+                results["LCOE (Battery) (€/MWh)"] = results["Total Cost with Battery (€)"] / total_demand_mwh
+            if results["Total Hybrid Cost (€)"] is not None:
+                results["LCOE (Hybrid) (€/MWh)"] = results["Total Hybrid Cost (€)"] / total_demand_mwh
+
+    except ScenarioCancelled:
+        raise
+    except Exception as e:
+        # Return partial results if an error occurs, or None for failed calculations
+        results["Error"] = f"Error calculating metrics for {selected_country}: {e}"
+        return results, None, None
+
+    _report(progress, 1.0)
+    return results, scenario, dispatch
+
+
+def calculate_metrics(
+    selected_country: str,
+    selected_year: str,
+    demand_option: str,
+    use_battery: bool,
+    battery_capacity: float,
+    efficiency: int,
+    dod: int,
+    storage_hours: int,
+    ppa_price_eur_mwh: float,
+    hedge_volume: float,
+    df_carbon_data: pd.DataFrame,
+    progress=None,
+    cancel_event=None,
+    annual_demand_mwh: float = None,
+    no_export: bool = False
+):
+    """
+    Calculates spot cost, battery cost, hybrid cost, LCOE, and CO2 emissions for a given country.
+    `demand_option` is a preset or a demand profile name; `annual_demand_mwh` scales it to that yearly volume.
+    `no_export` keeps the hybrid battery from discharging more than each hour's demand (see hybrid_dispatch).
+
+    `progress` is called with the completed fraction (0..1) and `cancel_event` is polled between the
+    simulation passes; when it is set the run stops with ScenarioCancelled.
+    If the scenario cannot be computed, the reason is stored under "Error".
+    """
+    results, _, _ = simulate_scenario(
+        selected_country, selected_year, demand_option, use_battery, battery_capacity, efficiency, dod,
+        storage_hours, ppa_price_eur_mwh, hedge_volume, df_carbon_data,
+        progress=progress, cancel_event=cancel_event, annual_demand_mwh=annual_demand_mwh, no_export=no_export
+    )
+    return results
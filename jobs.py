@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Background execution of long-running scenarios.
+# One JobRunner is shared by every Streamlit session (see get_job_runner in app.py), so a scenario
+# that is already running for one user is reused by everyone who asks for it, and finished jobs
+# double as the result cache. Each session registers itself as a "waiter" on the jobs it shows;
+# a job is cancelled once nobody is waiting for it any more. Streamlit does not report closed sessions,
+# so a waiter that has not been seen for `waiter_ttl_seconds` is released from all of its jobs.
+
+# Sessions poll their running jobs every second; one unseen this long is treated as closed
+waiter_ttl_seconds = 300.0
+
+
+class Job:
+    """A single scenario run on the background executor."""
+
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.progress = 0.0
+        self.cancel_event = threading.Event()
+        self.waiters = set()
+
+    def set_progress(self, fraction: float):
+        self.progress = fraction
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def result(self):
+        return self.future.result()
+
+    def error(self):
+        """Returns the exception the job failed with, or None."""
+        if not self.done() or self.future.cancelled():
+            return None
+        return self.future.exception()
+
+
+class JobRunner:
+    """
+    Runs scenario functions on a thread pool, deduplicating identical scenarios by key.
+
+    Scenario functions must accept `progress` and `cancel_event` keyword arguments (see engine.py).
+    """
+
+    def __init__(self, max_workers: int = 4, max_finished: int = 256, waiter_ttl: float = waiter_ttl_seconds):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scenario")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # key -> Job, running and finished, oldest first
+        self._max_finished = max_finished
+        self._waiter_ttl = waiter_ttl
+        self._seen = {}  # waiter -> time.monotonic() of its last submit or touch
+
+    def submit(self, key, waiter, fn, **kwargs) -> Job:
+        """
+        Returns the job for `key`, starting `fn(**kwargs)` in the background unless an identical
+        job is already running or finished. Failed and cancelled jobs are never reused.
+        """
+        with self._lock:
+            self._touch(waiter)
+            job = self._jobs.get(key)
+            if job is not None and not job.cancelled() and not job.future.cancelled():
+                job.waiters.add(waiter)
+                self._jobs.move_to_end(key)
+                return job
+
+            job = Job(key)
+            job.waiters.add(waiter)
+            job.future = self._executor.submit(self._run, job, fn, kwargs)
+            self._jobs[key] = job
+            self._evict_finished()
+            return job
+
+    def release(self, key, waiter):
+        """
+        Drops `waiter`'s interest in `key`; the job is cancelled if it is still running and
+        nobody else is waiting for it.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return
+            self._release(job, waiter)
+
+    def release_waiter(self, waiter):
+        """Drops `waiter` from every job, e.g. when its session has ended."""
+        with self._lock:
+            self._seen.pop(waiter, None)
+            for job in list(self._jobs.values()):
+                self._release(job, waiter)
+
+    def touch(self, waiter):
+        """Marks `waiter` as still alive and releases waiters that have not been seen for too long."""
+        with self._lock:
+            self._touch(waiter)
+
+    def _touch(self, waiter):
+        now = time.monotonic()
+        self._seen[waiter] = now
+        expired = [w for w, seen in self._seen.items() if now - seen > self._waiter_ttl]
+        for w in expired:
+            del self._seen[w]
+            for job in list(self._jobs.values()):
+                self._release(job, w)
+
+    def _release(self, job, waiter):
+        job.waiters.discard(waiter)
+        if not job.waiters and not job.done():
+            job.cancel_event.set()
+            job.future.cancel()
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+
+    def _run(self, job, fn, kwargs):
+        try:
+            return fn(progress=job.set_progress, cancel_event=job.cancel_event, **kwargs)
+        except Exception:
+            # Forget cancelled and failed jobs so a later request for the same scenario starts over;
+            # the sessions holding this job still see its error
+            with self._lock:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+            raise
+
+    def _evict_finished(self):
+        finished = [key for key, job in self._jobs.items() if job.done()]
+        for key in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[key]
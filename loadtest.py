@@ -0,0 +1,98 @@
+import argparse
+import json
+import random
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog import load_catalog
+from demand_profiles import demand_presets_kwh
+
+# Load test for service.py: fires scenario requests from concurrent clients and reports
+# throughput and latency percentiles.
+#
+#   python service.py --workers 4 &
+#   python loadtest.py --requests 500 --concurrency 32 --distinct 20
+#
+# --distinct controls how many different scenarios are requested, so the mix of cache hits,
+# coalesced requests and fresh computations can be varied. --batch N sends N scenarios per call
+# to /batch instead of one per call to /metrics.
+
+
+def make_scenarios(n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    catalog = load_catalog()
+    # Every country with price data on disk
+    countries = [country for country in catalog.countries() if catalog.years(country)]
+    scenarios = []
+    for _ in range(n):
+        country = rng.choice(countries)
+        scenarios.append({
+            "selected_country": country,
+            "selected_year": rng.choice(catalog.years(country)),
+            "demand_option": rng.choice(list(demand_presets_kwh)),
+            "use_battery": rng.random() < 0.5,
+            "battery_capacity": 13.89,
+        })
+    return scenarios
+
+
+def post(url: str, payload: dict, timeout: float) -> dict:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the local simulation service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8502")
+    parser.add_argument("--requests", type=int, default=200, help="Number of HTTP calls")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--distinct", type=int, default=10, help="Number of distinct scenarios")
+    parser.add_argument("--batch", type=int, default=0, help="Scenarios per /batch call (0 = use /metrics)")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    scenarios = make_scenarios(args.distinct, args.seed)
+    rng = random.Random(args.seed + 1)
+
+    def one_call(_):
+        start = time.perf_counter()
+        try:
+            if args.batch:
+                post(f"{args.url}/batch", {"scenarios": [rng.choice(scenarios) for _ in range(args.batch)]}, args.timeout)
+            else:
+                post(f"{args.url}/metrics", rng.choice(scenarios), args.timeout)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+        outcomes = list(clients.map(one_call, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for ok, latency in outcomes if ok)
+    failures = sum(1 for ok, _ in outcomes if not ok)
+    scenarios_done = len(latencies) * (args.batch or 1)
+
+    print(f"calls:       {args.requests} ({failures} failed), concurrency {args.concurrency}")
+    print(f"elapsed:     {elapsed:.2f} s")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} calls/s, {scenarios_done / elapsed:.1f} scenarios/s")
+    print(f"latency p50: {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"latency p99: {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"latency max: {(latencies[-1] if latencies else float('nan')) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+
+from engine import build_scenario, emission_factor_for
+
+# Multi-site portfolios.
+# Several plants, each in its own bidding zone with its own demand and battery, buy from the spot market
+# and share one or more PPA contracts. All sites are laid out on one hourly axis of the year as
+# (site, hour) arrays, so the battery schedules, the hour-by-hour PPA allocation and every cost, LCOE and
+# CO2 figure are computed for all sites at once. Batteries never discharge more than their site's demand,
+# so a single site with a single contract gives the same numbers as calculate_metrics with no_export=True.
+
+
+class Site:
+    """One plant of a portfolio: where it buys power, what it consumes and its battery (capacity 0 = none)."""
+
+    def __init__(self, name, country, demand_option="10 MWh", annual_demand_mwh=None, battery_capacity=0.0,
+                 efficiency=90, dod=80, storage_hours=4):
+        self.name = name
+        self.country = country
+        self.demand_option = demand_option
+        self.annual_demand_mwh = annual_demand_mwh
+        self.battery_capacity = battery_capacity
+        self.efficiency = efficiency
+        self.dod = dod
+        self.storage_hours = storage_hours
+
+
+class PpaContract:
+    """
+    A PPA delivering `volume_mwh_per_day` evenly over the hours at a fixed price, to the sites named in
+    `sites` (None for all sites).
+    """
+
+    def __init__(self, name, price_eur_mwh, volume_mwh_per_day, sites=None):
+        self.name = name
+        self.price_eur_mwh = price_eur_mwh
+        self.volume_mwh_per_day = volume_mwh_per_day
+        self.sites = sites
+
+
+class PortfolioResult:
+    """Costs, LCOE and CO2 of every site of a portfolio and of the portfolio as a whole, plus the PPA allocation."""
+
+    def __init__(self, site_names, contract_names, timestamps, demand_mwh, battery_mwh, ppa_mwh, spot_mwh,
+                 spot_cost, battery_cost, hybrid_cost, co2_tonnes, contract_cost, contract_settlement, has_battery):
+        self.site_names = site_names
+        self.contract_names = contract_names
+        self.timestamps = timestamps  # hourly axis shared by all sites
+        # Hourly arrays are (site, hour); ppa_mwh is (contract, site, hour)
+        self.demand_mwh = demand_mwh
+        self.battery_mwh = battery_mwh
+        self.ppa_mwh = ppa_mwh
+        self.spot_mwh = spot_mwh
+        # Per-site totals
+        self.spot_cost = spot_cost
+        self.battery_cost = battery_cost  # NaN for sites without a battery
+        self.hybrid_cost = hybrid_cost
+        self.co2_tonnes = co2_tonnes
+        # Per-contract totals: what the PPA energy cost and what it saved or lost against spot
+        self.contract_cost = contract_cost
+        self.contract_settlement = contract_settlement
+        self.has_battery = has_battery
+
+    @property
+    def total_demand_mwh(self) -> np.ndarray:
+        return self.demand_mwh.sum(axis=1, dtype=np.float64)
+
+    def site_frame(self) -> pd.DataFrame:
+        """One row per site and a "Portfolio" row, with calculate_metrics' result columns."""
+        demand = self.total_demand_mwh
+        battery_cost = np.where(self.has_battery, self.battery_cost, self.spot_cost)
+        totals = {
+            "Demand (MWh)": np.r_[demand, demand.sum()],
+            "PPA Energy (MWh)": np.r_[self.ppa_mwh.sum(axis=(0, 2), dtype=np.float64), self.ppa_mwh.sum(dtype=np.float64)],
+            "Total Spot Cost (€)": np.r_[self.spot_cost, self.spot_cost.sum()],
+            # The portfolio's battery cost counts sites without a battery at their spot cost
+            "Total Cost with Battery (€)": np.r_[self.battery_cost, battery_cost.sum() if self.has_battery.any() else np.nan],
+            "Total Hybrid Cost (€)": np.r_[self.hybrid_cost, self.hybrid_cost.sum()],
+            "Total CO2 Emissions (tonnes CO2eq)": np.r_[self.co2_tonnes, self.co2_tonnes.sum()],
+        }
+        frame = pd.DataFrame(totals, index=pd.Index(list(self.site_names) + ["Portfolio"], name="Site"))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for strategy, column in (("Spot", "Total Spot Cost (€)"), ("Battery", "Total Cost with Battery (€)"),
+                                     ("Hybrid", "Total Hybrid Cost (€)")):
+                frame[f"LCOE ({strategy}) (€/MWh)"] = frame[column] / frame["Demand (MWh)"].where(frame["Demand (MWh)"] > 0)
+        return frame
+
+    def contract_frame(self) -> pd.DataFrame:
+        """Energy each PPA delivered to each site, its cost and its settlement against the spot price."""
+        frame = pd.DataFrame(self.ppa_mwh.sum(axis=2, dtype=np.float64), index=pd.Index(self.contract_names, name="Contract"),
+                             columns=[f"{name} (MWh)" for name in self.site_names])
+        frame.insert(0, "Delivered (MWh)", frame.sum(axis=1))
+        frame.insert(1, "Cost (€)", self.contract_cost)
+        frame.insert(2, "Settlement vs Spot (€)", self.contract_settlement)
+        return frame
+
+    def monthly_frame(self) -> pd.DataFrame:
+        """Monthly energy of the portfolio by source (MWh)."""
+        months = self.timestamps.astype("datetime64[M]")
+        unique_months, month_index = np.unique(months, return_inverse=True)
+
+        def by_month(hourly):
+            return np.bincount(month_index, weights=hourly.astype(np.float64), minlength=len(unique_months))
+
+        return pd.DataFrame({
+            "Month": pd.to_datetime(unique_months).strftime("%b %Y"),
+            "Battery (MWh)": by_month(self.battery_mwh.sum(axis=0)),
+            "PPA (MWh)": by_month(self.ppa_mwh.sum(axis=(0, 1))),
+            "Spot (MWh)": by_month(self.spot_mwh.sum(axis=0)),
+        })
+
+
+def stack_sites(sites: list, year):
+    """
+    Prices (€/MWh) and demand (MWh) of all sites on the hourly axis of `year`, as (site, hour) arrays.
+    Hours a site has no price for are NaN with zero demand. Raises ValueError for missing or sub-hourly data.
+    """
+    year = int(year)
+    start = np.datetime64(f"{year:04d}-01-01T00", "h")
+    n_hours = int((np.datetime64(f"{year + 1:04d}-01-01T00", "h") - start).astype(np.int64))
+    price = np.full((len(sites), n_hours), np.nan)
+    demand = np.zeros((len(sites), n_hours))
+    for i, site in enumerate(sites):
+        scenario = build_scenario(site.country, str(year), site.demand_option, annual_demand_mwh=site.annual_demand_mwh)
+        if scenario is None or len(scenario) == 0:
+            raise ValueError(f"No price data for {site.name} ({site.country}) in {year}.")
+        if scenario.interval_hours() != 1.0:
+            raise ValueError(f"Portfolios need hourly prices; {site.country} has {scenario.interval_hours() * 60:.0f}-minute data.")
+        hours = (scenario.timestamps.astype("datetime64[h]") - start).astype(np.int64)
+        price[i, hours] = scenario.prices_eur_mwh()
+        demand[i, hours] = scenario.demand_mwh()
+    return start + np.arange(n_hours).astype("timedelta64[h]"), price, demand
+
+
+def _daily_ranks(daily_price: np.ndarray):
+    """
+    Position of every hour within its (site, day) row sorted by price ascending and descending, NaN last in
+    both, with ties in time order like engine._daily_ranks.
+    """
+    positions = np.broadcast_to(np.arange(daily_price.shape[-1]), daily_price.shape)
+    rank_ascending = np.empty(daily_price.shape, dtype=np.int64)
+    rank_descending = np.empty(daily_price.shape, dtype=np.int64)
+    np.put_along_axis(rank_ascending, np.argsort(daily_price, axis=-1, kind="stable"), positions, axis=-1)
+    np.put_along_axis(rank_descending, np.argsort(-daily_price, axis=-1, kind="stable"), positions, axis=-1)
+    return rank_ascending, rank_descending
+
+
+def portfolio_dispatch(sites: list, contracts: list, year, df_carbon_data=None) -> PortfolioResult:
+    """
+    Simulates all `sites` over one year. Every site's battery follows the daily arbitrage of
+    engine.hybrid_dispatch; the PPA contracts then cover the remaining demand hour by hour, in list order
+    (e.g. cheapest first), each split across its eligible sites in proportion to their remaining demand.
+    The spot market supplies the rest.
+    """
+    if not sites:
+        raise ValueError("A portfolio needs at least one site.")
+    names = [site.name for site in sites]
+    if len(set(names)) != len(names):
+        raise ValueError("Site names must be unique.")
+    timestamps, price, demand = stack_sites(sites, year)
+
+    n_sites, n_hours = price.shape
+    daily_price = price.reshape(n_sites, -1, 24)
+    hours_in_day = (~np.isnan(daily_price)).sum(axis=2, keepdims=True)
+
+    def column(attribute):
+        return np.array([float(getattr(site, attribute)) for site in sites])[:, None, None]
+
+    capacity, storage_hours = column("battery_capacity"), column("storage_hours")
+    eta, dod = column("efficiency") / 100, column("dod") / 100
+    has_battery = (capacity > 0) & (storage_hours > 0)
+    safe_hours = np.where(has_battery, storage_hours, 1.0)
+    power = np.where(has_battery, capacity / safe_hours, 0.0)
+    rank_ascending, rank_descending = _daily_ranks(daily_price)
+
+    # Battery cost: engine.battery_arbitrage_savings for every site at once
+    charge = has_battery & (rank_ascending < storage_hours)
+    discharge = has_battery & (rank_ascending >= hours_in_day - storage_hours)
+    savings = (np.nansum(np.where(discharge, daily_price, 0.0), axis=(1, 2)) * (power * eta * dod)[:, 0, 0]
+               - np.nansum(np.where(charge, daily_price, 0.0), axis=(1, 2)) * power[:, 0, 0])
+
+    # Hybrid dispatch: no export, so the battery never discharges more than the hour's demand
+    discharge_hours = (has_battery & (rank_descending < storage_hours)).reshape(n_sites, n_hours)
+    battery_rate = np.minimum(power, capacity * eta * dod / safe_hours).reshape(n_sites, 1)
+    battery = np.where(discharge_hours, np.minimum(battery_rate, demand), 0.0)
+    remaining = demand - battery
+
+    eligible_sites = {name: i for i, name in enumerate(names)}
+    ppa = np.zeros((len(contracts), n_sites, n_hours))
+    for c, contract in enumerate(contracts):
+        eligible = np.zeros((n_sites, 1), dtype=bool)
+        for name in contract.sites or names:
+            if name not in eligible_sites:
+                raise ValueError(f"PPA {contract.name} names an unknown site: {name}")
+            eligible[eligible_sites[name]] = True
+        offered = remaining.sum(axis=0, where=eligible)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share = np.where(offered > 0, np.minimum(contract.volume_mwh_per_day / 24 / offered, 1.0), 0.0)
+        ppa[c] = np.where(eligible, remaining * share, 0.0)
+        remaining = remaining - ppa[c]
+    spot = np.maximum(0.0, remaining)
+
+    ppa_prices = np.array([contract.price_eur_mwh for contract in contracts], dtype=np.float64).reshape(-1, 1, 1)
+    spot_cost = np.nansum(price * demand, axis=1)
+    hybrid_cost = np.nansum(price * spot, axis=1) + (ppa * ppa_prices).sum(axis=(0, 2))
+    factors = np.array([emission_factor_for(df_carbon_data, site.country, year) or 0.0 for site in sites], dtype=np.float64)
+    return PortfolioResult(
+        names, [contract.name for contract in contracts], timestamps,
+        demand.astype(np.float32), battery.astype(np.float32), ppa.astype(np.float32), spot.astype(np.float32),
+        spot_cost=spot_cost,
+        battery_cost=np.where(has_battery[:, 0, 0], spot_cost - savings, np.nan),
+        hybrid_cost=hybrid_cost,
+        co2_tonnes=demand.sum(axis=1) * factors / 1000,
+        contract_cost=(ppa * ppa_prices).sum(axis=(1, 2)),
+        contract_settlement=np.nansum((ppa_prices - price[None]) * ppa, axis=(1, 2)),
+        has_battery=has_battery[:, 0, 0],
+    )
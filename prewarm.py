@@ -0,0 +1,171 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from analytics import load_price_analytics
+from catalog import load_catalog
+from demand_profiles import demand_profile_names, load_demand_profile
+from price_matrix import load_price_matrix
+from price_store import load_price_series
+
+# Warm-up at startup.
+# The first request after a deploy would otherwise pay for parsing a decade of prices, the demand
+# profile and the cross-country price matrix, and for computing its scenario. start_prewarm does all of
+# that once per process on a background thread: first the default scenario and the scenarios requested
+# most often so far (counted in .cache/usage.json by the dashboard and service.py), then the price matrix
+# and the price analytics. service.py, whose scenarios run in worker processes, warms only its scenarios.
+# Nothing waits for it; a request that needs data still being loaded waits only for that country's prices
+# (price_store locks each country and file separately).
+
+usage_path = os.path.join(".cache", "usage.json")
+
+# Scenarios computed at startup besides the default one
+prewarm_top_scenarios = 8
+
+# The default scenario: the first catalog country in its latest year, at this demand
+default_demand_option = "10 MWh"
+
+# Usage counts are written at most this often; counts not yet written are lost on a crash, which only
+# makes the statistics slightly less precise
+usage_flush_seconds = 30.0
+
+
+class UsageStats:
+    """How often each (country, year, demand) scenario was requested, merged across processes and restarts."""
+
+    def __init__(self, path: str = usage_path):
+        self.path = path
+        self._pending = Counter()
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _read(self) -> Counter:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return Counter({tuple(entry["scenario"]): entry["count"] for entry in json.load(f)})
+        except (OSError, ValueError, KeyError, TypeError):
+            return Counter()
+
+    def record(self, country: str, year, demand_option: str):
+        with self._lock:
+            self._pending[(str(country), str(year), str(demand_option))] += 1
+            due = time.monotonic() - self._last_flush >= usage_flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Adds the counts recorded since the last flush to the file."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+            if not pending:
+                return
+            counts = self._read() + pending
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([{"scenario": list(s), "count": n} for s, n in counts.most_common()], f, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def most_used(self, n: int) -> list:
+        """The `n` most requested (country, year, demand) scenarios, including counts not yet written."""
+        with self._lock:
+            counts = self._read() + self._pending
+        return [scenario for scenario, _ in counts.most_common(n)]
+
+
+usage_stats = UsageStats()
+atexit.register(usage_stats.flush)
+
+
+def scenarios_to_warm(top_n: int = prewarm_top_scenarios) -> list:
+    """
+    The default scenario followed by the most used ones, as (country, year, demand) tuples. Scenarios whose
+    prices or demand profile no longer exist (e.g. uploads from an earlier run) are left out.
+    """
+    catalog = load_catalog()
+    countries = catalog.countries()
+    demand_options = set(demand_profile_names())
+    scenarios = []
+    if countries and catalog.years(countries[0]):
+        scenarios.append((countries[0], catalog.years(countries[0])[-1], default_demand_option))
+    # Ask for more than needed, since some may be filtered out
+    for country, year, demand_option in usage_stats.most_used(top_n * 2):
+        scenario = (country, year, demand_option)
+        if (len(scenarios) <= top_n and scenario not in scenarios and demand_option in demand_options
+                and country in countries and year in catalog.years(country)):
+            scenarios.append(scenario)
+    return scenarios
+
+
+class PrewarmStatus:
+    """Progress of the warm-up, e.g. for a health check."""
+
+    def __init__(self):
+        self.state = "pending"
+        self.done = 0
+        self.total = 0
+        self.seconds = 0.0
+        self.errors = []
+
+    def as_dict(self) -> dict:
+        return {"state": self.state, "done": self.done, "total": self.total,
+                "seconds": round(self.seconds, 2), "errors": self.errors[-5:]}
+
+
+prewarm_status = PrewarmStatus()
+
+
+def prewarm(run, top_n: int = prewarm_top_scenarios, status: PrewarmStatus = prewarm_status, local_data: bool = True):
+    """
+    Loads the data of the scenarios to warm and computes each with `run(country, year, demand_option)`,
+    then builds the price matrix and the price analytics. With local_data=False only `run` is called, for
+    callers that compute elsewhere. A failing scenario is recorded in `status` and skipped.
+    """
+    start = time.perf_counter()
+    status.state = "running"
+    scenarios = scenarios_to_warm(top_n)
+    status.total = len(scenarios) + (2 if local_data else 0)
+    for country, year, demand_option in scenarios:
+        try:
+            if local_data:
+                load_price_series(country)
+                load_demand_profile(demand_option)
+            run(country, year, demand_option)
+        except Exception as e:
+            status.errors.append(f"{country} {year} {demand_option}: {e}")
+        status.done += 1
+    if not local_data:
+        status.seconds = time.perf_counter() - start
+        status.state = "finished"
+        return
+    try:
+        load_price_matrix()
+    except Exception as e:
+        status.errors.append(f"price matrix: {e}")
+    status.done += 1
+    try:
+        load_price_analytics()
+    except Exception as e:
+        status.errors.append(f"price analytics: {e}")
+    status.done += 1
+    status.seconds = time.perf_counter() - start
+    status.state = "finished"
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def start_prewarm(run, top_n: int = prewarm_top_scenarios, local_data: bool = True) -> threading.Thread:
+    """Starts prewarm(run) on a daemon thread, once per process; later calls return the same thread."""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=prewarm, args=(run, top_n), kwargs={"local_data": local_data},
+                                       name="prewarm", daemon=True)
+            _thread.start()
+        return _thread
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from catalog import load_catalog
+from price_store import load_price_series
+
+# All countries' prices as one aligned, memory-mapped matrix (country x hour).
+# Row i holds countries[i]; column j is the hour start + j. Hours a country has no data for are NaN
+# and False in the `covered` mask. The matrix is built from the CSVs once, saved as .npy files and
+# afterwards opened with mmap_mode="r", so only the pages an analysis touches are read from disk.
+# Cross-country statistics then run as single numpy operations over the whole matrix.
+
+matrix_dir = os.path.join(".cache", "price_matrix")
+
+
+def _file_versions(countries: list) -> dict:
+    catalog = load_catalog()
+    return {country: catalog.version(country) for country in countries}
+
+
+@contextmanager
+def _ignore_empty_slices():
+    # nanmean/nanmin of an all-NaN row (a country without data in that year) warn and return NaN, which is what we want
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        yield
+
+
+class PriceMatrix:
+    """Read-only country x hour price matrix backed by memory-mapped files."""
+
+    def __init__(self, countries: list, start: np.datetime64, prices: np.ndarray, covered: np.ndarray):
+        self.countries = countries
+        self.start = start
+        self.prices = prices
+        self.covered = covered
+        self._rows = {country: i for i, country in enumerate(countries)}
+
+    @property
+    def n_hours(self) -> int:
+        return self.prices.shape[1]
+
+    def row(self, country: str) -> int:
+        return self._rows[country]
+
+    def timestamps(self, columns: slice = slice(None)) -> np.ndarray:
+        hours = np.arange(self.n_hours)[columns]
+        return self.start + hours.astype("timedelta64[h]")
+
+    def year_columns(self, year) -> slice:
+        """Columns of one calendar year, clipped to the matrix."""
+        year = int(year)
+        first = (np.datetime64(f"{year:04d}-01-01T00") - self.start).astype(np.int64)
+        last = (np.datetime64(f"{year + 1:04d}-01-01T00") - self.start).astype(np.int64)
+        return slice(int(np.clip(first, 0, self.n_hours)), int(np.clip(last, 0, self.n_hours)))
+
+    def _daily(self, columns: slice) -> np.ndarray:
+        """(country, day, hour) view of whole days within `columns`; the axis starts at midnight."""
+        # The matrix may start at any hour: skip to the first midnight within `columns`
+        hour_of_day = int((self.start - self.start.astype("datetime64[D]")).astype(np.int64)) + columns.start
+        start = columns.start + (-hour_of_day) % 24
+        n_days = max(columns.stop - start, 0) // 24
+        return self.prices[:, start:start + n_days * 24].reshape(len(self.countries), n_days, 24)
+
+    def stats(self, year) -> pd.DataFrame:
+        """Mean, volatility, extremes and data coverage of every country in one year."""
+        columns = self.year_columns(year)
+        block = self.prices[:, columns]
+        covered = self.covered[:, columns]
+        with _ignore_empty_slices():
+            return pd.DataFrame({
+                "Mean Price (€/MWh)": np.nanmean(block, axis=1, dtype=np.float64),
+                "Std Dev (€/MWh)": np.nanstd(block, axis=1, dtype=np.float64),
+                "Min Price (€/MWh)": np.nanmin(block, axis=1),
+                "Max Price (€/MWh)": np.nanmax(block, axis=1),
+                "Negative Price Hours": (block < 0).sum(axis=1),
+                "Coverage (%)": covered.mean(axis=1) * 100 if covered.shape[1] else 0.0,
+            }, index=pd.Index(self.countries, name="Country"))
+
+    def mean_daily_spread(self, year) -> pd.Series:
+        """Average daily max-min price spread per country (€/MWh), over fully covered days."""
+        daily = self._daily(self.year_columns(year)).astype(np.float64)
+        spreads = daily.max(axis=2) - daily.min(axis=2)  # NaN for days with any gap
+        with _ignore_empty_slices():
+            return pd.Series(np.nanmean(spreads, axis=1), index=self.countries, name="Mean Daily Spread (€/MWh)")
+
+    def arbitrage_value(self, year, storage_hours: int = 4, efficiency: float = 0.9) -> pd.Series:
+        """
+        Yearly value (€ per MWh of hourly battery power) of discharging in each day's `storage_hours` most
+        expensive hours and charging in its cheapest ones, for every country at once. Days with gaps are skipped.
+        """
+        daily = np.sort(self._daily(self.year_columns(year)).astype(np.float64), axis=2)  # NaN sorts last
+        complete_days = ~np.isnan(daily).any(axis=2)
+        cheapest = daily[:, :, :storage_hours].sum(axis=2)
+        dearest = daily[:, :, -storage_hours:].sum(axis=2)
+        value = np.where(complete_days, dearest * efficiency - cheapest, 0.0).sum(axis=1)
+        return pd.Series(value, index=self.countries, name="Arbitrage Value (€/MW)")
+
+    def correlation(self, year) -> pd.DataFrame:
+        """Pairwise correlation of hourly prices, over the hours both countries cover."""
+        block = self.prices[:, self.year_columns(year)]
+        return pd.DataFrame(block.T, columns=self.countries).corr()
+
+    def mean_abs_spread(self, year) -> pd.DataFrame:
+        """Mean absolute hourly price difference between every pair of countries (€/MWh)."""
+        block = self.prices[:, self.year_columns(year)].astype(np.float64)
+        spread = np.empty((len(self.countries), len(self.countries)))
+        # One country against all others at a time: a (country, hour) temporary instead of (country, country, hour)
+        difference = np.empty_like(block)
+        with _ignore_empty_slices():
+            for i in range(len(self.countries)):
+                np.subtract(block, block[i], out=difference)
+                np.abs(difference, out=difference)
+                spread[i] = np.nanmean(difference, axis=1)
+        return pd.DataFrame(spread, index=self.countries, columns=self.countries)
+
+
+def build_price_matrix(countries: list, directory: str = matrix_dir):
+    """Aligns every country's hourly prices on one axis and writes prices.npy, covered.npy and meta.json."""
+    series = {country: load_price_series(country) for country in countries}
+    start = min(s.timestamps[0] for s in series.values()).astype("datetime64[h]")
+    end = max(s.timestamps[-1] for s in series.values()).astype("datetime64[h]")
+    n_hours = int((end - start).astype(np.int64)) + 1
+
+    os.makedirs(directory, exist_ok=True)
+    prices_tmp = os.path.join(directory, f"prices.{os.getpid()}.tmp.npy")
+    prices = np.lib.format.open_memmap(prices_tmp, mode="w+", dtype=np.float32, shape=(len(countries), n_hours))
+    covered = np.zeros((len(countries), n_hours), dtype=bool)
+    for i, country in enumerate(countries):
+        s = series[country]
+        hours = (s.timestamps.astype("datetime64[h]") - start).astype(np.int64)
+        valid = ~np.isnan(s.price)
+        # Sub-hourly files are averaged into their hour
+        totals = np.bincount(hours[valid], weights=s.price[valid], minlength=n_hours)
+        counts = np.bincount(hours[valid], minlength=n_hours)
+        covered[i] = counts > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            prices[i] = np.where(covered[i], totals / np.maximum(counts, 1), np.nan)
+    prices.flush()
+    del prices
+
+    covered_tmp = os.path.join(directory, f"covered.{os.getpid()}.tmp.npy")
+    np.save(covered_tmp, covered)
+    os.replace(prices_tmp, os.path.join(directory, "prices.npy"))
+    os.replace(covered_tmp, os.path.join(directory, "covered.npy"))
+    meta = {"countries": countries, "start": str(start), "versions": _file_versions(countries)}
+    # Written last: a matrix is only used once its meta.json matches the current files
+    meta_tmp = os.path.join(directory, f"meta.{os.getpid()}.tmp")
+    with open(meta_tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_tmp, os.path.join(directory, "meta.json"))
+
+
+_matrix = None
+_lock = threading.Lock()
+
+
+def load_price_matrix(directory: str = matrix_dir) -> PriceMatrix:
+    """
+    Opens the memory-mapped matrix, (re)building it first if a price file was added, removed or changed.
+    """
+    global _matrix
+    countries = load_catalog().countries()
+    versions = _file_versions(countries)
+    if _matrix is not None and _matrix[0] == versions:
+        return _matrix[1]
+
+    with _lock:
+        if _matrix is not None and _matrix[0] == versions:
+            return _matrix[1]
+        meta_path = os.path.join(directory, "meta.json")
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta is None or meta["countries"] != countries or meta["versions"] != versions:
+            build_price_matrix(countries, directory)
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+
+        matrix = PriceMatrix(
+            meta["countries"],
+            np.datetime64(meta["start"], "h"),
+            np.load(os.path.join(directory, "prices.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "covered.npy"), mmap_mode="r"),
+        )
+        _matrix = (versions, matrix)
+        return matrix
@@ -0,0 +1,246 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from catalog import europe_prices_dir, load_catalog
+
+# Shared, read-only price data.
+# Each country's decade of hourly prices is parsed once per process and kept as immutable numpy arrays.
+# Every Streamlit session, background job and scenario works on views into these arrays instead of
+# holding its own DataFrame copy.
+
+_ns_per_hour = 3_600_000_000_000
+_ns_per_day = 24 * _ns_per_hour
+
+
+def price_file_for(selected_country: str) -> str:
+    """The country's main price file, or where it would be expected if the catalog has none."""
+    files = load_catalog().price_files(selected_country)
+    return files[0] if files else os.path.join(europe_prices_dir, f"{selected_country.lower()}.csv")
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+def day_keys(timestamps: np.ndarray) -> np.ndarray:
+    """Calendar day of each timestamp as days since 1970-01-01 (int32), instead of Python date objects."""
+    return (timestamps.astype("datetime64[ns]").astype(np.int64) // _ns_per_day).astype(np.int32)
+
+
+def month_keys(timestamps: np.ndarray) -> np.ndarray:
+    """Calendar month of each timestamp, 1..12 (int8)."""
+    return (timestamps.astype("datetime64[M]").astype(np.int64) % 12 + 1).astype(np.int8)
+
+
+def hour_keys(timestamps: np.ndarray) -> np.ndarray:
+    """Hour of day of each timestamp, 0..23 (int8)."""
+    return (timestamps.astype("datetime64[ns]").astype(np.int64) // _ns_per_hour % 24).astype(np.int8)
+
+
+def interval_hours(timestamps: np.ndarray) -> float:
+    """Typical spacing of `timestamps` in hours: 1.0 for hourly data, 0.25 for 15-minute data."""
+    if len(timestamps) < 2:
+        return 1.0
+    step = np.median(np.diff(timestamps.astype("datetime64[ns]").astype(np.int64)))
+    return float(step) / _ns_per_hour if step > 0 else 1.0
+
+
+def typical_year_keys(timestamps: np.ndarray) -> np.ndarray:
+    """Hour of a 12 x 31 x 24 calendar grid (month, day, hour) for each timestamp, ignoring the year."""
+    days = timestamps.astype("datetime64[D]")
+    months = timestamps.astype("datetime64[M]")
+    day = (days - months.astype("datetime64[D]")).astype(np.int64)
+    hour = (timestamps.astype("datetime64[h]") - days).astype(np.int64)
+    return ((months.astype(np.int64) % 12) * 31 + day) * 24 + hour
+
+
+def map_typical_year(source_timestamps: np.ndarray, source_values: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+    """
+    Maps a series onto other `timestamps` by month, day and hour: every target hour gets the source's
+    average for that calendar hour over all years it covers. 29 February falls back to the 28th and hours
+    the source does not cover at all become NaN.
+    """
+    n_keys = 12 * 31 * 24
+    keys = typical_year_keys(source_timestamps)
+    valid = ~np.isnan(source_values)
+    totals = np.bincount(keys[valid], weights=source_values[valid], minlength=n_keys)
+    counts = np.bincount(keys[valid], minlength=n_keys)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        typical = totals / counts
+
+    target = typical_year_keys(np.asarray(timestamps))
+    mapped = typical[target]
+    leap_day = np.isnan(mapped) & (target // 24 == 1 * 31 + 28)
+    mapped[leap_day] = typical[target[leap_day] - 24]
+    return mapped
+
+
+def compact_prices(prices: np.ndarray):
+    """
+    Returns (array, decimals). Prices published with at most two decimals are stored as float32, which
+    still identifies every cent exactly; anything finer stays float64 (decimals None).
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    prices32 = prices.astype(np.float32)
+    if np.array_equal(np.round(prices32.astype(np.float64), 2), prices, equal_nan=True):
+        return prices32, 2
+    return prices, None
+
+
+def widen_prices(prices: np.ndarray, decimals) -> np.ndarray:
+    """float64 prices for cost arithmetic, undoing the float32 rounding of compact_prices."""
+    if decimals is None:
+        return prices.astype(np.float64, copy=False)
+    return np.round(prices.astype(np.float64), decimals)
+
+
+def daily_grid(timestamps: np.ndarray, values: np.ndarray) -> tuple:
+    """
+    Hourly `values` as a (day, hour) grid from the first to the last day of `timestamps`, hours without a
+    value NaN, together with the date of every row. Sub-hourly values are averaged into their hour.
+    """
+    hours = timestamps.astype("datetime64[h]")
+    first_day = timestamps[0].astype("datetime64[D]")
+    n_days = int((timestamps[-1].astype("datetime64[D]") - first_day).astype(np.int64)) + 1
+    index = (hours - first_day.astype("datetime64[h]")).astype(np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    totals = np.bincount(index[valid], weights=values[valid], minlength=n_days * 24)
+    counts = np.bincount(index[valid], minlength=n_days * 24)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grid = np.where(counts > 0, totals / np.maximum(counts, 1), np.nan).reshape(n_days, 24)
+    return grid, first_day + np.arange(n_days).astype("timedelta64[D]")
+
+
+def _year_slice(timestamps: np.ndarray, year, last_year=None) -> slice:
+    year = int(year)
+    last_year = year if last_year is None else int(last_year)
+    start = np.searchsorted(timestamps, np.datetime64(f"{year:04d}-01-01"), side="left")
+    end = np.searchsorted(timestamps, np.datetime64(f"{last_year + 1:04d}-01-01"), side="left")
+    return slice(int(start), int(end))
+
+
+class PriceSeries:
+    """
+    One country's full hourly price history as read-only arrays, with integer calendar keys.
+    """
+
+    def __init__(self, country: str, timestamps: np.ndarray, prices: np.ndarray):
+        order = np.argsort(timestamps, kind="stable")
+        timestamps = timestamps[order]
+        self.country = country
+        self.timestamps = _read_only(timestamps.astype("datetime64[ns]"))
+        price, self.decimals = compact_prices(np.asarray(prices)[order])
+        self.price = _read_only(price)
+        self.day = _read_only(day_keys(self.timestamps))
+        self.month = _read_only(month_keys(self.timestamps))
+        self.year = _read_only(self.timestamps.astype("datetime64[Y]").astype(np.int16) + np.int16(1970))
+
+    def year_slice(self, year, last_year=None) -> slice:
+        """Positions of one calendar year, or of `year` through `last_year`."""
+        return _year_slice(self.timestamps, year, last_year)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.timestamps, self.price, self.day, self.month, self.year))
+
+
+_series = {}
+
+# One lock per file or country, so a request never waits for a different file being parsed (e.g. by prewarm)
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(key) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _read_price_file(path: str) -> pd.DataFrame:
+    price_df = pd.read_csv(path, encoding="utf-8-sig")
+    if "Grid_Price_EUR_per_MWh" in price_df.columns:
+        price_df["price"] = price_df["Grid_Price_EUR_per_MWh"]
+    return pd.DataFrame({"timestamp": pd.to_datetime(price_df["timestamp"]), "price": price_df["price"]})
+
+
+def load_price_series(selected_country: str):
+    """
+    Returns the shared PriceSeries for a country, parsing its price files on first use, or None if the
+    catalog has none. Files are merged in catalog precedence; where they overlap the first one wins.
+    """
+    catalog = load_catalog()
+    paths = catalog.price_files(selected_country)
+    if not paths:
+        return None
+    version = catalog.version(selected_country)
+
+    key = selected_country.lower()
+    cached = _series.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _lock_for(("prices", key)):
+        cached = _series.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        price_df = pd.concat([_read_price_file(path) for path in paths], ignore_index=True)
+        if len(paths) > 1:
+            price_df = price_df.drop_duplicates("timestamp", keep="first")
+        series = PriceSeries(selected_country, price_df["timestamp"].to_numpy(), price_df["price"].to_numpy())
+        _series[key] = (version, series)
+        return series
+
+
+class ProfileSeries:
+    """
+    A read-only time series from a local file other than the price files, e.g. a PVGIS export.
+    Values are stored as float32.
+    """
+
+    def __init__(self, name: str, timestamps: np.ndarray, values: np.ndarray):
+        order = np.argsort(timestamps, kind="stable")
+        self.name = name
+        self.timestamps = _read_only(timestamps[order].astype("datetime64[ns]"))
+        self.values = _read_only(np.asarray(values, dtype=np.float32)[order])
+
+    def year_slice(self, year, last_year=None) -> slice:
+        return _year_slice(self.timestamps, year, last_year)
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.values.nbytes
+
+
+_profiles = {}
+
+
+def load_profile_series(path: str, reader):
+    """
+    Returns the shared ProfileSeries of a local file. `reader(path)` returns (timestamps, values) and is
+    only called on first use and after the file changed.
+    """
+    version = os.stat(path).st_mtime_ns
+    key = (os.path.abspath(path), reader)
+    cached = _profiles.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _lock_for(("profile",) + key):
+        cached = _profiles.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        timestamps, values = reader(path)
+        profile = ProfileSeries(os.path.basename(path), np.asarray(timestamps), values)
+        _profiles[key] = (version, profile)
+        return profile
+
+
+def loaded_nbytes() -> int:
+    """Memory held by the shared price store in this process."""
+    return (sum(series.nbytes for _, series in list(_series.values()))
+            + sum(profile.nbytes for _, profile in list(_profiles.values())))
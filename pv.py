@@ -0,0 +1,248 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from price_store import load_profile_series, map_typical_year
+from scenario import Scenario
+
+# On-site PV without network access.
+# Production comes either from a clear-sky model evaluated on the scenario's own timestamps, or from
+# PVGIS hourly exports ("seriescalc" CSV or JSON) stored locally, e.g. under data/pv. Exports are parsed
+# once into the shared profile store and mapped onto any year by month, day and hour.
+
+pv_data_dir = os.path.join("data", "pv")
+
+# Capital city coordinates and standard-time UTC offset, as the default site of each country
+country_sites = {
+    "Austria": (48.21, 16.37, 1), "Belgium": (50.85, 4.35, 1), "Bulgaria": (42.70, 23.32, 2),
+    "Croatia": (45.81, 15.98, 1), "Czechia": (50.08, 14.44, 1), "Denmark": (55.68, 12.57, 1),
+    "Estonia": (59.44, 24.75, 2), "Finland": (60.17, 24.94, 2), "France": (48.86, 2.35, 1),
+    "Germany": (52.52, 13.40, 1), "Greece": (37.98, 23.73, 2), "Hungary": (47.50, 19.04, 1),
+    "Italy": (41.90, 12.50, 1), "Latvia": (56.95, 24.11, 2), "Lithuania": (54.69, 25.28, 2),
+    "Luxembourg": (49.61, 6.13, 1), "Netherlands": (52.37, 4.90, 1), "Norway": (59.91, 10.75, 1),
+    "Poland": (52.23, 21.01, 1), "Portugal": (38.72, -9.14, 0), "Romania": (44.43, 26.10, 2),
+    "Slovakia": (48.15, 17.11, 1), "Slovenia": (46.06, 14.51, 1), "Spain": (40.42, -3.70, 1),
+    "Sweden": (59.33, 18.07, 1), "Switzerland": (46.95, 7.45, 1),
+}
+
+# Typical ratio of actual to clear-sky irradiation per month in central Europe (Jan..Dec)
+default_clearness = (0.40, 0.48, 0.55, 0.60, 0.62, 0.64, 0.66, 0.65, 0.60, 0.52, 0.42, 0.38)
+
+
+class PvSite:
+    """Location and layout of a PV system. Azimuth is 0 for south, negative east, positive west."""
+
+    def __init__(self, latitude, longitude, utc_offset=1, peak_kw=1000.0, tilt=35.0, azimuth=0.0,
+                 system_losses=14.0, albedo=0.2, clearness=default_clearness):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.utc_offset = utc_offset
+        self.peak_kw = peak_kw
+        self.tilt = tilt
+        self.azimuth = azimuth
+        self.system_losses = system_losses
+        self.albedo = albedo
+        # One value for the whole year or twelve monthly values
+        self.clearness = clearness
+
+    @classmethod
+    def for_country(cls, country: str, **params):
+        latitude, longitude, utc_offset = country_sites.get(country, (50.0, 10.0, 1))
+        return cls(latitude, longitude, utc_offset, **params)
+
+
+class PvDispatchResult:
+    """Per-interval split of on-site PV and demand into self-consumption, battery, grid import and export."""
+
+    columns = ("pv_kw", "self_consumed_kw", "battery_kw", "import_kw", "export_kw", "curtailed_kw", "soc_kwh")
+
+    __slots__ = columns + ("interval_hours", "spot_only_cost", "import_cost", "export_revenue")
+
+    def __init__(self, n_hours: int, interval_hours: float):
+        for name in self.columns:
+            setattr(self, name, np.zeros(n_hours, dtype=np.float32))
+        self.interval_hours = interval_hours
+        self.spot_only_cost = 0.0
+        self.import_cost = 0.0
+        self.export_revenue = 0.0
+
+    def _kwh(self, column: str) -> float:
+        return float(getattr(self, column).sum(dtype=np.float64) * self.interval_hours)
+
+    @property
+    def pv_production_kwh(self) -> float:
+        return self._kwh("pv_kw")
+
+    @property
+    def net_cost(self) -> float:
+        return self.import_cost - self.export_revenue
+
+    @property
+    def self_consumption_share(self) -> float:
+        """Share of the PV production used on site, directly or through the battery."""
+        produced = self.pv_production_kwh
+        return 1 - (self._kwh("export_kw") + self._kwh("curtailed_kw")) / produced if produced > 0 else 0.0
+
+    @property
+    def self_sufficiency_share(self) -> float:
+        """Share of the demand not imported from the grid."""
+        demand = self._kwh("self_consumed_kw") + float(np.clip(self.battery_kw, 0, None).sum(dtype=np.float64) * self.interval_hours) + self._kwh("import_kw")
+        return 1 - self._kwh("import_kw") / demand if demand > 0 else 0.0
+
+
+def _interval_midpoints(timestamps: np.ndarray, interval_hours: float) -> np.ndarray:
+    step = np.timedelta64(int(interval_hours * 1800), "s")
+    return timestamps.astype("datetime64[s]") + step
+
+
+def clear_sky_production(site: PvSite, timestamps: np.ndarray, interval_hours: float = 1.0) -> np.ndarray:
+    """
+    Average PV output (kW) of each interval starting at `timestamps` (local standard time), from the
+    solar position, a clear-sky irradiance model and the site's monthly clearness.
+    """
+    midpoints = _interval_midpoints(timestamps, interval_hours)
+    day_of_year = (midpoints.astype("datetime64[D]") - midpoints.astype("datetime64[Y]")).astype(np.int64) + 1
+    local_hour = (midpoints - midpoints.astype("datetime64[D]")).astype(np.int64) / 3600
+    month = midpoints.astype("datetime64[M]").astype(np.int64) % 12
+
+    # Solar declination and equation of time (Spencer, 1971)
+    b = 2 * np.pi * (day_of_year - 1) / 365
+    declination = (0.006918 - 0.399912 * np.cos(b) + 0.070257 * np.sin(b) - 0.006758 * np.cos(2 * b)
+                   + 0.000907 * np.sin(2 * b) - 0.002697 * np.cos(3 * b) + 0.00148 * np.sin(3 * b))
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * np.cos(b) - 0.032077 * np.sin(b)
+                                 - 0.014615 * np.cos(2 * b) - 0.040849 * np.sin(2 * b))
+    solar_time = local_hour + (4 * (site.longitude - 15 * site.utc_offset) + equation_of_time) / 60
+    hour_angle = np.radians(15 * (solar_time - 12))
+
+    latitude = np.radians(site.latitude)
+    tilt = np.radians(site.tilt)
+    azimuth = np.radians(site.azimuth)
+    sin_d, cos_d = np.sin(declination), np.cos(declination)
+    sin_l, cos_l = np.sin(latitude), np.cos(latitude)
+    cos_zenith = sin_l * sin_d + cos_l * cos_d * np.cos(hour_angle)
+    # Angle of incidence on the tilted module (Duffie & Beckman, eq. 1.6.2)
+    cos_incidence = (sin_d * sin_l * np.cos(tilt) - sin_d * cos_l * np.sin(tilt) * np.cos(azimuth)
+                     + cos_d * cos_l * np.cos(tilt) * np.cos(hour_angle)
+                     + cos_d * sin_l * np.sin(tilt) * np.cos(azimuth) * np.cos(hour_angle)
+                     + cos_d * np.sin(tilt) * np.sin(azimuth) * np.sin(hour_angle))
+
+    daylight = cos_zenith > 0.01
+    zenith_deg = np.degrees(np.arccos(np.clip(cos_zenith, 0.01, 1.0)))
+    air_mass = 1 / (np.clip(cos_zenith, 0.01, 1.0) + 0.50572 * (96.07995 - zenith_deg) ** -1.6364)
+    extraterrestrial = 1367 * (1 + 0.033 * np.cos(2 * np.pi * day_of_year / 365))
+    beam = np.where(daylight, extraterrestrial * 0.7 ** (air_mass ** 0.678), 0.0)  # Meinel & Meinel
+    diffuse = 0.1 * beam
+    global_horizontal = beam * np.clip(cos_zenith, 0.0, None) + diffuse
+    plane_of_array = (beam * np.clip(cos_incidence, 0.0, None)
+                      + diffuse * (1 + np.cos(tilt)) / 2
+                      + site.albedo * global_horizontal * (1 - np.cos(tilt)) / 2)
+
+    clearness = np.broadcast_to(np.asarray(site.clearness, dtype=np.float64), (12,))[month]
+    return site.peak_kw * plane_of_array / 1000 * clearness * (1 - site.system_losses / 100)
+
+
+def _parse_pvgis_time(values) -> np.ndarray:
+    return pd.to_datetime(pd.Series(values, dtype=str), format="%Y%m%d:%H%M").to_numpy()
+
+
+def read_pvgis_export(path: str):
+    """
+    Reads a PVGIS hourly export (CSV or JSON) as (UTC timestamps, PV output in kW).
+    """
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            hourly = json.load(f)["outputs"]["hourly"]
+        return _parse_pvgis_time([row["time"] for row in hourly]), np.array([row["P"] for row in hourly], dtype=np.float64) / 1000
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        lines = f.read().splitlines()
+    header = next((i for i, line in enumerate(lines) if line.startswith("time,")), None)
+    if header is None:
+        raise ValueError(f"{path} is not a PVGIS hourly export (no 'time,' header line).")
+    # The table ends at the first line that is not a data row (PVGIS appends a legend)
+    end = header + 1
+    while end < len(lines) and lines[end][:1].isdigit():
+        end += 1
+    table = pd.read_csv(path, skiprows=header, nrows=end - header - 1, encoding="utf-8", encoding_errors="replace")
+    if "P" not in table.columns:
+        raise ValueError(f"{path} has no PV output column 'P'.")
+    return _parse_pvgis_time(table["time"]), table["P"].to_numpy(dtype=np.float64) / 1000
+
+
+def pvgis_files() -> list:
+    if not os.path.isdir(pv_data_dir):
+        return []
+    return sorted(f for f in os.listdir(pv_data_dir) if f.lower().endswith((".csv", ".json")))
+
+
+def pvgis_production(path: str, timestamps: np.ndarray, utc_offset=1, scale=1.0) -> np.ndarray:
+    """
+    PV output (kW) of a PVGIS export for each of `timestamps` (local standard time). Every hour gets the
+    export's average for the same month, day and hour over all years it covers, so a 2005-2020 export
+    serves any price year; 29 February falls back to the 28th. `scale` resizes the exported system.
+    """
+    profile = load_profile_series(path, read_pvgis_export)
+    local = profile.timestamps + np.timedelta64(int(utc_offset * 60), "m")
+    production = map_typical_year(local, profile.values.astype(np.float64), timestamps)
+    return np.nan_to_num(production) * scale
+
+
+def pv_battery_dispatch(scenario: Scenario, pv_kw: np.ndarray, battery_capacity=0.0, efficiency=90, dod=80,
+                        storage_hours=4, curtail_negative_prices=True) -> PvDispatchResult:
+    """
+    PV serves the demand first; the surplus charges the battery and the rest is sold at the spot price
+    (curtailed when that price is negative). The battery discharges into the remaining demand, and the
+    grid covers what is left. Returns the per-interval split with import cost and export revenue.
+    """
+    dt = scenario.interval_hours()
+    price = scenario.prices_eur_mwh()
+    load_kw = scenario.demand_kwh.astype(np.float64) / dt
+    pv_kw = np.asarray(pv_kw, dtype=np.float64)
+
+    self_consumed = np.minimum(pv_kw, load_kw)
+    surplus = pv_kw - self_consumed
+    deficit = load_kw - self_consumed
+
+    eta = efficiency / 100
+    capacity_kwh = battery_capacity * 1000 * (dod / 100)
+    step_kwh = battery_capacity * 1000 / storage_hours * dt if storage_hours > 0 else 0.0
+    charge = np.zeros(len(load_kw))
+    discharge = np.zeros(len(load_kw))
+    soc = np.zeros(len(load_kw))
+    if capacity_kwh > 0 and step_kwh > 0 and eta > 0:
+        # The state of charge depends on the previous interval, so this is the one sequential pass,
+        # over plain Python floats
+        charged, discharged, levels = [], [], []
+        level = 0.0
+        for s, d in zip((surplus * dt).tolist(), (deficit * dt).tolist()):
+            c = min(s, step_kwh, (capacity_kwh - level) / eta)
+            level += c * eta
+            out = min(d, step_kwh, level)
+            level -= out
+            charged.append(c)
+            discharged.append(out)
+            levels.append(level)
+        charge[:] = charged
+        discharge[:] = discharged
+        soc[:] = levels
+
+    export = surplus - charge / dt
+    curtailed = np.where(curtail_negative_prices & (price < 0), export, 0.0)
+    export = export - curtailed
+    grid_import = deficit - discharge / dt
+
+    result = PvDispatchResult(len(load_kw), dt)
+    result.pv_kw[:] = pv_kw
+    result.self_consumed_kw[:] = self_consumed
+    result.battery_kw[:] = (discharge - charge) / dt
+    result.import_kw[:] = grid_import
+    result.export_kw[:] = export
+    result.curtailed_kw[:] = curtailed
+    result.soc_kwh[:] = soc
+    result.spot_only_cost = float(np.nansum(price * load_kw * dt / 1000))
+    result.import_cost = float(np.nansum(price * grid_import * dt / 1000))
+    result.export_revenue = float(np.nansum(price * export * dt / 1000))
+    return result
+
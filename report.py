@@ -0,0 +1,362 @@
+import argparse
+import base64
+import hashlib
+import html
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use("Agg")  # headless: no display on report servers
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+import numpy as np
+import pandas as pd
+
+from catalog import load_catalog
+from demand_profiles import demand_profile_names
+from engine import (default_battery_capacity_mwh, load_carbon_data,
+                    load_country_prices, simulate_scenario)
+from result_cache import ResultCache, shared_cache
+from scenario_params import normalize_scenario
+
+# Batch report export: one HTML and one PDF summary per scenario, generated headless and in parallel.
+#
+#   python report.py --countries Germany France Spain --years 2023 2024 --battery both --out reports
+#   python report.py --scenarios scenarios.json --out reports      (a JSON list in service.py's format)
+#
+# Charts are rendered once into .cache/charts and reused by every report (and every later run) that
+# shows the same data; the per-scenario numbers behind a report are cached in .cache/report_data.
+
+chart_cache_dir = os.path.join(".cache", "charts")
+report_data_cache = ResultCache(directory=os.path.join(".cache", "report_data"))
+
+month_order = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+summary_columns = ["Total Spot Cost (€)", "Total Cost with Battery (€)", "Total Hybrid Cost (€)",
+                   "LCOE (Spot) (€/MWh)", "LCOE (Battery) (€/MWh)", "LCOE (Hybrid) (€/MWh)",
+                   "Total CO2 Emissions (tonnes CO2eq)"]
+
+_worker_carbon_data = None
+
+
+def _init_worker():
+    global _worker_carbon_data
+    _worker_carbon_data = load_carbon_data()
+
+
+def scenario_report_data(params: dict, df_carbon_data) -> dict:
+    """
+    Totals, monthly cost breakdown and average daily battery profile of one scenario, cached on disk.
+    """
+    key = report_data_cache.key_for(params)
+    data = report_data_cache.get(key)
+    if data is not None:
+        return data
+
+    results, scenario, dispatch = simulate_scenario(df_carbon_data=df_carbon_data, **params)
+    data = {"results": results, "monthly": None, "battery_profile": None}
+    if dispatch is not None:
+        month_index = scenario.month.astype(np.int64) - 1
+        spot_cost = np.nan_to_num(scenario.prices_eur_mwh() * scenario.demand_mwh())
+        data["monthly"] = {
+            "month": month_order,
+            "spot_cost": np.bincount(month_index, weights=spot_cost, minlength=12).tolist(),
+            "hybrid_cost": np.bincount(month_index, weights=np.nan_to_num(dispatch.hybrid_cost), minlength=12).tolist(),
+        }
+        if params["use_battery"]:
+            hours = scenario.hours().astype(np.int64)
+            hours_seen = np.maximum(np.bincount(hours, minlength=24), 1)
+            charge = np.clip(dispatch.charge_discharge, 0, None)
+            data["battery_profile"] = {
+                "hour": list(range(24)),
+                "charge": (np.bincount(hours, weights=charge, minlength=24) / hours_seen).tolist(),
+                "discharge": (np.bincount(hours, weights=dispatch.battery_used_mwh, minlength=24) / hours_seen).tolist(),
+            }
+        # Totals agree with calculate_metrics, so let the dashboard and service reuse them
+        if not results.get("Error"):
+            shared_cache.put(shared_cache.key_for(params), results)
+    if not results.get("Error"):
+        report_data_cache.put(key, data)
+    return data
+
+
+def cached_chart(name: str, key: str, draw, figsize=(8, 3.2)) -> str:
+    """
+    Renders `draw(ax)` to a PNG the first time `name`/`key` is requested and returns its path.
+    """
+    path = os.path.join(chart_cache_dir, f"{name}_{key}.png")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(chart_cache_dir, exist_ok=True)
+    fig, ax = plt.subplots(figsize=figsize, dpi=110)
+    draw(ax)
+    fig.tight_layout()
+    # Other workers may render the same chart concurrently; the rename keeps the file whole
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp_path, format="png")
+    plt.close(fig)
+    os.replace(tmp_path, path)
+    return path
+
+
+def price_chart(country: str, year: str) -> str:
+    # Depends only on the price data, so it is shared by every demand and battery variant
+    version = load_catalog().version(country)
+    key = hashlib.sha1(f"{country}|{year}|{version}".encode("utf-8")).hexdigest()
+
+    def draw(ax):
+        price_df = load_country_prices(country, year)
+        ax.plot(price_df["timestamp"], price_df["price"], linewidth=0.4, color="#2c6e91")
+        ax.set_title(f"Hourly Spot Price Trend - {country} {year}")
+        ax.set_ylabel("€/MWh")
+
+    return cached_chart("prices", key, draw)
+
+
+def monthly_chart(key: str, monthly: dict) -> str:
+    def draw(ax):
+        positions = range(len(monthly["month"]))
+        ax.bar([p - 0.2 for p in positions], monthly["spot_cost"], width=0.4, label="Spot", color="#2c6e91")
+        ax.bar([p + 0.2 for p in positions], monthly["hybrid_cost"], width=0.4, label="Hybrid", color="#1f78b4", alpha=0.6)
+        ax.set_xticks(list(positions))
+        ax.set_xticklabels(monthly["month"])
+        ax.set_title("Monthly Energy Cost Breakdown")
+        ax.set_ylabel("Monthly Cost (€)")
+        ax.legend()
+
+    return cached_chart("monthly", key, draw)
+
+
+def battery_chart(key: str, profile: dict) -> str:
+    def draw(ax):
+        ax.bar(profile["hour"], profile["charge"], label="Battery Charge (MWh)", color="lightskyblue")
+        ax.bar(profile["hour"], [-d for d in profile["discharge"]], label="Battery Discharge (MWh)", color="indianred")
+        ax.set_title("Average Battery Charge/Discharge by Hour of Day")
+        ax.set_xlabel("Hour")
+        ax.set_ylabel("Energy (MWh)")
+        ax.legend()
+
+    return cached_chart("battery", key, draw)
+
+
+def scenario_slug(params: dict) -> str:
+    """
+    File name stem of a scenario's report: the main parameters for reading, plus a short hash of all of
+    them, so scenarios that differ only in e.g. PPA price or storage hours never share a file.
+    """
+    battery = f"battery{params['battery_capacity']:g}" if params["use_battery"] else "nobattery"
+    demand = "".join(c for c in params["demand_option"] if c.isalnum())
+    if params.get("annual_demand_mwh"):
+        demand += f"_{params['annual_demand_mwh']:g}MWhyr"
+    country = "".join(c for c in params["selected_country"].lower() if c.isalnum())
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:8]
+    return f"{country}_{params['selected_year']}_{demand}_{battery}_{digest}"
+
+
+def _format_value(value) -> str:
+    return "-" if value is None else f"{value:,.2f}"
+
+
+def _embed_png(path: str) -> str:
+    with open(path, "rb") as f:
+        return "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+def write_html(path: str, params: dict, data: dict, charts: list):
+    results = data["results"]
+    summary_rows = "".join(
+        f"<tr><th>{html.escape(col)}</th><td>{_format_value(results.get(col))}</td></tr>" for col in summary_columns
+    )
+    monthly_rows = ""
+    if data["monthly"]:
+        monthly = data["monthly"]
+        monthly_rows = "".join(
+            f"<tr><th>{m}</th><td>{_format_value(s)}</td><td>{_format_value(h)}</td></tr>"
+            for m, s, h in zip(monthly["month"], monthly["spot_cost"], monthly["hybrid_cost"])
+        )
+    battery_text = (f"{params['battery_capacity']:g} MWh, {params['storage_hours']} h, "
+                    f"{params['efficiency']}% efficiency, {params['dod']}% DoD"
+                    + (", no export" if params["no_export"] else "")) if params["use_battery"] else "none"
+    images = "".join(f"<img src='{_embed_png(chart)}' style='width: 100%; margin-top: 20px;'>" for chart in charts)
+    error = f"<p style='color: #b00020;'>{html.escape(results['Error'])}</p>" if results.get("Error") else ""
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Nitrocapt Energy Report - {html.escape(params['selected_country'])} {params['selected_year']}</title>
+<style>
+  body {{ font-family: sans-serif; max-width: 900px; margin: 30px auto; color: #222; }}
+  table {{ border-collapse: collapse; margin-top: 10px; }}
+  th, td {{ border: 1px solid #d0d0d0; padding: 6px 12px; text-align: right; }}
+  th {{ text-align: left; background-color: #f0f2f6; }}
+</style></head>
+<body>
+<h2>Nitrocapt Energy Optimization - {html.escape(params['selected_country'])} {params['selected_year']}</h2>
+<p>Demand: {html.escape(params['demand_option'])} &middot; Battery: {battery_text} &middot;
+PPA: {params['ppa_price_eur_mwh']:g} €/MWh, {params['hedge_volume']:g} MWh/day hedged</p>
+{error}
+<h4>Summary</h4>
+<table>{summary_rows}</table>
+<h4>Monthly Breakdown (€)</h4>
+<table><tr><th>Month</th><th>Spot</th><th>Hybrid</th></tr>{monthly_rows}</table>
+{images}
+</body></html>
+""")
+
+
+def write_pdf(path: str, params: dict, data: dict, charts: list):
+    results = data["results"]
+    with PdfPages(path) as pdf:
+        # Page 1: summary table and monthly table
+        fig = plt.figure(figsize=(8.27, 11.69))
+        fig.text(0.06, 0.95, f"Nitrocapt Energy Optimization - {params['selected_country']} {params['selected_year']}",
+                 fontsize=15, weight="bold")
+        battery_text = (f"{params['battery_capacity']:g} MWh / {params['storage_hours']} h"
+                        + (", no export" if params["no_export"] else "")) if params["use_battery"] else "none"
+        fig.text(0.06, 0.92, f"Demand: {params['demand_option']}   Battery: {battery_text}   "
+                             f"PPA: {params['ppa_price_eur_mwh']:g} €/MWh, {params['hedge_volume']:g} MWh/day", fontsize=9)
+        if results.get("Error"):
+            fig.text(0.06, 0.89, results["Error"], fontsize=9, color="#b00020")
+
+        ax_summary = fig.add_axes([0.06, 0.62, 0.88, 0.25])
+        ax_summary.axis("off")
+        ax_summary.table(cellText=[[col, _format_value(results.get(col))] for col in summary_columns],
+                         colLabels=["Metric", "Value"], loc="upper center", cellLoc="left")
+
+        if data["monthly"]:
+            monthly = data["monthly"]
+            ax_monthly = fig.add_axes([0.06, 0.08, 0.88, 0.5])
+            ax_monthly.axis("off")
+            ax_monthly.set_title("Monthly Breakdown (€)", loc="left")
+            ax_monthly.table(cellText=[[m, _format_value(s), _format_value(h)]
+                                       for m, s, h in zip(monthly["month"], monthly["spot_cost"], monthly["hybrid_cost"])],
+                             colLabels=["Month", "Spot", "Hybrid"], loc="upper center", cellLoc="right")
+        pdf.savefig(fig)
+        plt.close(fig)
+
+        # Page 2: the cached charts, stacked
+        if charts:
+            fig, axes = plt.subplots(len(charts), 1, figsize=(8.27, 11.69))
+            for ax, chart in zip(list(getattr(axes, "flat", [axes])), charts):
+                ax.imshow(plt.imread(chart))
+                ax.axis("off")
+            fig.tight_layout()
+            pdf.savefig(fig)
+            plt.close(fig)
+
+
+def build_report(params: dict, out_dir: str) -> dict:
+    """
+    Writes the HTML and PDF report of one scenario and returns its summary row.
+    """
+    data = scenario_report_data(params, _worker_carbon_data)
+    key = report_data_cache.key_for(params)
+
+    charts = []
+    if data["monthly"]:
+        charts.append(monthly_chart(key, data["monthly"]))
+    if data["battery_profile"]:
+        charts.append(battery_chart(key, data["battery_profile"]))
+    if load_catalog().price_files(params["selected_country"]) and not data["results"].get("Error"):
+        charts.append(price_chart(params["selected_country"], params["selected_year"]))
+
+    slug = scenario_slug(params)
+    for extension, write in (("html", write_html), ("pdf", write_pdf)):
+        # A reader of out_dir never sees a half-written report
+        path = os.path.join(out_dir, f"{slug}.{extension}")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        write(tmp_path, params, data, charts)
+        os.replace(tmp_path, path)
+    return dict(data["results"], Report=slug, Status="written")
+
+
+def build_reports(scenarios: list, out_dir: str, workers: int = None) -> pd.DataFrame:
+    """
+    Builds all reports across worker processes, plus index.html and summary.csv in `out_dir`.
+    A scenario whose report fails is listed with Status "failed" and its error; the others are still written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(build_report, params, out_dir): params for params in scenarios}
+        for future in as_completed(futures):
+            params = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                row = {"Country": params["selected_country"], "Year": params["selected_year"],
+                       "Demand Profile": params["demand_option"], "Error": f"Report failed: {e}",
+                       "Report": scenario_slug(params), "Status": "failed"}
+            rows.append(row)
+            print(f"[{len(rows)}/{len(scenarios)}] {row['Report']}" + (f" ({row['Error']})" if row.get("Error") else ""))
+
+    summary = pd.DataFrame(rows).sort_values("Report")
+    summary.to_csv(os.path.join(out_dir, "summary.csv"), index=False)
+
+    def index_row(row):
+        r = row["Report"]
+        if row["Status"] == "failed":
+            return f"<tr><td>{r}</td><td></td><td>{html.escape(row['Error'])}</td></tr>"
+        return (f"<tr><td><a href='{r}.html'>{r}</a></td><td><a href='{r}.pdf'>PDF</a></td>"
+                f"<td>{_format_value(row.get('LCOE (Hybrid) (€/MWh)'))}</td></tr>")
+
+    links = "".join(index_row(row) for row in summary.to_dict("records"))
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>Nitrocapt Energy Reports</title></head>"
+                f"<body style='font-family: sans-serif;'><h2>Nitrocapt Energy Reports</h2>"
+                f"<table><tr><th>Scenario</th><th></th><th>LCOE (Hybrid) (€/MWh)</th></tr>{links}</table></body></html>")
+    return summary
+
+
+def scenarios_from_args(args) -> list:
+    if args.scenarios:
+        with open(args.scenarios, encoding="utf-8") as f:
+            return [normalize_scenario(s) for s in json.load(f)]
+
+    battery_options = {"off": [False], "on": [True], "both": [False, True]}[args.battery]
+    scenarios = []
+    for country, year, demand, use_battery in itertools.product(args.countries, args.years, args.demands, battery_options):
+        scenarios.append(normalize_scenario({
+            "selected_country": country,
+            "selected_year": year,
+            "demand_option": demand,
+            "annual_demand_mwh": args.annual_demand,
+            "use_battery": use_battery,
+            "battery_capacity": default_battery_capacity_mwh.get(demand, 1.0) if use_battery else 0.0,
+            "storage_hours": args.storage_hours,
+            "ppa_price_eur_mwh": args.ppa_price,
+            "hedge_volume": args.hedge_volume,
+            "no_export": args.no_export,
+        }))
+    return scenarios
+
+
+def main():
+    catalog = load_catalog()
+    parser = argparse.ArgumentParser(description="Export per-scenario PDF/HTML summary reports.")
+    parser.add_argument("--scenarios", help="JSON file with a list of scenarios (service.py format)")
+    parser.add_argument("--countries", nargs="+", default=catalog.countries(), choices=catalog.countries())
+    parser.add_argument("--years", nargs="+", default=catalog.all_years()[-1:], choices=catalog.all_years())
+    parser.add_argument("--demands", nargs="+", default=["10 MWh"], choices=demand_profile_names(),
+                        help="Demand presets or profiles from data/")
+    parser.add_argument("--annual-demand", type=float, default=None, help="Scale the demand to this volume (MWh per year)")
+    parser.add_argument("--battery", choices=["off", "on", "both"], default="on")
+    parser.add_argument("--storage-hours", type=int, default=4)
+    parser.add_argument("--ppa-price", type=float, default=40.0)
+    parser.add_argument("--hedge-volume", type=float, default=6.0)
+    parser.add_argument("--no-export", action="store_true", help="Never discharge the battery beyond the hour's demand")
+    parser.add_argument("--out", default="reports")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    scenarios = scenarios_from_args(args)
+    start = time.perf_counter()
+    build_reports(scenarios, args.out, args.workers)
+    print(f"Wrote {len(scenarios)} reports to {args.out} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
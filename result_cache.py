@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from catalog import load_catalog
+from demand_profiles import profile_version
+from engine import calculate_metrics, co2_file_path
+
+# Scenario result cache shared between processes.
+# The dashboard, the HTTP service (service.py) and its worker processes all read and write the same
+# directory, so a scenario computed by any of them is served to the others without rerunning it.
+# Each process additionally keeps the most recent results in memory.
+
+cache_dir = os.path.join(".cache", "results")
+
+
+def _file_version(path: str) -> str:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class ResultCache:
+    """JSON results on disk keyed by a hash of the scenario parameters and the input data versions."""
+
+    def __init__(self, directory: str = cache_dir, max_memory_entries: int = 1024):
+        self.directory = directory
+        self._memory = OrderedDict()
+        self._max_memory_entries = max_memory_entries
+        self._lock = threading.Lock()
+
+    def key_for(self, params: dict) -> str:
+        # Replacing a price file, carbon.csv or a demand profile changes the key, so stale entries are never served
+        versioned = dict(params,
+                         _prices=load_catalog().version(params["selected_country"]),
+                         _carbon=_file_version(co2_file_path),
+                         _demand=profile_version(params["demand_option"]))
+        canonical = json.dumps(versioned, sort_keys=True, default=str)
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        try:
+            with open(os.path.join(self.directory, f"{key}.json"), encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.remember(key, result)
+        return result
+
+    def remember(self, key: str, result: dict):
+        """Stores `result` in this process's memory only."""
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, result: dict):
+        self.remember(key, result)
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then rename, so concurrent readers in other processes never see a partial file
+        path = os.path.join(self.directory, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, default=float)
+        os.replace(tmp_path, path)
+
+
+shared_cache = ResultCache()
+
+
+def calculate_metrics_cached(df_carbon_data=None, progress=None, cancel_event=None, cache=shared_cache, **params):
+    """
+    calculate_metrics through the shared result cache. `params` are calculate_metrics' scenario arguments.
+    Failed scenarios (those with an "Error") are not cached.
+    """
+    key = cache.key_for(params)
+    result = cache.get(key)
+    if result is not None:
+        if progress is not None:
+            progress(1.0)
+        return result
+
+    result = calculate_metrics(df_carbon_data=df_carbon_data, progress=progress, cancel_event=cancel_event, **params)
+    if not result.get("Error"):
+        cache.put(key, result)
+    return result
@@ -0,0 +1,129 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from price_store import compact_prices, day_keys, hour_keys, interval_hours, month_keys, widen_prices
+
+# Compact scenario representation.
+# A Scenario holds the aligned hourly inputs of one simulation run as flat numpy arrays: prices are
+# views into the shared price store where possible, demand is float32 and calendar keys are small
+# integers. Engine results go into a DispatchResult whose arrays are allocated once per run;
+# DataFrames are only built when a table has to be displayed.
+
+
+class Scenario:
+    """Aligned timestamps, prices (€/MWh) and demand (kWh) of one simulation run."""
+
+    __slots__ = ("timestamps", "price", "price_decimals", "demand_kwh", "day", "month", "_shared")
+
+    def __init__(self, timestamps, price, demand_kwh, day=None, month=None, price_decimals=None, shared=()):
+        self.timestamps = timestamps
+        self.price = price
+        self.price_decimals = price_decimals
+        self.demand_kwh = demand_kwh
+        self.day = day_keys(timestamps) if day is None else day
+        self.month = month_keys(timestamps) if month is None else month
+        # Names of the arrays that are views into shared storage and not owned by this scenario
+        self._shared = frozenset(shared)
+
+    @classmethod
+    def from_series(cls, series, year, demand_kwh, last_year=None):
+        """
+        One year (or `year` through `last_year`) of a shared PriceSeries. `demand_kwh` is a scalar
+        (flat profile) or an array aligned with that period.
+        """
+        year_range = series.year_slice(year, last_year)
+        n_hours = year_range.stop - year_range.start
+        if np.ndim(demand_kwh) == 0:
+            demand = np.full(n_hours, demand_kwh, dtype=np.float32)
+        else:
+            demand = np.asarray(demand_kwh, dtype=np.float32)
+        return cls(
+            series.timestamps[year_range], series.price[year_range], demand,
+            day=series.day[year_range], month=series.month[year_range],
+            price_decimals=series.decimals,
+            shared=("timestamps", "price", "day", "month")
+        )
+
+    @classmethod
+    def from_frames(cls, price_df: pd.DataFrame, demand_df: pd.DataFrame):
+        """
+        Custom uploads: joins a price frame (price or Grid_Price_EUR_per_MWh) and a demand frame (demand_kWh) on timestamp.
+        """
+        merged_df = pd.merge(price_df, demand_df, on="timestamp")
+        if "Grid_Price_EUR_per_MWh" in merged_df.columns:
+            prices = merged_df["Grid_Price_EUR_per_MWh"].to_numpy()
+        elif "price" in merged_df.columns:
+            prices = merged_df["price"].to_numpy()
+        else:
+            raise KeyError("Required price column not found in merged data.")
+        price, decimals = compact_prices(prices)
+        return cls(
+            merged_df["timestamp"].to_numpy().astype("datetime64[ns]"), price,
+            merged_df["demand_kWh"].to_numpy(dtype=np.float32), price_decimals=decimals
+        )
+
+    def __len__(self):
+        return len(self.price)
+
+    def prices_eur_mwh(self) -> np.ndarray:
+        """float64 prices for cost arithmetic."""
+        return widen_prices(self.price, self.price_decimals)
+
+    def demand_mwh(self) -> np.ndarray:
+        return self.demand_kwh.astype(np.float64) / 1000
+
+    def hours(self) -> np.ndarray:
+        return hour_keys(self.timestamps)
+
+    def interval_hours(self) -> float:
+        """Length of one interval in hours: 1.0 for hourly data, 0.25 for 15-minute data."""
+        return interval_hours(self.timestamps)
+
+    def fingerprint(self) -> str:
+        """Identifies the scenario's data, e.g. as part of a background job key."""
+        digest = hashlib.sha1()
+        for array in (self.timestamps, self.price, self.demand_kwh):
+            digest.update(np.ascontiguousarray(array).view(np.uint8))
+        return digest.hexdigest()
+
+    def owned_nbytes(self) -> int:
+        """Memory held by this scenario itself, excluding views into the shared price store."""
+        return sum(getattr(self, name).nbytes for name in ("timestamps", "price", "demand_kwh", "day", "month")
+                   if name not in self._shared)
+
+
+class DispatchResult:
+    """Hourly battery / PPA hedge / spot allocation of a scenario, in preallocated arrays."""
+
+    energy_columns = ("battery_used_mwh", "hedge_used_mwh", "spot_used_mwh", "charge_discharge")
+    cost_columns = ("hedge_settlement", "spot_cost", "hybrid_cost")
+
+    __slots__ = energy_columns + cost_columns
+
+    def __init__(self, n_hours: int):
+        for name in self.energy_columns:
+            setattr(self, name, np.zeros(n_hours, dtype=np.float32))
+        for name in self.cost_columns:
+            setattr(self, name, np.zeros(n_hours, dtype=np.float64))
+
+    @property
+    def total_hybrid_cost(self) -> float:
+        return float(np.nansum(self.hybrid_cost))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    def to_frame(self, scenario: Scenario) -> pd.DataFrame:
+        """The dispatch as the hourly table shown in the PPA tab."""
+        frame = pd.DataFrame({
+            "timestamp": scenario.timestamps,
+            "price": scenario.prices_eur_mwh(),
+            "demand_kWh": scenario.demand_kwh,
+        })
+        for name in self.__slots__:
+            frame[name] = getattr(self, name)
+        frame["date"] = frame["timestamp"].dt.date
+        return frame
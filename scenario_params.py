@@ -0,0 +1,52 @@
+# Scenario parameters as accepted by service.py and report.py: calculate_metrics' argument names, with
+# the dashboard defaults for anything left out.
+scenario_defaults = {
+    "selected_year": "2024",
+    "demand_option": "10 MWh",
+    "annual_demand_mwh": None,
+    "use_battery": False,
+    "battery_capacity": 0.0,
+    "efficiency": 90,
+    "dod": 80,
+    "storage_hours": 4,
+    "ppa_price_eur_mwh": 40.0,
+    "hedge_volume": 6.0,
+    "no_export": False,
+}
+
+
+def normalize_scenario(scenario: dict) -> dict:
+    """
+    Fills in defaults and coerces types, so equivalent requests map to the same cache key.
+    Raises ValueError for malformed scenarios.
+    """
+    if not isinstance(scenario, dict):
+        raise ValueError("A scenario must be a JSON object.")
+    unknown = set(scenario) - set(scenario_defaults) - {"selected_country"}
+    if unknown:
+        raise ValueError(f"Unknown scenario fields: {', '.join(sorted(unknown))}")
+    if not scenario.get("selected_country"):
+        raise ValueError("selected_country is required.")
+
+    params = dict(scenario_defaults, **scenario)
+    # bool("false") is True: only JSON booleans are accepted, so a scenario never runs with a battery it did not ask for
+    for flag in ("use_battery", "no_export"):
+        if not isinstance(params[flag], bool):
+            raise ValueError(f"{flag} must be true or false.")
+    try:
+        return {
+            "selected_country": str(params["selected_country"]),
+            "selected_year": str(int(params["selected_year"])),
+            "demand_option": str(params["demand_option"]),
+            "annual_demand_mwh": float(params["annual_demand_mwh"]) if params["annual_demand_mwh"] else None,
+            "use_battery": params["use_battery"],
+            "battery_capacity": float(params["battery_capacity"]),
+            "efficiency": int(params["efficiency"]),
+            "dod": int(params["dod"]),
+            "storage_hours": int(params["storage_hours"]),
+            "ppa_price_eur_mwh": float(params["ppa_price_eur_mwh"]),
+            "hedge_volume": float(params["hedge_volume"]),
+            "no_export": params["no_export"],
+        }
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid scenario value: {e}")
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from engine import load_carbon_data
+from prewarm import prewarm_status, start_prewarm, usage_stats
+from result_cache import calculate_metrics_cached, shared_cache
+from scenario_params import normalize_scenario
+
+# Local HTTP/JSON service around the simulation engine, for tools that need the dashboard's numbers
+# without the Streamlit UI.
+#
+#   python service.py --port 8502 --workers 4
+#
+#   GET  /health   -> {"status": "ok", "workers": 4, "inflight": 0, "prewarm": {"state": "finished", ...}}
+#   POST /metrics  -> one scenario in, one calculate_metrics result out
+#   POST /batch    -> {"scenarios": [...]} in, {"results": [...]} out (same order)
+#
+# A scenario uses calculate_metrics' argument names; anything left out takes the dashboard defaults
+# (scenario_params.normalize_scenario):
+#   {"selected_country": "Germany", "selected_year": "2023", "demand_option": "10 MWh", "use_battery": true}
+# demand_option is a preset or a demand profile from data/ (e.g. "Nitrocapt 2024"), optionally scaled
+# with "annual_demand_mwh".
+
+max_batch_size = 1000
+
+_worker_carbon_data = None
+
+
+def _init_worker():
+    global _worker_carbon_data
+    _worker_carbon_data = load_carbon_data()
+
+
+def _run_scenario(params: dict) -> dict:
+    return calculate_metrics_cached(df_carbon_data=_worker_carbon_data, **params)
+
+
+class SimulationService:
+    """
+    Runs scenarios on a process pool. Concurrent requests for the same scenario share one computation,
+    and finished results are served from the shared result cache. If a worker dies, the requests it was
+    serving fail and the pool is replaced, so later requests run again.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = self._new_pool()
+        self._inflight = {}  # cache key -> Future
+        self._lock = threading.Lock()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        # Called with the lock held. A pool that lost a worker refuses all further work, and every future
+        # it still had is failed, so none of them may be shared with new requests.
+        if self._pool is broken:
+            self._pool = self._new_pool()
+            self._inflight.clear()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, params: dict) -> Future:
+        key = shared_cache.key_for(params)
+        cached = shared_cache.get(key)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            try:
+                future = self._pool.submit(_run_scenario, params)
+            except BrokenProcessPool:
+                self._replace_pool(self._pool)
+                future = self._pool.submit(_run_scenario, params)
+            self._inflight[key] = future
+            pool = self._pool
+        # Outside the lock: the callback runs immediately if the worker has already finished
+        future.add_done_callback(lambda f, key=key, pool=pool: self._finished(key, f, pool))
+        return future
+
+    def _finished(self, key, future, pool):
+        with self._lock:
+            # After a pool replacement the key may already belong to a newer computation
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self._replace_pool(pool)
+                return
+        # The worker already wrote the result to disk; keep it in this process's memory too
+        if not future.cancelled() and future.exception() is None and not future.result().get("Error"):
+            shared_cache.remember(key, future.result())
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def run(self, params: dict) -> dict:
+        return self.submit(params).result()
+
+    def run_batch(self, scenarios: list) -> list:
+        # Submit everything first so the pool works on the whole batch at once
+        futures = [self.submit(params) for params in scenarios]
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        with self._lock:
+            pool = self._pool
+        pool.shutdown(cancel_futures=True)
+
+
+def record_usage(params: dict):
+    usage_stats.record(params["selected_country"], params["selected_year"], params["demand_option"])
+
+
+def prewarm_scenario(service: SimulationService, country: str, year: str, demand_option: str):
+    # Through the pool, so the result lands in the shared cache with the service defaults
+    service.run(normalize_scenario({"selected_country": country, "selected_year": year, "demand_option": demand_option}))
+
+
+class SimulationServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # socketserver's default backlog of 5 resets connections under a burst of concurrent clients
+    request_queue_size = 128
+
+
+def make_handler(service: SimulationService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload, default=float).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                return json.loads(self.rfile.read(length) or b"null")
+            except ValueError:
+                raise ValueError("Request body is not valid JSON.")
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "workers": service.workers, "inflight": service.inflight(),
+                                      "prewarm": prewarm_status.as_dict()})
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            try:
+                payload = self._read_json()
+                if self.path == "/metrics":
+                    params = normalize_scenario(payload)
+                    record_usage(params)
+                    self._send_json(200, service.run(params))
+                elif self.path == "/batch":
+                    scenarios = payload.get("scenarios") if isinstance(payload, dict) else None
+                    if not isinstance(scenarios, list):
+                        raise ValueError('Expected {"scenarios": [...]}.')
+                    if len(scenarios) > max_batch_size:
+                        raise ValueError(f"A batch holds at most {max_batch_size} scenarios.")
+                    batch = [normalize_scenario(s) for s in scenarios]
+                    for params in batch:
+                        record_usage(params)
+                    results = service.run_batch(batch)
+                    self._send_json(200, {"results": results})
+                else:
+                    self._send_json(404, {"error": f"Unknown path {self.path}"})
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+            except Exception as e:
+                self._send_json(500, {"error": f"Simulation failed: {e}"})
+
+        def log_message(self, format, *args):
+            # Keep the console quiet under load; errors are returned to the caller
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON service for the energy optimization engine.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    service = SimulationService(args.workers)
+    server = SimulationServer((args.host, args.port), make_handler(service))
+    # Warm the default and most requested scenarios while the server already accepts requests. The workers
+    # load their own prices, and the service has no use for the dashboard's market data.
+    start_prewarm(lambda country, year, demand_option: prewarm_scenario(service, country, year, demand_option),
+                  local_data=False)
+    print(f"Serving on http://{args.host}:{args.port} with {service.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
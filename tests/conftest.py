@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root and read data/ and .cache/ relative to the working directory
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    monkeypatch.chdir(root)
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+import analytics
+from analytics import CountryAnalytics, PriceAnalytics, duration_points, load_price_analytics
+
+
+def hourly(first, last):
+    return np.arange(np.datetime64(first), np.datetime64(last)).astype("datetime64[h]").astype("datetime64[ns]")
+
+
+def test_negative_runs_are_credited_to_the_year_they_start_in():
+    timestamps = hourly("2022-12-01T00", "2023-02-01T00")
+    prices = np.full(len(timestamps), 50.0)
+    start_2022 = np.searchsorted(timestamps, np.datetime64("2022-12-31T20", "ns"))
+    prices[start_2022:start_2022 + 10] = -5.0  # 4 hours in 2022, 6 in 2023
+    start_2023 = np.searchsorted(timestamps, np.datetime64("2023-01-15T11", "ns"))
+    prices[start_2023:start_2023 + 3] = -1.0
+    prices[start_2023 + 5] = 0.0  # zero is not negative
+
+    result = CountryAnalytics.from_prices("Testland", timestamps, prices)
+    np.testing.assert_array_equal(result.years, [2022, 2023])
+    np.testing.assert_array_equal(result.longest_negative_run, [10, 3])
+    assert result.negative_hours.sum() == 13
+    assert result.negative_by_hour[0].sum() == 4 and result.negative_by_hour[1].sum() == 9
+    np.testing.assert_array_equal(result.negative_by_hour[1, 11:14], [1, 1, 1])
+
+
+def test_duration_curve_and_daily_statistics():
+    timestamps = hourly("2023-01-01T00", "2024-01-01T00")
+    hour = np.arange(len(timestamps)) % 24
+    prices = hour * 10.0 - 50.0  # every day from -50 to 180
+    result = CountryAnalytics.from_prices("Testland", timestamps, prices)
+
+    curve = result.duration[0]
+    assert len(curve) == duration_points
+    assert curve[0] == 180.0 and curve[-1] == -50.0
+    assert np.all(np.diff(curve) <= 0)
+    assert curve[50] == pytest.approx(65.0)
+    np.testing.assert_allclose(result.day_max - result.day_min, 230.0)
+    assert np.all(result.negative_hours == 5)
+    # The same day repeats, so the rolling volatility is the standard deviation of one day
+    expected = np.std(prices[:24])
+    assert np.isnan(result.volatility[:14]).all()
+    np.testing.assert_allclose(result.volatility[14:], expected)
+
+
+def test_sub_hourly_prices_are_averaged_per_hour():
+    timestamps = np.arange(np.datetime64("2023-03-01T00:00"), np.datetime64("2023-03-02T00:00"),
+                           np.timedelta64(15, "m")).astype("datetime64[ns]")
+    prices = np.tile([-10.0, -10.0, 10.0, 30.0], 24)  # hourly average 5
+    result = CountryAnalytics.from_prices("Testland", timestamps, prices)
+    assert result.negative_hours[0] == 0
+    assert result.day_sum[0] == pytest.approx(24 * 5.0)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    timestamps = hourly("2023-01-01T00", "2023-01-10T00")
+    original = CountryAnalytics.from_prices("Testland", timestamps, np.sin(np.arange(len(timestamps))) * 40)
+    path = str(tmp_path / "testland.npz")
+    original.save(path)
+    loaded = CountryAnalytics.load("Testland", path)
+    np.testing.assert_array_equal(loaded.days, original.days)
+    for name in CountryAnalytics.daily_fields + CountryAnalytics.yearly_fields:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(original, name))
+
+
+def test_summary_matches_price_matrix():
+    from price_matrix import load_price_matrix
+    price_analytics = load_price_analytics()
+    summary = price_analytics.summary(2023)
+    stats = load_price_matrix().stats(2023).loc[summary.index]
+    np.testing.assert_array_equal(summary["Negative Price Hours"], stats["Negative Price Hours"])
+    np.testing.assert_allclose(summary["Mean Price (€/MWh)"], stats["Mean Price (€/MWh)"], rtol=1e-6)
+
+
+def test_failing_country_is_skipped(tmp_path, monkeypatch):
+    compute = CountryAnalytics.compute.__func__
+
+    def failing(cls, country):
+        if country == "Germany":
+            raise ValueError("broken file")
+        return compute(cls, country)
+
+    load_price_analytics()
+    # Every other country is already in memory; Germany has nothing stored in the new directory
+    monkeypatch.setattr(CountryAnalytics, "compute", classmethod(failing))
+    monkeypatch.setattr(analytics, "_analytics", None)
+    monkeypatch.setattr(analytics, "_countries", {k: v for k, v in analytics._countries.items() if k != "Germany"})
+    price_analytics = load_price_analytics(str(tmp_path / "analytics"))
+    assert isinstance(price_analytics, PriceAnalytics)
+    assert price_analytics.errors == {"Germany": "broken file"}
+    assert "Germany" not in price_analytics.countries and "France" in price_analytics.countries
+    assert "Germany" not in price_analytics.summary(2023).index
@@ -0,0 +1,50 @@
+import threading
+
+import numpy as np
+import pytest
+
+from backtest import backtest_country, forecasters
+from engine import ScenarioCancelled, battery_arbitrage_savings, build_scenario
+
+
+def test_cancelled_backtest_stops():
+    cancel_event = threading.Event()
+    cancel_event.set()
+    with pytest.raises(ScenarioCancelled):
+        backtest_country("Germany", cancel_event=cancel_event)
+
+
+def test_cancel_between_forecasts():
+    cancel_event = threading.Event()
+    seen = []
+
+    def progress(fraction):
+        seen.append(fraction)
+        if len(seen) == 2:
+            cancel_event.set()
+
+    with pytest.raises(ScenarioCancelled):
+        backtest_country("Germany", progress=progress, cancel_event=cancel_event)
+    assert len(seen) == 2
+
+
+@pytest.mark.parametrize("name", list(forecasters))
+def test_forecasts_use_earlier_days_only(name):
+    rng = np.random.default_rng(0)
+    prices = 50 + 20 * rng.standard_normal((400, 24))
+    days = np.datetime64("2022-01-01") + np.arange(400).astype("timedelta64[D]")
+    forecast = forecasters[name](prices, days)
+    changed = prices.copy()
+    changed[300:] += 1000.0
+    # Day 300 and later may change; nothing before it may
+    np.testing.assert_array_equal(forecasters[name](changed, days)[:300], forecast[:300])
+    assert np.isnan(forecast[0]).all()
+
+
+def test_perfect_foresight_matches_battery_arbitrage_savings():
+    results = backtest_country("Germany", battery_capacity=13.89, efficiency=90, dod=80, storage_hours=4,
+                               forecast_names=["Persistence"])
+    year = results[results["Year"] == "2023"].iloc[0]
+    assert year["Days"] == 365
+    expected = battery_arbitrage_savings(build_scenario("Germany", "2023", "10 MWh"), 13.89, 90, 80, 4)
+    assert year["Perfect Foresight Value (€)"] == pytest.approx(expected, rel=1e-12, abs=1e-6)
@@ -0,0 +1,53 @@
+import threading
+
+import catalog
+
+
+def test_stamp_checked_at_most_once_per_interval(monkeypatch):
+    catalog.load_catalog(refresh=True)
+    scans = []
+    discover = catalog._discover
+    monkeypatch.setattr(catalog, "_discover", lambda: scans.append(1) or discover())
+    now = [catalog._state[2]]
+    monkeypatch.setattr(catalog.time, "monotonic", lambda: now[0])
+
+    first = catalog.load_catalog()
+    now[0] += catalog.catalog_check_seconds / 2
+    assert catalog.load_catalog() is first
+    assert scans == []
+
+    now[0] += catalog.catalog_check_seconds
+    assert catalog.load_catalog() is first  # nothing changed on disk
+    assert scans == [1]
+    assert catalog.load_catalog(refresh=True) is first
+    assert scans == [1, 1]
+
+
+def test_covered_years_are_strings():
+    data = catalog.load_catalog()
+    for country in data.countries():
+        assert data.years(country) == sorted(data.years(country))
+        assert all(isinstance(year, str) for year in data.years(country))
+
+
+def test_concurrent_first_load(monkeypatch):
+    monkeypatch.setattr(catalog, "_state", None)
+    barrier = threading.Barrier(8)
+    results, errors = [], []
+
+    def load():
+        barrier.wait()
+        try:
+            for _ in range(50):
+                results.append(catalog.load_catalog())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    # Every thread that found no catalog yet waits for the first build instead of building its own
+    assert len({id(result) for result in results}) == 1
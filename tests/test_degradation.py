@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from degradation import cycles_to_failure, cycle_life, cycle_life_dod, degradation_economics, rainflow_closed
+from engine import battery_arbitrage_savings, build_scenario
+
+# ASTM E1049-85 (X2.4) load history; it ends where it starts, so it is a closed profile. Counted from its
+# maximum (5, -1, 3, -4, 4, -2, 1, -3, 5) it contains four full cycles and no residue.
+astm_history = [-2, 1, -3, 5, -1, 3, -4, 4, -2]
+
+
+def cycles(profiles):
+    rows, ranges, counts = rainflow_closed(np.asarray(profiles, dtype=np.float64))
+    return sorted(zip(rows.tolist(), ranges.tolist(), counts.tolist()))
+
+
+def test_astm_history():
+    assert cycles([astm_history]) == [(0, 3.0, 1.0), (0, 4.0, 1.0), (0, 7.0, 1.0), (0, 9.0, 1.0)]
+
+
+def test_rows_are_counted_independently():
+    profiles = [
+        astm_history,
+        [0, 1, 1, 1, 0, 0, 0, 0, 0],  # one cycle, repeated levels
+        [0, 1, 0.5, 1, 0, 0, 0, 0, 0],  # a small cycle inside a large one
+        [0.2] * 9,  # idle
+    ]
+    assert cycles(profiles) == [(0, 3.0, 1.0), (0, 4.0, 1.0), (0, 7.0, 1.0), (0, 9.0, 1.0),
+                                (1, 1.0, 1.0), (2, 0.5, 1.0), (2, 1.0, 1.0)]
+
+
+def test_rotation_does_not_change_the_cycles():
+    rotated = astm_history[3:-1] + astm_history[:4]
+    assert [c[1:] for c in cycles([rotated])] == [c[1:] for c in cycles([astm_history])]
+
+
+def test_cycle_life_curve():
+    assert cycles_to_failure(np.array([cycle_life_dod]))[0] == pytest.approx(cycle_life)
+    assert cycles_to_failure(np.array([cycle_life_dod / 2]))[0] > 2 * cycle_life
+
+
+def test_first_year_matches_battery_arbitrage_savings():
+    result = degradation_economics("Germany", "2023", 13.89, efficiency=90, dod=80, storage_hours=4, years=3)
+    expected = battery_arbitrage_savings(build_scenario("Germany", "2023", "10 MWh"), 13.89, 90, 80, 4)
+    assert result.soh_start[0] == 1.0
+    assert result.savings[0] == pytest.approx(expected, rel=1e-12, abs=1e-6)
+    assert result.savings_without_ageing[0] == pytest.approx(expected, rel=1e-12, abs=1e-6)
+    # Ageing only ever shrinks the later years
+    assert np.all(np.diff(result.soh_start) < 0)
+    assert np.all(result.savings[1:] < result.savings_without_ageing[1:])
+
+
+def test_replacement_restores_health():
+    result = degradation_economics("Germany", "2023", 13.89, years=25)
+    replaced = np.flatnonzero(result.replacement_cost > 0)
+    assert len(replaced) > 0
+    assert np.all(result.soh_end[replaced] < 0.8)
+    assert np.all(result.soh_start[replaced + 1] == 1.0)
+
+
+def test_no_battery_or_year():
+    assert degradation_economics("Germany", "2023", 0.0) is None
+    assert degradation_economics("Germany", "1990", 13.89) is None
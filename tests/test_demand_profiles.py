@@ -0,0 +1,29 @@
+import gc
+
+import numpy as np
+
+from demand_profiles import demand_kwh_for, demand_profile_names, load_demand_profile, register_upload
+
+upload = b"timestamp,demand_kWh\n" + b"".join(f"2024-01-01 {h:02d}:00,{100 + h}\n".encode() for h in range(24))
+
+
+def test_uploads_are_listed_only_for_their_session():
+    mine, theirs = {}, {}
+    name = register_upload("site_demand.csv", upload, mine)
+    assert name.startswith("Site (upload ")
+    assert name in demand_profile_names(mine)
+    assert name not in demand_profile_names(theirs)
+    assert name not in demand_profile_names()
+
+    # The engine finds it by name while the session holds it
+    timestamps = np.arange(np.datetime64("2023-01-01T00"), np.datetime64("2023-01-02T00")).astype("datetime64[ns]")
+    np.testing.assert_array_equal(demand_kwh_for(name, timestamps), np.arange(100, 124))
+
+
+def test_uploads_are_released_with_their_session():
+    session = {}
+    name = register_upload("other.csv", upload.replace(b",1", b",2"), session)
+    assert load_demand_profile(name) is not None
+    del session
+    gc.collect()
+    assert load_demand_profile(name) is None
@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+import pytest
+
+from engine import calculate_metrics, load_carbon_data
+
+
+def per_day_loop_metrics(country, year, demand_kwh, use_battery, battery_capacity, efficiency, dod, storage_hours,
+                         ppa_price_eur_mwh, hedge_volume):
+    """The dashboard's original pandas implementation, row by row, as the reference for the vectorized engine."""
+    price_df = pd.read_csv(os.path.join("data", "europe_prices", f"{country.lower()}_15_24.csv"))
+    price_df["timestamp"] = pd.to_datetime(price_df["timestamp"])
+    merged_df = price_df[price_df["timestamp"].dt.year == int(year)].copy()
+    merged_df["demand_kWh"] = demand_kwh
+
+    total_cost_base = (merged_df["price"] / 1000 * merged_df["demand_kWh"]).sum()
+    results = {"Total Spot Cost (€)": total_cost_base}
+
+    if use_battery:
+        merged_df["date"] = merged_df["timestamp"].dt.date
+        savings = 0.0
+        power = battery_capacity / storage_hours
+        for _, group in merged_df.groupby("date"):
+            sorted_group = group.sort_values(by="price")
+            charge_cost = (sorted_group.head(storage_hours)["price"] * power).sum()
+            discharge_value = (sorted_group.tail(storage_hours)["price"] * power * (efficiency / 100) * (dod / 100)).sum()
+            savings += discharge_value - charge_cost
+        results["Total Cost with Battery (€)"] = total_cost_base - savings
+
+        total_hybrid_cost = 0.0
+        usable_capacity = battery_capacity * (efficiency / 100) * (dod / 100)
+        for _, group in merged_df.groupby("date"):
+            discharge_hours = group.sort_values("price", ascending=False).head(storage_hours).index
+            for idx in group.index:
+                demand_mwh = group.at[idx, "demand_kWh"] / 1000
+                battery_available = min(power, usable_capacity / storage_hours) if idx in discharge_hours else 0.0
+                remaining = demand_mwh - battery_available
+                hedge_used = min(remaining, hedge_volume / 24)
+                spot_used = max(0.0, remaining - hedge_used)
+                total_hybrid_cost += group.at[idx, "price"] * spot_used + ppa_price_eur_mwh * hedge_used
+    else:
+        total_hybrid_cost = 0.0
+        for idx in merged_df.index:
+            demand_mwh = merged_df.at[idx, "demand_kWh"] / 1000
+            hedge_used = min(demand_mwh, hedge_volume / 24)
+            total_hybrid_cost += merged_df.at[idx, "price"] * max(0.0, demand_mwh - hedge_used) + ppa_price_eur_mwh * hedge_used
+    results["Total Hybrid Cost (€)"] = total_hybrid_cost
+    return results
+
+
+@pytest.mark.parametrize("country, year, demand_option, demand_kwh, use_battery, battery_capacity", [
+    ("Germany", "2023", "10 MWh", 10000, True, 13.89),
+    ("France", "2022", "5 MWh", 5000, False, 0.0),
+])
+def test_matches_per_day_loop(country, year, demand_option, demand_kwh, use_battery, battery_capacity):
+    params = dict(use_battery=use_battery, battery_capacity=battery_capacity, efficiency=90, dod=80, storage_hours=4,
+                  ppa_price_eur_mwh=40.0, hedge_volume=6.0)
+    expected = per_day_loop_metrics(country, year, demand_kwh, **params)
+    results = calculate_metrics(country, year, demand_option, df_carbon_data=load_carbon_data(), **params)
+    assert "Error" not in results
+    for column, value in expected.items():
+        assert results[column] == pytest.approx(value, rel=1e-9), column
+
+
+def test_no_export_caps_discharge_at_demand():
+    # The battery's hourly discharge (5 MWh at 100% efficiency and DoD) far exceeds the 0.6 MWh demand
+    params = dict(use_battery=True, battery_capacity=5.0, efficiency=100, dod=100, storage_hours=1,
+                  ppa_price_eur_mwh=40.0, hedge_volume=6.0, df_carbon_data=None)
+    netted = calculate_metrics("France", "2022", "600 kWh", **params)
+    capped = calculate_metrics("France", "2022", "600 kWh", no_export=True, **params)
+
+    # By default the excess is netted against the hedge, as in the per-day loop
+    expected = per_day_loop_metrics("France", "2022", 600, **{k: v for k, v in params.items() if k != "df_carbon_data"})
+    assert netted["Total Hybrid Cost (€)"] == pytest.approx(expected["Total Hybrid Cost (€)"], rel=1e-9)
+    assert netted["Total Hybrid Cost (€)"] == pytest.approx(818096.03, abs=0.01)
+    assert netted["LCOE (Hybrid) (€/MWh)"] == pytest.approx(155.65, abs=0.005)
+    assert capped["Total Hybrid Cost (€)"] == pytest.approx(882336.03, abs=0.01)
+    assert capped["LCOE (Hybrid) (€/MWh)"] == pytest.approx(167.87, abs=0.005)
+    # Spot and battery arbitrage costs do not depend on the option
+    for column in ("Total Spot Cost (€)", "Total Cost with Battery (€)"):
+        assert capped[column] == netted[column]
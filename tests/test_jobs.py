@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from engine import ScenarioCancelled
+from jobs import JobRunner
+
+
+def wait_done(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not job.done():
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+
+
+def test_identical_jobs_are_shared():
+    runner = JobRunner(max_workers=1)
+    first = runner.submit("key", "a", lambda progress, cancel_event: 42)
+    second = runner.submit("key", "b", lambda progress, cancel_event: 0)
+    assert first is second
+    wait_done(first)
+    assert first.result() == 42
+
+
+def test_failed_job_is_retried():
+    runner = JobRunner(max_workers=1)
+    attempts = []
+
+    def flaky(progress, cancel_event):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+        return "ok"
+
+    failed = runner.submit("key", "a", flaky)
+    wait_done(failed)
+    assert isinstance(failed.error(), RuntimeError)
+    retried = runner.submit("key", "a", flaky)
+    assert retried is not failed
+    wait_done(retried)
+    assert retried.result() == "ok"
+
+
+def test_cancelled_key_can_be_submitted_again():
+    runner = JobRunner(max_workers=1)
+    started = threading.Event()
+
+    def slow(progress, cancel_event):
+        started.set()
+        while not cancel_event.wait(0.01):
+            pass
+        raise ScenarioCancelled()
+
+    job = runner.submit("key", "a", slow)
+    started.wait(5)
+    runner.release("key", "a")
+    wait_done(job)
+    with pytest.raises(ScenarioCancelled):
+        job.result()
+
+    again = runner.submit("key", "a", lambda progress, cancel_event: "again")
+    assert again is not job
+    wait_done(again)
+    assert again.result() == "again"
+
+
+def test_unseen_waiter_is_released():
+    runner = JobRunner(max_workers=2, waiter_ttl=0.05)
+    job = runner.submit("key", "closed-session", lambda progress, cancel_event: cancel_event.wait(5))
+    time.sleep(0.1)
+    runner.touch("other-session")
+    wait_done(job)
+    assert job.cancelled()
+
+
+def test_release_waiter_cancels_only_orphaned_jobs():
+    runner = JobRunner(max_workers=2)
+    shared = runner.submit("shared", "a", lambda progress, cancel_event: cancel_event.wait(0.5))
+    runner.submit("shared", "b", lambda progress, cancel_event: None)
+    own = runner.submit("own", "a", lambda progress, cancel_event: cancel_event.wait(5))
+    runner.release_waiter("a")
+    assert own.cancelled()
+    assert not shared.cancelled()
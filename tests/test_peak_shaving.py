@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from engine import peak_shaving_dispatch
+from scenario import Scenario
+
+# January and February 2023: a flat 500 kW load with one spike at noon every day
+base_kw = 500.0
+spike_kw = {1: 2500.0, 2: 1200.0}
+
+
+def spiky_scenario(minutes=60):
+    timestamps = np.arange(np.datetime64("2023-01-01T00:00"), np.datetime64("2023-03-01T00:00"),
+                           np.timedelta64(minutes, "m")).astype("datetime64[ns]")
+    hours = timestamps.astype("datetime64[h]")
+    hour_of_day = (hours - timestamps.astype("datetime64[D]")).astype(np.int64)
+    month = timestamps.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    load_kw = np.where(hour_of_day == 12, np.vectorize(spike_kw.get)(month), base_kw)
+    price = 50.0 + 30.0 * np.sin(hour_of_day / 24 * 2 * np.pi)
+    return Scenario(timestamps, price, (load_kw * minutes / 60).astype(np.float32))
+
+
+def expected_thresholds(power_kw, eta):
+    # January is limited by the battery power; in February the spike must be recharged in the 11 hours after it:
+    # (spike - T) = eta * 11 * (T - base)
+    february = (spike_kw[2] + eta * 11 * base_kw) / (1 + eta * 11)
+    return np.array([spike_kw[1] - power_kw, february])
+
+
+@pytest.mark.parametrize("minutes", [60, 15])
+def test_monthly_thresholds_match_closed_form(minutes):
+    # 1 MWh at full depth over one hour: 1000 kW of power
+    result = peak_shaving_dispatch(spiky_scenario(minutes), 1.0, 90, 100, 1, 10.0, with_arbitrage=False)
+    np.testing.assert_allclose(result.peak_before_kw, [2500.0, 1200.0])
+    np.testing.assert_allclose(result.peak_after_kw, expected_thresholds(1000.0, 0.9), atol=1e-3)
+    assert result.demand_charge_savings == pytest.approx((result.peak_before_kw - result.peak_after_kw).sum() * 10.0)
+
+
+def test_energy_balance_and_arbitrage_within_threshold():
+    scenario = spiky_scenario()
+    load_kw = scenario.demand_kwh.astype(np.float64)
+    shaved = peak_shaving_dispatch(scenario, 1.0, 90, 100, 1, 10.0, with_arbitrage=False)
+    stacked = peak_shaving_dispatch(scenario, 1.0, 90, 100, 1, 10.0, with_arbitrage=True)
+    for result in (shaved, stacked):
+        np.testing.assert_allclose(result.net_load_kw, load_kw - result.battery_kw, atol=1e-2)
+    # The arbitrage never charges above the month's threshold
+    np.testing.assert_allclose(stacked.peak_after_kw, shaved.peak_after_kw, atol=1e-3)
+    assert stacked.arbitrage_savings >= 0
+
+
+def test_without_battery_nothing_changes():
+    result = peak_shaving_dispatch(spiky_scenario(), 0.0, 90, 100, 1, 10.0)
+    np.testing.assert_array_equal(result.peak_after_kw, result.peak_before_kw)
+    assert result.total_savings == 0
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from engine import calculate_metrics, load_carbon_data
+from portfolio import PpaContract, Site, portfolio_dispatch
+
+year = "2023"
+
+
+def test_single_site_matches_calculate_metrics():
+    carbon = load_carbon_data()
+    site = Site("Plant", "Germany", "10 MWh", battery_capacity=13.89, efficiency=90, dod=80, storage_hours=4)
+    portfolio = portfolio_dispatch([site], [PpaContract("PPA", 40.0, 6.0)], year, carbon)
+    expected = calculate_metrics("Germany", year, "10 MWh", True, 13.89, 90, 80, 4, 40.0, 6.0, carbon, no_export=True)
+    frame = portfolio.site_frame()
+    for column in ("Total Spot Cost (€)", "Total Cost with Battery (€)", "Total Hybrid Cost (€)",
+                   "LCOE (Hybrid) (€/MWh)", "Total CO2 Emissions (tonnes CO2eq)"):
+        assert frame.loc["Plant", column] == pytest.approx(expected[column], rel=1e-9), column
+
+
+def test_shared_ppa_allocation_totals():
+    sites = [Site("A", "Germany", "10 MWh", battery_capacity=13.89), Site("B", "France", "5 MWh"),
+             Site("C", "Spain", "600 kWh")]
+    contracts = [PpaContract("Cheap", 30.0, 100.0, sites=["A", "B"]), PpaContract("Rest", 60.0, 1e6)]
+    portfolio = portfolio_dispatch(sites, contracts, year)
+    ppa = portfolio.ppa_mwh.astype(np.float64)
+
+    # Every hour each site's demand is met exactly once by battery, PPAs and spot
+    supplied = portfolio.battery_mwh + ppa.sum(axis=0) + portfolio.spot_mwh
+    np.testing.assert_allclose(supplied, portfolio.demand_mwh, atol=1e-4)
+    # The first PPA delivers at most its hourly volume, and only to its own sites
+    assert (ppa[0].sum(axis=0) <= 100.0 / 24 + 1e-4).all()
+    assert ppa[0, 2].sum() == 0
+    # The second has unlimited volume, so nothing is left for the spot market
+    assert portfolio.spot_mwh.sum() == pytest.approx(0.0, abs=1e-3)
+    frame = portfolio.contract_frame()
+    np.testing.assert_allclose(frame["Delivered (MWh)"], ppa.sum(axis=(1, 2)), rtol=1e-6)
+    np.testing.assert_allclose(frame["Cost (€)"], ppa.sum(axis=(1, 2)) * [30.0, 60.0], rtol=1e-6)
+    months = portfolio.monthly_frame()
+    assert months[["Battery (MWh)", "PPA (MWh)", "Spot (MWh)"]].to_numpy().sum() == pytest.approx(
+        portfolio.total_demand_mwh.sum(), rel=1e-6)
+
+
+def test_invalid_portfolios():
+    with pytest.raises(ValueError):
+        portfolio_dispatch([], [], year)
+    with pytest.raises(ValueError):
+        portfolio_dispatch([Site("A", "Germany"), Site("A", "France")], [], year)
+    with pytest.raises(ValueError):
+        portfolio_dispatch([Site("A", "Germany")], [PpaContract("PPA", 40.0, 6.0, sites=["Z"])], year)
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import price_matrix
+from price_matrix import PriceMatrix, build_price_matrix
+
+
+def matrix_from(prices: np.ndarray, start: str) -> PriceMatrix:
+    prices = np.asarray(prices, dtype=np.float32)
+    return PriceMatrix([f"C{i}" for i in range(len(prices))], np.datetime64(start, "h"), prices, ~np.isnan(prices))
+
+
+def test_build_aligns_countries_and_averages_sub_hourly_prices(tmp_path, monkeypatch):
+    hourly = np.arange(np.datetime64("2023-01-01T05"), np.datetime64("2023-01-03T00")).astype("datetime64[ns]")
+    quarter_hourly = np.arange(np.datetime64("2023-01-01T08:00"), np.datetime64("2023-01-01T10:00"),
+                               np.timedelta64(15, "m")).astype("datetime64[ns]")
+    series = {
+        "Early": SimpleNamespace(timestamps=hourly, price=np.arange(len(hourly), dtype=np.float32)),
+        "Late": SimpleNamespace(timestamps=quarter_hourly, price=np.array([10, 20, 30, np.nan, 1, 2, 3, 4], dtype=np.float32)),
+    }
+    monkeypatch.setattr(price_matrix, "load_price_series", series.get)
+    monkeypatch.setattr(price_matrix, "_file_versions", lambda countries: {})
+    build_price_matrix(["Early", "Late"], str(tmp_path))
+
+    prices = np.load(tmp_path / "prices.npy")
+    covered = np.load(tmp_path / "covered.npy")
+    assert prices.shape == (2, len(hourly))
+    np.testing.assert_array_equal(prices[0], np.arange(len(hourly)))
+    # 08:00 is hour 3 of the axis; its NaN quarter is left out of the average
+    np.testing.assert_array_equal(prices[1, 3:5], [20.0, 2.5])
+    assert covered[1].sum() == 2 and np.isnan(prices[1, ~covered[1]]).all()
+
+
+def test_daily_view_starts_at_midnight():
+    # The axis starts at 22:00, so the first whole day starts two columns in
+    hours = np.arange(2 + 48 + 5)
+    prices = np.where(hours < 2, 1000.0, (hours - 2) % 24)[None, :]
+    matrix = matrix_from(prices, "2023-01-01T22")
+    daily = matrix._daily(slice(0, matrix.n_hours))
+    assert daily.shape == (1, 2, 24)
+    np.testing.assert_array_equal(daily[0, :, 0], [0.0, 0.0])
+    assert matrix.mean_daily_spread(2023).iloc[0] == 23.0
+    assert matrix.arbitrage_value(2023, storage_hours=2, efficiency=1.0).iloc[0] == 2 * ((23 + 22) - (0 + 1))
+
+
+def test_days_with_gaps_and_countries_without_data():
+    hours = np.arange(72)
+    with_gap = np.where(hours % 24 < 12, 10.0, 40.0)
+    with_gap[30] = np.nan  # second day incomplete
+    prices = np.vstack([with_gap, np.full(72, np.nan)])
+    matrix = matrix_from(prices, "2024-03-01T00")
+    spreads = matrix.mean_daily_spread(2024)
+    assert spreads.iloc[0] == 30.0
+    assert np.isnan(spreads.iloc[1])
+    assert matrix.arbitrage_value(2024, storage_hours=1, efficiency=1.0).iloc[0] == 2 * 30.0
+    assert matrix.stats(2024)["Coverage (%)"].tolist() == pytest.approx([71 / 72 * 100, 0.0])
+
+
+def test_mean_abs_spread_matches_pairwise_differences():
+    rng = np.random.default_rng(1)
+    prices = 50 + 30 * rng.standard_normal((4, 24 * 40))
+    prices[1, 100:130] = np.nan
+    prices[3] = np.nan
+    matrix = matrix_from(prices, "2022-05-01T00")
+    spread = matrix.mean_abs_spread(2022)
+
+    block = matrix.prices.astype(np.float64)
+    for i in range(3):
+        for j in range(3):
+            both = ~np.isnan(block[i]) & ~np.isnan(block[j])
+            assert spread.iloc[i, j] == pytest.approx(np.abs(block[i, both] - block[j, both]).mean(), rel=1e-12)
+    np.testing.assert_array_equal(np.diag(spread.to_numpy()[:3, :3]), 0.0)
+    assert spread.iloc[3].isna().all() and spread.iloc[:, 3].isna().all()
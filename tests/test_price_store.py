@@ -0,0 +1,27 @@
+import threading
+
+import numpy as np
+
+import price_store
+from catalog import load_catalog
+
+
+def test_loading_one_country_does_not_wait_for_another():
+    first, second = load_catalog().countries()[:2]
+    price_store._series.pop(second.lower(), None)
+    loaded = []
+    # As if prewarm were still parsing the first country
+    with price_store._lock_for(("prices", first.lower())):
+        thread = threading.Thread(target=lambda: loaded.append(price_store.load_price_series(second)))
+        thread.start()
+        thread.join(timeout=60)
+    assert loaded and loaded[0].country == second
+
+
+def test_daily_grid_averages_sub_hourly_values_and_keeps_gaps():
+    timestamps = np.array(["2023-01-01T00:00", "2023-01-01T00:30", "2023-01-02T23:00"], dtype="datetime64[ns]")
+    grid, days = price_store.daily_grid(timestamps, np.array([10.0, 20.0, 5.0]))
+    assert grid.shape == (2, 24)
+    assert grid[0, 0] == 15.0 and grid[1, 23] == 5.0
+    assert np.isnan(grid).sum() == 46
+    np.testing.assert_array_equal(days, np.array(["2023-01-01", "2023-01-02"], dtype="datetime64[D]"))
@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pytest
+
+from pv import PvSite, clear_sky_production, pv_battery_dispatch, pvgis_production, read_pvgis_export
+from scenario import Scenario
+
+
+def pvgis_rows(year=2020):
+    """Two days of a PVGIS hourly export (UTC, minute 10) with P in W: 100 W times the hour of day."""
+    rows = []
+    for day in (1, 2):
+        for hour in range(24):
+            rows.append((f"{year}01{day:02d}:{hour:02d}10", 100.0 * hour))
+    return rows
+
+
+def write_csv(path, rows):
+    lines = ["Latitude (decimal degrees):\t50.000", "Radiation database:\tPVGIS-SARAH2", "",
+             "time,P,G(i),H_sun,T2m,WS10m,Int"]
+    lines += [f"{time},{p},0.0,0.0,0.0,0.0,0.0" for time, p in rows]
+    lines += ["", "P: PV system power (W)", "PVGIS (c) European Union, 2001-2023"]
+    path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def test_csv_and_json_exports_agree(tmp_path):
+    rows = pvgis_rows()
+    csv_path = tmp_path / "site.csv"
+    json_path = tmp_path / "site.json"
+    write_csv(csv_path, rows)
+    json_path.write_text(json.dumps({"outputs": {"hourly": [{"time": t, "P": p} for t, p in rows]}}), encoding="utf-8")
+
+    csv_times, csv_kw = read_pvgis_export(str(csv_path))
+    json_times, json_kw = read_pvgis_export(str(json_path))
+    assert len(csv_kw) == 48
+    np.testing.assert_array_equal(csv_times, json_times)
+    np.testing.assert_allclose(csv_kw, json_kw)
+    np.testing.assert_allclose(csv_kw[:24], np.arange(24) * 0.1)
+
+
+def test_not_a_pvgis_export(tmp_path):
+    path = tmp_path / "other.csv"
+    path.write_text("timestamp,value\n2020-01-01,1\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        read_pvgis_export(str(path))
+
+
+def test_export_is_mapped_to_local_time_of_any_year(tmp_path):
+    path = tmp_path / "site.csv"
+    write_csv(path, pvgis_rows(2020))
+    timestamps = np.arange(np.datetime64("2023-01-01T00"), np.datetime64("2023-01-03T00")).astype("datetime64[ns]")
+    production = pvgis_production(str(path), timestamps, utc_offset=1, scale=2.0)
+    # Local hour h is UTC hour h - 1; the first local hour of the export's first day has no data
+    expected = np.r_[0.0, np.arange(23) * 0.1, 2.3, np.arange(23) * 0.1] * 2.0
+    np.testing.assert_allclose(production, expected)
+
+
+@pytest.mark.parametrize("curtail", [True, False])
+def test_dispatch_energy_balance(curtail):
+    timestamps = np.arange(np.datetime64("2023-06-01T00"), np.datetime64("2023-06-15T00")).astype("datetime64[ns]")
+    hour = (timestamps.astype("datetime64[h]") - timestamps.astype("datetime64[D]")).astype(np.int64)
+    price = 60.0 - 80.0 * np.exp(-((hour - 13) / 2.0) ** 2)  # negative around midday
+    scenario = Scenario(timestamps, price, np.full(len(timestamps), 400.0, dtype=np.float32))
+    pv_kw = clear_sky_production(PvSite(50.0, 10.0, peak_kw=1500.0), timestamps)
+
+    result = pv_battery_dispatch(scenario, pv_kw, battery_capacity=1.0, efficiency=90, dod=80, storage_hours=2,
+                                 curtail_negative_prices=curtail)
+    charge_kw = np.clip(-result.battery_kw, 0.0, None)
+    discharge_kw = np.clip(result.battery_kw, 0.0, None)
+    np.testing.assert_allclose(result.self_consumed_kw + charge_kw + result.export_kw + result.curtailed_kw, pv_kw, atol=1e-3)
+    np.testing.assert_allclose(result.self_consumed_kw + discharge_kw + result.import_kw, 400.0, atol=1e-3)
+    stored = np.cumsum(charge_kw.astype(np.float64) * 0.9 - discharge_kw)
+    np.testing.assert_allclose(result.soc_kwh, stored, atol=5e-2)
+    assert result.soc_kwh.max() <= 800.0 + 1e-3
+    assert (result.curtailed_kw.sum() > 0) == curtail
+    if curtail:
+        assert np.all(result.export_kw[price < 0] == 0)
@@ -0,0 +1,49 @@
+import pandas as pd
+
+import report
+from report import build_reports, scenario_slug
+from scenario_params import normalize_scenario
+
+
+def scenario(**overrides):
+    return normalize_scenario(dict({"selected_country": "Germany", "selected_year": 2023}, **overrides))
+
+
+def test_slug_covers_every_parameter():
+    base = scenario(use_battery=True, battery_capacity=13.89)
+    variants = [base, scenario(use_battery=True, battery_capacity=13.89, ppa_price_eur_mwh=55.0),
+                scenario(use_battery=True, battery_capacity=13.89, storage_hours=2),
+                scenario(use_battery=True, battery_capacity=13.89, efficiency=85),
+                scenario(use_battery=True, battery_capacity=13.89, hedge_volume=3.0),
+                scenario(use_battery=True, battery_capacity=13.89, dod=90)]
+    slugs = [scenario_slug(params) for params in variants]
+    assert len(set(slugs)) == len(slugs)
+    assert scenario_slug(dict(base)) == slugs[0]
+    assert slugs[0].startswith("germany_2023_10MWh_battery13.89_")
+
+
+def test_summary_and_failed_scenario(tmp_path, monkeypatch):
+    write_pdf = report.write_pdf
+
+    def failing_write_pdf(path, params, data, charts):
+        if params["ppa_price_eur_mwh"] == 99.0:
+            raise OSError("disk full")
+        write_pdf(path, params, data, charts)
+
+    # Worker processes are forked, so they see the patched writer
+    monkeypatch.setattr(report, "write_pdf", failing_write_pdf)
+    scenarios = [scenario(), scenario(ppa_price_eur_mwh=55.0), scenario(ppa_price_eur_mwh=99.0)]
+    build_reports(scenarios, str(tmp_path), workers=1)
+
+    summary = pd.read_csv(tmp_path / "summary.csv").set_index("Report")
+    assert len(summary) == 3
+    failed = summary.loc[scenario_slug(scenarios[2])]
+    assert failed["Status"] == "failed"
+    assert "disk full" in failed["Error"]
+    for params in scenarios[:2]:
+        slug = scenario_slug(params)
+        assert summary.loc[slug, "Status"] == "written"
+        assert (tmp_path / f"{slug}.html").exists() and (tmp_path / f"{slug}.pdf").exists()
+    assert not (tmp_path / f"{scenario_slug(scenarios[2])}.pdf").exists()
+    assert not list(tmp_path.glob("*.tmp"))
+    assert "disk full" in (tmp_path / "index.html").read_text(encoding="utf-8")
@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from http.client import HTTPConnection
+
+import pytest
+
+import service as service_module
+from result_cache import ResultCache
+from scenario_params import normalize_scenario
+from service import SimulationServer, SimulationService, make_handler
+from service import _run_scenario as run_scenario
+
+
+def test_defaults_and_types():
+    params = normalize_scenario({"selected_country": "Germany", "selected_year": 2023, "efficiency": "85"})
+    assert params["selected_year"] == "2023"
+    assert params["efficiency"] == 85
+    assert params["use_battery"] is False
+    assert params == normalize_scenario(dict(params))
+
+
+@pytest.mark.parametrize("flag", ["use_battery", "no_export"])
+@pytest.mark.parametrize("value", ["false", "true", "0", "1", 0, 1, None])
+def test_flags_must_be_booleans(flag, value):
+    with pytest.raises(ValueError, match=flag):
+        normalize_scenario({"selected_country": "Germany", flag: value})
+
+
+@pytest.mark.parametrize("scenario", [{}, {"selected_country": "Germany", "colour": "red"}, ["Germany"]])
+def test_malformed_scenarios(scenario):
+    with pytest.raises(ValueError):
+        normalize_scenario(scenario)
+
+
+class RecordingService:
+    workers = 1
+
+    def __init__(self):
+        self.runs = []
+
+    def inflight(self):
+        return 0
+
+    def run(self, params):
+        self.runs.append(params)
+        return {"ok": True}
+
+
+def test_string_boolean_is_rejected_with_400():
+    service = RecordingService()
+    server = SimulationServer(("127.0.0.1", 0), make_handler(service))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = HTTPConnection(*server.server_address, timeout=5)
+        connection.request("POST", "/metrics", body=json.dumps({"selected_country": "Germany", "use_battery": "false"}))
+        response = connection.getresponse()
+        assert response.status == 400
+        assert "use_battery" in json.loads(response.read())["error"]
+        assert service.runs == []
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def fresh_cache(tmp_path, monkeypatch):
+    # The service's own lookups start empty, so every request reaches the pool
+    cache = ResultCache(directory=str(tmp_path))
+    monkeypatch.setattr(service_module, "shared_cache", cache)
+    return cache
+
+
+class PendingPool:
+    """Stands in for the process pool: records submissions and leaves them for the test to finish."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, params):
+        future = Future()
+        self.submitted.append((params, future))
+        return future
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+def test_concurrent_requests_share_one_computation(fresh_cache):
+    service = SimulationService(1)
+    service._pool.shutdown()
+    service._pool = pool = PendingPool()
+    params = normalize_scenario({"selected_country": "Germany", "selected_year": 2023})
+
+    first, second = service.submit(params), service.submit(dict(params))
+    assert first is second
+    assert len(pool.submitted) == 1 and service.inflight() == 1
+
+    first.set_result({"Total Spot Cost (€)": 1.0})
+    assert service.inflight() == 0
+    # Finished results are answered from the cache without another computation
+    assert service.run(params) == {"Total Spot Cost (€)": 1.0}
+    assert len(pool.submitted) == 1
+
+
+def crash_on_ppa_99(params):
+    if params["ppa_price_eur_mwh"] == 99.0:
+        os._exit(1)
+    return run_scenario(params)
+
+
+def test_pool_is_replaced_after_a_worker_dies(fresh_cache, monkeypatch):
+    monkeypatch.setattr(service_module, "_run_scenario", crash_on_ppa_99)
+    service = SimulationService(1)
+    try:
+        crashing = normalize_scenario({"selected_country": "Germany", "selected_year": 2023, "ppa_price_eur_mwh": 99})
+        with pytest.raises(BrokenProcessPool):
+            service.run(crashing)
+        result = service.run(normalize_scenario({"selected_country": "Germany", "selected_year": 2023}))
+        assert result["Total Spot Cost (€)"] > 0
+        assert service.inflight() == 0
+    finally:
+        service.shutdown()
+
+
+class BatchService(RecordingService):
+    def run_batch(self, scenarios):
+        self.runs.extend(scenarios)
+        return [{"Country": params["selected_country"]} for params in scenarios]
+
+
+def post_json(server, path, payload):
+    connection = HTTPConnection(*server.server_address, timeout=5)
+    connection.request("POST", path, body=json.dumps(payload))
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_batch_keeps_order_and_limits_size(monkeypatch):
+    monkeypatch.setattr(service_module, "record_usage", lambda params: None)
+    monkeypatch.setattr(service_module, "max_batch_size", 3)
+    service = BatchService()
+    server = SimulationServer(("127.0.0.1", 0), make_handler(service))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        countries = ["Spain", "Germany", "France"]
+        status, payload = post_json(server, "/batch", {"scenarios": [{"selected_country": c} for c in countries]})
+        assert status == 200
+        assert [row["Country"] for row in payload["results"]] == countries
+        assert service.runs == [normalize_scenario({"selected_country": c}) for c in countries]
+
+        status, payload = post_json(server, "/batch", {"scenarios": [{"selected_country": "Spain"}] * 4})
+        assert status == 400 and "at most 3" in payload["error"]
+        status, payload = post_json(server, "/batch", [{"selected_country": "Spain"}])
+        assert status == 400
+        assert len(service.runs) == 3
+    finally:
+        server.shutdown()
+        server.server_close()